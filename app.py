@@ -1,11 +1,89 @@
-from flask import Flask
+from flask import Flask, Response, jsonify, request, send_file
+import hmac
 import os
+import threading
 
-# Your core modules can be imported directly
-# from core.decision_engine import some_function
+from config import settings
+from core import metrics
+
+PRODUCT_CATALOG_PATH = "data/Product Catalog.csv"
+PDF_TEMPLATE_PATH = "sales_order_form_full.pdf"
+OUTPUT_FOLDER = "output"
 
 app = Flask(__name__)
 
+_catalog_service = None
+_alias_store = None
+_order_service = None
+_order_service_lock = threading.Lock()
+
+
+def get_order_service():
+    """Loads the catalog and starts the background workers on first use. Returns None if the catalog is missing."""
+    global _catalog_service, _alias_store, _order_service
+    with _order_service_lock:
+        if _order_service is None:
+            # The pipeline (pandas, the catalog index, PyMuPDF) is imported with the first order,
+            # so the service starts and answers /health without loading it
+            from core.catalog_service import CatalogService
+            from core.order_service import OrderService
+            from core.order_store import OrderStore
+            from core.alias_store import AliasStore
+            from core.duplicate_detector import DuplicateDetector
+            from core.order_revalidator import OrderRevalidator
+            from core.stock_ledger import StockLedger
+            try:
+                _catalog_service = CatalogService(PRODUCT_CATALOG_PATH, watch_interval=settings.CATALOG_WATCH_INTERVAL,
+                                                  snapshot_dir=settings.CATALOG_SNAPSHOT_DIR)
+            except FileNotFoundError:
+                return None
+            if settings.ALIAS_STORE_PATH:
+                _alias_store = AliasStore(settings.ALIAS_STORE_PATH)
+                _catalog_service.add_listener(_alias_store.expire)
+            order_store = OrderStore(settings.ORDER_STORE_PATH) if settings.ORDER_STORE_PATH else None
+            stock_ledger = StockLedger(settings.STOCK_LEDGER_PATH) if settings.STOCK_LEDGER_PATH else None
+            if stock_ledger is not None:
+                # Holds are consumed as the catalog's stock is decremented for them
+                _catalog_service.add_listener(stock_ledger.on_catalog_change)
+            if order_store is not None:
+                # Stored orders waiting on restocks or catalog fixes are re-validated as deltas arrive
+                revalidator = OrderRevalidator(order_store, _catalog_service.index, template_path=PDF_TEMPLATE_PATH,
+                                               alias_store=_alias_store, stock_ledger=stock_ledger)
+                _catalog_service.add_listener(revalidator.on_catalog_change)
+            _order_service = OrderService(
+                _catalog_service.index, settings.JOB_QUEUE_PATH,
+                template_path=PDF_TEMPLATE_PATH, output_folder=OUTPUT_FOLDER,
+                workers=settings.ORDER_API_WORKERS,
+                max_queue_depth=settings.ORDER_API_MAX_QUEUE_DEPTH,
+                poll_seconds=settings.ORDER_API_POLL_SECONDS,
+                batch_size=settings.LLM_BATCH_SIZE,
+                stock_ledger=stock_ledger,
+                lease_seconds=settings.JOB_LEASE_SECONDS,
+                max_attempts=settings.JOB_MAX_ATTEMPTS,
+                order_store=order_store,
+                alias_store=_alias_store,
+                duplicate_detector=DuplicateDetector(
+                    settings.DUPLICATE_INDEX_PATH, threshold=settings.DUPLICATE_THRESHOLD,
+                    window_seconds=settings.DUPLICATE_WINDOW_SECONDS, max_entries=settings.DUPLICATE_MAX_ENTRIES
+                ) if settings.DUPLICATE_INDEX_PATH else None
+            )
+        return _order_service
+
+
+def _submit(email_bodies):
+    """Queues the emails. Returns (job_ids, None), or (None, error response) on backpressure."""
+    service = get_order_service()
+    if service is None:
+        return None, (jsonify(error="Order service unavailable: product catalog could not be loaded."), 503)
+    from core.order_service import QueueFullError
+    try:
+        return service.submit_many(email_bodies), None
+    except QueueFullError as e:
+        response = jsonify(error=str(e))
+        response.headers["Retry-After"] = "5"
+        return None, (response, 429)
+
+
 @app.route('/')
 def hello():
     return "Smart Order Intake Web Service (V2.0) is running!"
@@ -15,6 +93,130 @@ def health_check():
     # Render uses this to check if your service is alive
     return "OK", 200
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Pipeline counters and stage timings in the Prometheus text format."""
+    body = metrics.render_prometheus()
+    if _order_service is not None:
+        body += f"# TYPE order_queue_depth gauge\norder_queue_depth {_order_service.depth}\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+def _unauthorized():
+    """Returns an error response unless the request carries the ADMIN_API_TOKEN as a bearer token."""
+    if not settings.ADMIN_API_TOKEN:
+        return jsonify(error="This endpoint is disabled (ADMIN_API_TOKEN is not set)."), 403
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.ADMIN_API_TOKEN.encode()):
+        return jsonify(error="Missing or invalid bearer token."), 401
+    return None
+
+@app.route('/orders', methods=['POST'])
+def submit_order():
+    """Accepts one email, as JSON {"email_body": "..."} or a plain-text body."""
+    payload = request.get_json(silent=True)
+    email_body = payload.get("email_body") if isinstance(payload, dict) else request.get_data(as_text=True)
+    if not email_body or not str(email_body).strip():
+        return jsonify(error="Request must contain an email body."), 400
+    job_ids, error = _submit([str(email_body)])
+    if error:
+        return error
+    return jsonify(job_id=job_ids[0], status_url=f"/orders/{job_ids[0]}"), 202
+
+@app.route('/orders/batch', methods=['POST'])
+def submit_order_batch():
+    """Accepts several emails as JSON {"email_bodies": ["...", ...]}."""
+    payload = request.get_json(silent=True)
+    email_bodies = payload.get("email_bodies") if isinstance(payload, dict) else None
+    if not isinstance(email_bodies, list) or not email_bodies or not all(isinstance(b, str) and b.strip() for b in email_bodies):
+        return jsonify(error="Request must contain a non-empty 'email_bodies' list of strings."), 400
+    job_ids, error = _submit(email_bodies)
+    if error:
+        return error
+    return jsonify(job_ids=job_ids, status_urls=[f"/orders/{job_id}" for job_id in job_ids]), 202
+
+@app.route('/orders/<int:job_id>')
+def order_status(job_id):
+    service = get_order_service()
+    if service is None:
+        return jsonify(error="Order service unavailable: product catalog could not be loaded."), 503
+    job = service.status(job_id)
+    if job is None:
+        return jsonify(error=f"No order job {job_id}."), 404
+    return jsonify(job), 200
+
+@app.route('/orders/<int:job_id>/pdf')
+def order_pdf(job_id):
+    service = get_order_service()
+    if service is None:
+        return jsonify(error="Order service unavailable: product catalog could not be loaded."), 503
+    job = service.status(job_id)
+    if job is None:
+        return jsonify(error=f"No order job {job_id}."), 404
+    if not job["pdf_path"] or not os.path.exists(job["pdf_path"]):
+        return jsonify(error=f"PDF for order job {job_id} is not ready.", status=job["status"]), 409
+    return send_file(os.path.abspath(job["pdf_path"]), mimetype="application/pdf")
+
+@app.route('/orders/<int:job_id>/reject', methods=['POST'])
+def reject_order(job_id):
+    """Reviewer rejection of an order: it is marked REJECTED and the stock it held is released."""
+    error = _unauthorized()
+    if error:
+        return error
+    service = get_order_service()
+    if service is None:
+        return jsonify(error="Order service unavailable: product catalog could not be loaded."), 503
+    released = service.reject(job_id)
+    if released is None:
+        return jsonify(error=f"No order job {job_id}."), 404
+    return jsonify(job_id=job_id, status="REJECTED", reservations_released=released), 200
+
+@app.route('/catalog/deltas', methods=['POST'])
+def apply_catalog_deltas():
+    """
+    Delta feed for stock and price changes, as JSON {"deltas": [{"Product_Code": "...", "Available_in_Stock": 12}, ...]}.
+    Changes apply to the live catalog in place and are written to the catalog CSV, so the other
+    workers and later runs see them; stored orders waiting on the changed products are re-validated.
+    """
+    error = _unauthorized()
+    if error:
+        return error
+    payload = request.get_json(silent=True)
+    deltas = payload.get("deltas") if isinstance(payload, dict) else None
+    if not isinstance(deltas, list) or not all(isinstance(d, dict) and d.get("Product_Code") for d in deltas):
+        return jsonify(error="Request must contain a 'deltas' list of objects with a Product_Code."), 400
+    if get_order_service() is None:
+        return jsonify(error="Order service unavailable: product catalog could not be loaded."), 503
+    try:
+        changes = _catalog_service.publish_deltas(deltas)
+    except (TypeError, ValueError) as e:
+        return jsonify(error=f"Invalid delta: {e}"), 400
+    return jsonify(applied=len(changes)), 200
+
+@app.route('/aliases', methods=['POST'])
+def resolve_alias():
+    """
+    Reviewer resolution of an ambiguous or unmatched request, as JSON
+    {"requested_name": "Coffee STRÅDAL", "product_code": "DSK-0002", "customer": "Acme"}
+    (without "customer" the alias applies to every customer). Later orders use it directly.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not payload.get("requested_name") or not payload.get("product_code"):
+        return jsonify(error="Request must contain a 'requested_name' and a 'product_code'."), 400
+    if get_order_service() is None:
+        return jsonify(error="Order service unavailable: product catalog could not be loaded."), 503
+    if _alias_store is None:
+        return jsonify(error="Product aliases are disabled (ALIAS_STORE_PATH is empty)."), 409
+    index = _catalog_service.index
+    with index.lock.reading():
+        row = index.row_of(payload["product_code"])
+        product = None if row is None else index.record(row)
+    if product is None:
+        return jsonify(error=f"Unknown product code '{payload['product_code']}'."), 404
+    _alias_store.resolve(str(payload["requested_name"]), product.Product_Code, product.Product_Name,
+                         customer=payload.get("customer"))
+    return jsonify(requested_name=payload["requested_name"], product_code=product.Product_Code,
+                   product_name=product.Product_Name, customer=payload.get("customer")), 201
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
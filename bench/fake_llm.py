@@ -0,0 +1,95 @@
+"""
+A local stand-in for the Gemini model, for exercising the pipeline without API calls.
+
+FakeGenerativeModel mimics the small part of genai.GenerativeModel the extractor uses
+(start_chat -> send_message / send_message_async -> candidates[0].content.parts[0].function_call)
+and can inject latency and transient errors. Batch messages (emails wrapped in <email id="N">
+tags) are answered with one email_id-tagged function call per email.
+"""
+import asyncio
+import random
+import re
+import time
+from types import SimpleNamespace
+
+
+class ServiceUnavailable(Exception):
+    """Named like google.api_core's 503 error so it is treated as transient."""
+
+
+class ResourceExhausted(Exception):
+    """Named like google.api_core's 429 error so it is treated as transient."""
+
+
+def simple_order_responder(email_body: str) -> dict:
+    """Builds a plausible 'log_sales_order' payload from '<qty> x <product>' lines."""
+    products = [
+        {"product_name": name.strip(), "quantity": int(qty)}
+        for qty, name in re.findall(r'^\s*[-*]?\s*(\d+)\s*x\s+(.+?)\s*$', email_body, flags=re.MULTILINE)
+    ]
+    lines = [line.strip() for line in email_body.strip().splitlines() if line.strip()]
+    return {
+        "customer_name": lines[-1] if lines else "Unknown Customer",
+        "delivery_address": "",
+        "products": products,
+    }
+
+
+BATCH_EMAIL_PATTERN = re.compile(r'<email id="([^"]*)">\n(.*?)\n</email>', flags=re.DOTALL)
+
+
+def _response_for(message, responder):
+    batch = BATCH_EMAIL_PATTERN.findall(message)
+    if batch:
+        calls = [{"email_id": email_id, **responder(email_body)} for email_id, email_body in batch]
+    else:
+        calls = [responder(message)]
+    parts = [SimpleNamespace(function_call=SimpleNamespace(name="log_sales_order", args=args)) for args in calls]
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
+
+
+class FakeChat:
+    def __init__(self, fake_model):
+        self.fake_model = fake_model
+
+    def send_message(self, email_body):
+        time.sleep(self.fake_model.next_latency())
+        self.fake_model.maybe_fail()
+        return _response_for(email_body, self.fake_model.responder)
+
+    async def send_message_async(self, email_body):
+        await asyncio.sleep(self.fake_model.next_latency())
+        self.fake_model.maybe_fail()
+        return _response_for(email_body, self.fake_model.responder)
+
+
+class FakeGenerativeModel:
+    """
+    Args:
+        latency (float or (min, max)): seconds each call takes.
+        error_rate (float): probability that a call raises a transient error.
+        responder (callable): email_body -> order dict returned as the function call args.
+        seed (int): makes the injected latency and errors reproducible.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, responder=simple_order_responder, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.responder = responder
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+
+    def start_chat(self, history=None):
+        return FakeChat(self)
+
+    def next_latency(self):
+        self.calls += 1
+        if isinstance(self.latency, (tuple, list)):
+            return self._random.uniform(*self.latency)
+        return self.latency
+
+    def maybe_fail(self):
+        if self._random.random() < self.error_rate:
+            self.failures += 1
+            raise self._random.choice([ServiceUnavailable, ResourceExhausted])("Injected transient error")
@@ -0,0 +1,253 @@
+"""
+Benchmarks each pipeline stage on synthetic data and writes the results as JSON.
+
+    python -m bench.run_benchmarks --skus 1000 10000 100000 --emails 200
+
+For every catalog size it reports p50/p95/p99 latency, throughput and peak memory
+of: building the catalog index, compiling and opening a catalog snapshot, find_product_matches (indexed, repeat requests
+answered by learned aliases and, for small catalogs, the linear scan), extraction with a stubbed LLM (per email and batched),
+near-duplicate email checks (new emails and forwarded copies), process_and_validate_order,
+re-validating the stored orders waiting on one SKU,
+find_consolidation_opportunities (DataFrame scan and AddressIndex),
+create_sales_order_json and fill_sales_order_pdf. Latency is measured without
+tracemalloc; peak memory comes from a second, smaller pass with tracemalloc on.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from bench.synthetic import generate_catalog, generate_emails, generate_shipments
+from config import settings
+from core.address_index import AddressIndex
+from core.alias_store import AliasStore
+from core.duplicate_detector import DuplicateDetector
+from core.catalog_snapshot import open_snapshot
+from core.consolidation_checker import find_consolidation_opportunities
+from core.decision_engine import process_and_validate_order
+from bench.fake_llm import FakeGenerativeModel
+from core.inventory_manager import build_catalog_index, find_product_matches
+from core.llm_extractor import extract_order_details_from_email, extract_order_details_from_emails
+from core.order_revalidator import OrderRevalidator
+from core.order_store import OrderStore, waiting_items
+from core.output_generator import build_sales_order, create_sales_order_json
+from core.pdf_writer import fill_sales_order_pdf
+
+PDF_TEMPLATE_PATH = "sales_order_form_full.pdf"
+LINEAR_SCAN_MAX_SKUS = 10000 # The DataFrame scan is only benchmarked up to this catalog size
+
+
+def _summarize(stage, latencies, peak_bytes, **extra):
+    latencies_ms = np.asarray(latencies) * 1000
+    total_seconds = float(np.sum(latencies))
+    return {
+        "stage": stage,
+        "calls": len(latencies),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(np.mean(latencies_ms)),
+        "throughput_per_s": len(latencies) / total_seconds if total_seconds else None,
+        "peak_memory_mb": peak_bytes / 2 ** 20 if peak_bytes is not None else None,
+        **extra,
+    }
+
+
+def measure(stage, func, inputs, memory_samples=20, **extra):
+    """Times func(input) for every input, then reruns a few with tracemalloc for the peak allocation."""
+    latencies = []
+    # Stage functions print progress per call; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for item in inputs:
+            started = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        for item in inputs[:memory_samples]:
+            func(item)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result = _summarize(stage, latencies, peak_bytes, **extra)
+    print(f"  {stage:<32} p50 {result['p50_ms']:9.3f} ms   p99 {result['p99_ms']:9.3f} ms   "
+          f"{result['throughput_per_s'] or 0:10.1f}/s   peak {result['peak_memory_mb']:8.2f} MB")
+    return result
+
+
+def _perturb_address(address: str) -> str:
+    """The same destination written differently, as a customer might."""
+    return address.replace("Street", "St").replace("Avenue", "Ave").replace("Road", "Rd")
+
+
+def benchmark_catalog_size(n_skus, n_emails, n_shipments, n_render, seed, output_folder):
+    catalog_df = generate_catalog(n_skus, seed=seed)
+    emails = generate_emails(catalog_df, n_emails, seed=seed)
+    shipments_df = generate_shipments(n_shipments, seed=seed)
+    results = []
+    sizes = {"catalog_skus": n_skus}
+
+    # --- Setup: building the catalog index once ---
+    tracemalloc.start()
+    started = time.perf_counter()
+    catalog_index = build_catalog_index(catalog_df)
+    build_seconds = time.perf_counter() - started
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.append(_summarize("build_catalog_index", [build_seconds], peak_bytes, **sizes))
+    print(f"  {'build_catalog_index':<32} {build_seconds * 1000:9.1f} ms   peak {peak_bytes / 2 ** 20:8.2f} MB")
+
+    # --- Setup: compiling the catalog snapshot once, then opening it as every later process does ---
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        csv_path = os.path.join(snapshot_dir, "catalog.csv")
+        catalog_df.to_csv(csv_path, index=False)
+        for stage in ("compile_catalog_snapshot", "open_catalog_snapshot"):
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                open_snapshot(csv_path, os.path.join(snapshot_dir, "snapshot"))
+            seconds = time.perf_counter() - started
+            results.append(_summarize(stage, [seconds], None, **sizes))
+            print(f"  {stage:<32} {seconds * 1000:9.1f} ms")
+
+    requested_names = [p["product_name"] for _, expected in emails for p in expected["products"]]
+    results.append(measure("find_product_matches[index]", lambda name: find_product_matches(name, catalog_index),
+                           requested_names, **sizes))
+    # Repeat requests: the first pass learns the single fuzzy matches, the timed pass hits the aliases
+    with tempfile.TemporaryDirectory() as alias_dir:
+        alias_store = AliasStore(os.path.join(alias_dir, "aliases.sqlite"))
+        for name in requested_names:
+            find_product_matches(name, catalog_index, alias_store=alias_store)
+        results.append(measure("find_product_matches[alias]",
+                               lambda name: find_product_matches(name, catalog_index, alias_store=alias_store),
+                               requested_names, aliases=len(alias_store), **sizes))
+        alias_store.close()
+    if n_skus <= LINEAR_SCAN_MAX_SKUS:
+        scan_names = requested_names[:max(20, n_render)]
+        results.append(measure("find_product_matches[scan]", lambda name: find_product_matches(name, catalog_df),
+                               scan_names, **sizes))
+
+    # --- Extraction: rule parser first, the stub LLM for everything it can't read ---
+    expected_by_body = dict(emails)
+    stub_llm = FakeGenerativeModel(responder=expected_by_body.__getitem__)
+    bodies = [body for body, _ in emails]
+    extracted = {}
+
+    def extract(body):
+        extracted[body] = extract_order_details_from_email(body, use_cache=False, model_client=stub_llm,
+                                                           inventory_df=catalog_index)
+    results.append(measure("extract_order_details[stub_llm]", extract, bodies, **sizes))
+    batches = [bodies[i:i + settings.LLM_BATCH_SIZE] for i in range(0, len(bodies), settings.LLM_BATCH_SIZE)]
+    results.append(measure("extract_order_details[stub_llm,batch]",
+                           lambda batch: extract_order_details_from_emails(batch, use_cache=False, model_client=stub_llm,
+                                                                           inventory_df=catalog_index),
+                           batches, memory_samples=3, emails_per_call=settings.LLM_BATCH_SIZE, **sizes))
+
+    # --- Near-duplicate check: every email registered once, then each again as a forward ---
+    with tempfile.TemporaryDirectory() as dedupe_dir:
+        detector = DuplicateDetector(os.path.join(dedupe_dir, "duplicates.sqlite"))
+        results.append(measure("duplicate_detector.register[new]", detector.register, bodies, **sizes))
+        forwards = [f"---------- Forwarded message ----------\nSubject: Fwd: Order\n\n{body}\n\nAny update on this?"
+                    for body in bodies]
+        results.append(measure("duplicate_detector.register[forward]", detector.register, forwards,
+                               entries=len(detector), **sizes))
+        detector.close()
+
+    extracted_orders = [extracted[body] or expected_by_body[body] for body in bodies]
+    validated = {}
+
+    def validate(position):
+        validated[position] = process_and_validate_order(extracted_orders[position], catalog_index)
+    results.append(measure("process_and_validate_order", validate, list(range(len(extracted_orders))), **sizes))
+
+    # --- Re-validation: every validated order stored, then the items waiting on one SKU re-checked, as after a restock ---
+    with tempfile.TemporaryDirectory() as store_dir:
+        order_store = OrderStore(os.path.join(store_dir, "orders.sqlite"))
+        final_orders = [validated[position] for position in sorted(validated)]
+        order_store.append_many([build_sales_order(order) for order in final_orders], final_orders)
+        revalidator = OrderRevalidator(order_store, catalog_index, template_path=PDF_TEMPLATE_PATH)
+        waiting_skus = list(dict.fromkeys(sku for order in final_orders for _, sku, _, _ in waiting_items(order) if sku))
+        if waiting_skus:
+            results.append(measure("revalidate[sku]", lambda sku: revalidator.revalidate([sku]), waiting_skus,
+                                   stored_orders=len(final_orders), **sizes))
+        order_store.close()
+
+    # --- Consolidation: half the queries are existing destinations written differently ---
+    destinations = shipments_df["Destination"].tolist()
+    queries = [_perturb_address(destinations[i % len(destinations)]) if i % 2 == 0 else expected["delivery_address"]
+               for i, (_, expected) in enumerate(emails)]
+    shipment_sizes = {**sizes, "pending_shipments": n_shipments}
+    address_index = AddressIndex.from_dataframe(shipments_df)
+    results.append(measure("find_consolidation[index]",
+                           lambda address: find_consolidation_opportunities(address, address_index),
+                           queries, **shipment_sizes))
+    results.append(measure("find_consolidation[scan]",
+                           lambda address: find_consolidation_opportunities(address, shipments_df),
+                           queries[:max(20, n_render)], **shipment_sizes))
+
+    # --- Output: JSON and PDF for a sample of the validated orders ---
+    json_paths = []
+    results.append(measure("create_sales_order_json",
+                           lambda position: json_paths.append(create_sales_order_json(validated[position], output_folder)),
+                           list(range(min(n_render, len(validated)))), **sizes))
+    results.append(measure("fill_sales_order_pdf",
+                           lambda json_path: fill_sales_order_pdf(json_path, PDF_TEMPLATE_PATH, output_folder),
+                           json_paths[:n_render], **sizes))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the order pipeline stages on synthetic data.")
+    parser.add_argument("--skus", type=int, nargs="+", default=[1000, 10000], help="Catalog sizes to benchmark.")
+    parser.add_argument("--emails", type=int, default=200, help="Synthetic order emails per catalog size.")
+    parser.add_argument("--shipments", type=int, default=5000, help="Pending shipments for the consolidation check.")
+    parser.add_argument("--render", type=int, default=30, help="Orders rendered to JSON and PDF per catalog size.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: bench/results/bench-<commit>.json).")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    output_path = args.output or os.path.join("bench", "results", f"bench-{commit or 'nocommit'}.json")
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp_utc": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "params": vars(args),
+        },
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        for n_skus in args.skus:
+            print(f"\n📊 Catalog of {n_skus} SKUs, {args.emails} emails, {args.shipments} pending shipments")
+            report["results"] += benchmark_catalog_size(n_skus, args.emails, args.shipments, args.render,
+                                                        args.seed, output_folder)
+
+    folder = os.path.dirname(output_path)
+    if folder and not os.path.exists(folder): os.makedirs(folder)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
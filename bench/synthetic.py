@@ -0,0 +1,103 @@
+"""
+Synthetic, seeded data shaped like the real inputs: the product catalog in
+data/Product Catalog.csv, the order emails in test_data/, and a pending-shipments table.
+The same seed always produces the same data, so benchmark runs are comparable.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+PRODUCT_TYPES = {
+    "Desk": "DSK", "Chair": "CHR", "Bed": "BED", "Dining": "DIN", "Loveseat": "LVS", "Wardrobe": "WRD",
+    "Ottoman": "OTM", "Sofa": "SOF", "Bookshelf": "BKS", "Lamp": "LMP", "Dresser": "DRS", "Cabinet": "CAB",
+}
+NAME_STARTS = ["TRÄN", "NORD", "BJÖR", "MÖRK", "KALL", "HEMN", "VALL", "LUND", "VIKT", "STRÅ", "SNÖR", "FJÄR",
+               "ÄLVA", "GRÖN", "SKOG", "ÖSTER", "HAV", "LJUS", "BERG", "DAL"]
+NAME_ENDS = ["HOLM", "MARK", "STA", "SKÄR", "SUND", "FORS", "TORP", "BERG", "DAL", "VIK", "KÄR", "LUND"]
+
+FIRST_NAMES = ["John", "Lena", "Carlos", "Fatima", "Akira", "Priya", "Olivia", "Mateo", "Ingrid", "Kwame"]
+LAST_NAMES = ["Smith", "Müller", "Ramirez", "Al-Sayeed", "Tanaka", "Sharma", "Brown", "Rossi", "Larsen", "Mensah"]
+STREETS = ["Main Street", "Oak Avenue", "Königstraße", "Maple Road", "Harbor Boulevard", "Elm St", "Park Ave",
+           "Station Road", "Lakeview Drive", "Mill Lane"]
+CITIES = [("Springfield", "IL"), ("Austin", "TX"), ("Denver", "CO"), ("Portland", "OR"), ("Madison", "WI")]
+
+
+def generate_catalog(n_skus: int, seed=0) -> pd.DataFrame:
+    """A catalog with the same columns and name style as data/Product Catalog.csv."""
+    rng = np.random.default_rng(seed)
+    types = list(PRODUCT_TYPES)
+    type_idx = rng.integers(0, len(types), n_skus)
+    starts = np.array(NAME_STARTS)[rng.integers(0, len(NAME_STARTS), n_skus)]
+    ends = np.array(NAME_ENDS)[rng.integers(0, len(NAME_ENDS), n_skus)]
+    numbers = rng.integers(1, 1000, n_skus)
+
+    type_names = np.array(types)[type_idx]
+    names = [f"{t} {s}{e} {n}" for t, s, e, n in zip(type_names, starts, ends, numbers)]
+    return pd.DataFrame({
+        "Product_Code": [f"{PRODUCT_TYPES[t]}-{i + 1:07d}" for i, t in enumerate(type_names)],
+        "Product_Name": names,
+        "Price": np.round(rng.uniform(20, 1500, n_skus), 2).astype(str),
+        "Available_in_Stock": rng.integers(0, 200, n_skus).astype(str),
+        "Min_Order_Quantity": rng.integers(1, 6, n_skus).astype(str),
+        "Description": [f"A modern {t.lower()} named '{name}', designed with style and functionality in mind."
+                        for t, name in zip(type_names, names)],
+    })
+
+
+def _address(rng: random.Random) -> str:
+    city, state = rng.choice(CITIES)
+    return f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {city}, {state} {rng.randint(10000, 99999)}"
+
+
+def _email_text(style: int, customer: str, address: str, date: str, items) -> str:
+    if style == 0: # Bulleted quote request, like sample_email_2.txt
+        lines = "\n".join(f"* {name} – Qty: {qty}" for name, qty in items)
+        return (f"To whom it may concern,\n\nPlease prepare a quote and availability for the following items, "
+                f"with quantities indicated:\n\n{lines}\n\nRequested delivery date: {date}\n"
+                f"Delivery address: {address}\n\nSincerely,\n{customer}")
+    if style == 1: # Plain list, like sample_email_4.txt
+        lines = "\n".join(f"{name} – need {qty} pcs" for name, qty in items)
+        return (f"Hi,\n\nI’d like to buy the following items urgently:\n{lines}\n\n"
+                f"Ship them to: {address}\nDeadline: {date}\n\nThanks,\n{customer}.")
+    # Free-form prose the rule parser can't read, so it goes to the (stubbed) LLM
+    wanted = ", and ".join(f"{qty} of the {name}" for name, qty in items)
+    return (f"Hello team,\n\nWe are refurbishing our office and would love to get {wanted}. "
+            f"It would be great to have everything at {address} before {date}.\n\nBest regards,\n{customer}")
+
+
+def generate_emails(catalog_df: pd.DataFrame, n_emails: int, seed=0, typo_rate=0.2):
+    """
+    Returns [(email_body, expected_order)] in the styles of test_data/. `expected_order`
+    is what an ideal extractor returns; the benchmark's stub LLM answers with it.
+    Some product names get a typo, so the fuzzy tier is exercised too.
+    """
+    rng = random.Random(seed)
+    names = catalog_df["Product_Name"].tolist()
+    emails = []
+    for _ in range(n_emails):
+        customer = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        address = _address(rng)
+        date = f"July {rng.randint(1, 28)}, 2025"
+        items = []
+        for name in rng.sample(names, min(len(names), rng.randint(1, 4))):
+            if rng.random() < typo_rate:
+                pos = rng.randrange(len(name))
+                name = name[:pos] + name[pos + 1:]
+            items.append((name, rng.randint(1, 12)))
+        body = _email_text(rng.randrange(3), customer, address, date, items)
+        expected = {
+            "customer_name": customer, "delivery_address": address, "delivery_date": date,
+            "products": [{"product_name": name, "quantity": qty} for name, qty in items],
+        }
+        emails.append((body, expected))
+    return emails
+
+
+def generate_shipments(n_shipments: int, seed=0) -> pd.DataFrame:
+    """A pending-shipments table with the OrderID and Destination columns the consolidation check reads."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "OrderID": [f"SO-{i + 1:07d}" for i in range(n_shipments)],
+        "Destination": [_address(rng) for _ in range(n_shipments)],
+    })
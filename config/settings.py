@@ -7,4 +7,67 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 IMAP_SERVER = os.getenv("IMAP_SERVER")
 EMAIL_ACCOUNT = os.getenv("EMAIL_ACCOUNT")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
\ No newline at end of file
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+
+# Cache of LLM extraction results (set EXTRACTION_CACHE_PATH to an empty string to disable)
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "output/.cache/extractions.sqlite")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Async extraction driver: max in-flight LLM calls, request rate and retries on transient errors
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# Emails packed into one LLM request by batch extraction (the prompt is sent once per batch)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))
+# Seconds to wait after a failed batch request before its emails are sent one by one (doubles per failed batch)
+LLM_BATCH_FALLBACK_DELAY = float(os.getenv("LLM_BATCH_FALLBACK_DELAY", "2"))
+
+# Rule-based parsing of structured emails: below this confidence (0-1) the LLM is used instead
+RULE_PARSER_MIN_CONFIDENCE = float(os.getenv("RULE_PARSER_MIN_CONFIDENCE", "0.9"))
+
+# Persistent IMAP ingestion (worker.py --daemon)
+IMAP_FOLDER = os.getenv("IMAP_FOLDER", "INBOX")
+IMAP_BATCH_SIZE = int(os.getenv("IMAP_BATCH_SIZE", "50"))
+IMAP_POLL_INTERVAL = int(os.getenv("IMAP_POLL_INTERVAL", "10"))
+IMAP_USE_IDLE = os.getenv("IMAP_USE_IDLE", "true").lower() == "true"
+IMAP_STATE_PATH = os.getenv("IMAP_STATE_PATH", "output/.state/imap_state.json")
+# Attempts at a message whose processing raised before it is recorded in failed_uids and skipped
+IMAP_MAX_ATTEMPTS = int(os.getenv("IMAP_MAX_ATTEMPTS", "3"))
+
+# Durable job queue (worker.py --queue): jobs resume from their last completed stage after a crash
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "output/.state/jobs.sqlite")
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Order-ingest HTTP API (app.py): background worker threads and the backlog at which submissions get 429
+ORDER_API_WORKERS = int(os.getenv("ORDER_API_WORKERS", "4"))
+ORDER_API_MAX_QUEUE_DEPTH = int(os.getenv("ORDER_API_MAX_QUEUE_DEPTH", "1000"))
+# How often idle API workers check the shared queue for jobs from other processes or expired leases
+ORDER_API_POLL_SECONDS = float(os.getenv("ORDER_API_POLL_SECONDS", "1"))
+
+# Stock reservations shared by every worker process, so concurrent orders can't take the same units (empty disables)
+STOCK_LEDGER_PATH = os.getenv("STOCK_LEDGER_PATH", "output/.state/stock_ledger.sqlite")
+
+# Indexed store of finished orders (set ORDER_STORE_PATH to an empty string to disable)
+ORDER_STORE_PATH = os.getenv("ORDER_STORE_PATH", "output/orders.sqlite")
+
+# Learned product aliases (customer shorthand -> Product_Code) checked before catalog matching (empty disables)
+ALIAS_STORE_PATH = os.getenv("ALIAS_STORE_PATH", "output/.state/aliases.sqlite")
+
+# Near-duplicate email detection (resends, forwards, replies quoting an order) before extraction (empty disables)
+DUPLICATE_INDEX_PATH = os.getenv("DUPLICATE_INDEX_PATH", "output/.state/duplicates.sqlite")
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+DUPLICATE_WINDOW_SECONDS = int(os.getenv("DUPLICATE_WINDOW_SECONDS", str(7 * 24 * 3600)))
+DUPLICATE_MAX_ENTRIES = int(os.getenv("DUPLICATE_MAX_ENTRIES", "500000"))
+
+# Compiled, memory-mapped catalog snapshots, rebuilt when the catalog CSV changes (empty parses the CSV on every start)
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "output/.cache/catalog")
+
+# How often (seconds) long-running workers check the catalog CSV for stock and price changes (0 disables)
+CATALOG_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "5"))
+# Bearer token required by the API's catalog delta and order rejection endpoints (empty disables both)
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+
+# Optional per-order trace log: one JSON line per order with the time spent in each stage (empty disables)
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
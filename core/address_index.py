@@ -0,0 +1,168 @@
+import json
+import re
+from collections import defaultdict
+
+from thefuzz import fuzz
+
+# Common street-type and unit abbreviations, mapped to one spelling
+ADDRESS_ABBREVIATIONS = {
+    "st": "street", "str": "street", "ave": "avenue", "av": "avenue", "rd": "road", "blvd": "boulevard",
+    "dr": "drive", "ln": "lane", "ct": "court", "pl": "place", "sq": "square", "hwy": "highway",
+    "pkwy": "parkway", "cir": "circle", "ter": "terrace", "n": "north", "s": "south", "e": "east", "w": "west",
+    "apt": "unit", "apartment": "unit", "ste": "unit", "suite": "unit", "fl": "floor", "bldg": "building",
+}
+
+ZIP_PATTERN = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+UNIT_PATTERN = re.compile(r'(?:#|\b(?:apt|apartment|unit|ste|suite)\.?)\s*([a-z0-9-]+)', re.IGNORECASE)
+
+
+def normalize_address(address: str) -> str:
+    """Lowercases, expands abbreviations (St -> street) and writes unit numbers as 'unit <n>'."""
+    text = UNIT_PATTERN.sub(lambda m: f" unit {m.group(1)} ", str(address).lower())
+    tokens = re.findall(r'[^\W_]+(?:-[^\W_]+)*', text)
+    return " ".join(ADDRESS_ABBREVIATIONS.get(token, token) for token in tokens)
+
+
+def address_block_keys(normalized_address: str):
+    """Returns (zip_code, street_number) for blocking; either can be None."""
+    zip_matches = ZIP_PATTERN.findall(normalized_address)
+    zip_code = zip_matches[-1] if zip_matches else None
+
+    tokens = normalized_address.split()
+    street_number = None
+    for i, token in enumerate(tokens):
+        if i > 0 and tokens[i - 1] == "unit":
+            continue
+        if re.fullmatch(r'\d+[a-z]?', token) and token != zip_code:
+            street_number = token
+            break
+    return zip_code, street_number
+
+
+class AddressIndex:
+    """
+    Index of pending shipments for consolidation checks.
+
+    Destinations are normalized once and blocked by ZIP code and street number, so
+    a new order is only fuzzy-compared with the few pending destinations whose keys
+    agree with its own (a destination missing a key is compared too). Shipments can be added and removed as they are created and dispatched.
+    """
+
+    def __init__(self):
+        self._destination_of = {}                 # order_id -> destination
+        self._orders_at = defaultdict(dict)       # destination -> {order_id: None} (ordered set)
+        self._normalized = {}                     # destination -> normalized destination
+        self._keys = {}                           # destination -> (zip_code, street_number)
+        self._by_zip = defaultdict(set)
+        self._by_number = defaultdict(set)
+        self._zip_only = set()                    # destinations with a ZIP code but no street number
+        self._number_only = set()                 # destinations with a street number but no ZIP code
+        self._unkeyed = set()                     # destinations with neither key
+        self._sequence = {}                       # destination -> insertion counter, for stable output order
+        self._next_sequence = 0
+
+    @classmethod
+    def from_dataframe(cls, pending_shipments_df):
+        index = cls()
+        for order_id, destination in zip(pending_shipments_df['OrderID'], pending_shipments_df['Destination']):
+            index.add_shipment(order_id, destination)
+        return index
+
+    def __len__(self):
+        return len(self._destination_of)
+
+    def add_shipment(self, order_id, destination: str):
+        if order_id in self._destination_of:
+            self.remove_shipment(order_id)
+        self._destination_of[order_id] = destination
+
+        if destination not in self._orders_at:
+            normalized = normalize_address(destination)
+            zip_code, street_number = address_block_keys(normalized)
+            self._normalized[destination] = normalized
+            self._keys[destination] = (zip_code, street_number)
+            self._sequence[destination] = self._next_sequence
+            self._next_sequence += 1
+            if zip_code:
+                self._by_zip[zip_code].add(destination)
+            if street_number:
+                self._by_number[street_number].add(destination)
+            if zip_code and not street_number:
+                self._zip_only.add(destination)
+            elif street_number and not zip_code:
+                self._number_only.add(destination)
+            elif not zip_code and not street_number:
+                self._unkeyed.add(destination)
+        self._orders_at[destination][order_id] = None
+
+    def remove_shipment(self, order_id):
+        """Removes a dispatched (or cancelled) shipment. Returns False if it was not indexed."""
+        destination = self._destination_of.pop(order_id, None)
+        if destination is None:
+            return False
+
+        orders = self._orders_at[destination]
+        orders.pop(order_id, None)
+        if not orders:
+            del self._orders_at[destination]
+            zip_code, street_number = self._keys.pop(destination)
+            del self._normalized[destination]
+            del self._sequence[destination]
+            if zip_code:
+                self._by_zip[zip_code].discard(destination)
+            if street_number:
+                self._by_number[street_number].discard(destination)
+            self._zip_only.discard(destination)
+            self._number_only.discard(destination)
+            self._unkeyed.discard(destination)
+        return True
+
+    def _candidates(self, zip_code, street_number):
+        """
+        Destinations whose keys don't contradict the query's: a key missing on either
+        side can't rule a destination out, so unnumbered and ZIP-less ones stay in.
+        """
+        if street_number and zip_code:
+            # Same street number in a different ZIP is a different address
+            candidates = {d for d in self._by_number.get(street_number, ()) if self._keys[d][0] in (zip_code, None)}
+            return candidates | {d for d in self._by_zip.get(zip_code, ()) if self._keys[d][1] is None}
+        if street_number:
+            return self._by_number.get(street_number, set()) | self._zip_only
+        if zip_code:
+            return self._by_zip.get(zip_code, set()) | self._number_only
+        # Nothing to block on: compare against everything
+        return set(self._orders_at)
+
+    def find_matches(self, new_order_address: str, confidence_threshold=90):
+        """Same result format as find_consolidation_opportunities."""
+        if new_order_address is None:
+            return []
+
+        normalized = normalize_address(new_order_address)
+        candidates = self._candidates(*address_block_keys(normalized)) | self._unkeyed
+
+        potential_matches = []
+        # Keep the order in which destinations were first added, like the DataFrame scan
+        for destination in sorted(candidates, key=self._sequence.__getitem__):
+            similarity_score = fuzz.token_sort_ratio(normalized, self._normalized[destination])
+            if similarity_score >= confidence_threshold:
+                for order_id in self._orders_at[destination]:
+                    potential_matches.append({
+                        "pending_order_id": order_id,
+                        "similar_address": destination,
+                        "match_confidence": similarity_score
+                    })
+        return potential_matches
+
+    def save(self, path: str):
+        """Persists the pending shipments (order ID -> destination) as JSON."""
+        with open(path, 'w') as f:
+            json.dump([[order_id, destination] for order_id, destination in self._destination_of.items()], f)
+
+    @classmethod
+    def load(cls, path: str):
+        index = cls()
+        with open(path, 'r') as f:
+            for order_id, destination in json.load(f):
+                index.add_shipment(order_id, destination)
+        return index
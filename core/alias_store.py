@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from .catalog_index import normalize_product_name
+
+SOURCES = ("fuzzy", "reviewer")
+
+
+def alias_name_key(requested_name: str) -> str:
+    """The requested name as aliases are keyed: without a trailing parenthetical, lowercased, single-spaced."""
+    return " ".join(normalize_product_name(requested_name).split())
+
+
+def customer_key(customer) -> str:
+    return (customer or "").strip().lower()
+
+
+class AliasStore:
+    """
+    Learned shorthand -> Product_Code table, persisted to SQLite.
+
+    Customers keep writing the same shorthand (e.g. "Coffee STRÅDAL" without the
+    number), which the exact tier misses and the fuzzy tier scores again on every
+    order, often ending in MULTIPLE_MATCHES_FOUND. Each alias maps a normalized
+    requested name to one product, either for one customer or globally (customer
+    key ''). Aliases are only learned from confirmed outcomes: a reviewer resolving
+    an ambiguous or unmatched request, and the shorthand of an order whose every
+    line item was validated, which is kept for that customer only. Reviewer aliases
+    win over learned ones. find_product_matches checks the table before both tiers.
+
+    An alias remembers the product name it was learned against. It is dropped when
+    that product is removed or renamed, and aliases learned from fuzzy matches are
+    dropped whenever products are added or renamed, since a new name can change
+    what the fuzzy tier would pick. Lookups are answered from memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            " customer_key TEXT NOT NULL, name_key TEXT NOT NULL, product_code TEXT NOT NULL,"
+            " product_name TEXT, source TEXT NOT NULL, created_at TEXT NOT NULL,"
+            " PRIMARY KEY (customer_key, name_key));"
+            "CREATE INDEX IF NOT EXISTS idx_aliases_product ON aliases (product_code);"
+        )
+        # Learned aliases are per customer; global ones from older versions are dropped
+        self._conn.execute("DELETE FROM aliases WHERE customer_key = '' AND source = 'fuzzy'")
+        # (customer_key, name_key) -> (product_code, product_name, source)
+        self._aliases = {
+            (customer, name): (code, product_name, source)
+            for customer, name, code, product_name, source in self._conn.execute(
+                "SELECT customer_key, name_key, product_code, product_name, source FROM aliases")
+        }
+
+    def __len__(self):
+        return len(self._aliases)
+
+    def lookup(self, requested_name: str, customer=None):
+        """Returns (product_code, product_name) for the customer's alias, else the global one, else None."""
+        name = alias_name_key(requested_name)
+        entry = None
+        if customer:
+            entry = self._aliases.get((customer_key(customer), name))
+        if entry is None:
+            entry = self._aliases.get(("", name))
+        return entry[:2] if entry else None
+
+    def learn(self, requested_name: str, product_code: str, product_name=None, customer=None, source="fuzzy"):
+        """
+        Records that `requested_name` means `product_code`.
+
+        Learned (source "fuzzy") aliases are kept for the customer only, and not learned
+        without one; a reviewer's resolution for a customer stays with that customer, and
+        one without a customer is global. A learned alias never replaces a reviewer's.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"Unknown alias source '{source}'.")
+        name = alias_name_key(requested_name)
+        if not name or not product_code or (source == "fuzzy" and not customer_key(customer)):
+            return
+        entry = (str(product_code), product_name, source)
+        key = (customer_key(customer), name)
+
+        with self._lock:
+            current = self._aliases.get(key)
+            if current is not None and (current == entry or (source == "fuzzy" and current[2] == "reviewer")):
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO aliases (customer_key, name_key, product_code, product_name, source, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (*key, *entry, datetime.utcnow().isoformat()))
+            self._aliases[key] = entry
+
+    def resolve(self, requested_name: str, product_code: str, product_name=None, customer=None):
+        """A reviewer's answer to an ambiguous or unmatched request, used for the customer's later orders (all customers' without one)."""
+        self.learn(requested_name, product_code, product_name=product_name, customer=customer, source="reviewer")
+
+    def _delete(self, key):
+        self._conn.execute("DELETE FROM aliases WHERE customer_key = ? AND name_key = ?", key)
+        self._aliases.pop(key, None)
+
+    def forget(self, requested_name: str, customer=None):
+        """Removes the alias for the customer (or the global one, without a customer)."""
+        with self._lock:
+            self._delete((customer_key(customer), alias_name_key(requested_name)))
+
+    def expire_products(self, product_codes, fuzzy=False) -> int:
+        """Drops the aliases pointing at the given products, and with `fuzzy` every learned alias. Returns the count."""
+        product_codes = {str(code) for code in product_codes}
+        with self._lock:
+            stale = [key for key, (code, _, source) in self._aliases.items()
+                     if code in product_codes or (fuzzy and source == "fuzzy")]
+            if stale:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany("DELETE FROM aliases WHERE customer_key = ? AND name_key = ?", stale)
+                self._conn.execute("COMMIT")
+                for key in stale:
+                    del self._aliases[key]
+        return len(stale)
+
+    def expire(self, changes) -> int:
+        """
+        CatalogService listener: drops aliases of removed or renamed products, and learned
+        aliases when product names changed. Stock and price changes keep every alias.
+        """
+        renamed = [change['Product_Code'] for change in changes
+                   if change.get('removed') or 'Product_Name' in change or 'Description' in change]
+        if not renamed:
+            return 0
+        expired = self.expire_products(renamed, fuzzy=True)
+        if expired:
+            print(f"🔄 Catalog changed: {expired} product aliases expired.")
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
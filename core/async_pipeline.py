@@ -0,0 +1,110 @@
+import asyncio
+import os
+import random
+import time
+
+from config import settings
+from .llm_extractor import extract_locally, extract_with_llm_async, get_extraction_cache
+from .pipeline import OrderPipeline
+
+# Exception class names (google.api_core and asyncio) that are worth retrying
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "GatewayTimeout", "TimeoutError", "ConnectionError",
+}
+
+
+def is_transient_error(error: Exception) -> bool:
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def extract_with_retries(email_body: str, limiter: TokenBucket, max_retries=4, base_delay=0.5, model_client=None,
+                               inventory_df=None, use_cache=True):
+    """Extracts one email, backing off exponentially (with jitter) on transient API errors."""
+    # Structured and cached emails are answered locally, in a worker thread so the SQLite
+    # cache doesn't block the event loop, and never take a rate-limiter token
+    cache = get_extraction_cache() if use_cache else None
+    order_details, cache_key = await asyncio.to_thread(extract_locally, email_body, inventory_df, cache)
+    if order_details is not None:
+        return order_details
+    if model_client is None and not os.getenv("GEMINI_API_KEY"):
+        print("ERROR: Gemini API Key is not set.")
+        return None
+
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            return await extract_with_llm_async(email_body, model_client, cache, cache_key, raise_errors=True)
+        except Exception as e:
+            if not is_transient_error(e) or attempt == max_retries:
+                print(f"❌ Extraction failed after {attempt + 1} attempt(s): {e}")
+                return None
+            delay = base_delay * (2 ** attempt) * (0.5 + random.random())
+            print(f"⏳ Transient error ({type(e).__name__}), retrying in {delay:.2f}s...")
+            await asyncio.sleep(delay)
+
+
+async def run_extraction_pipeline(email_bodies, inventory_df, concurrency=None, rate_per_second=None,
+                                  max_retries=None, model_client=None, process_order=None):
+    """
+    Runs many emails through the pipeline at once.
+
+    Up to `concurrency` LLM calls are in flight, started no faster than
+    `rate_per_second`. As soon as an email's extraction finishes, its validation,
+    JSON and PDF steps run in a worker thread while other calls are still waiting.
+
+    Args:
+        process_order (callable): extracted_dict -> result, run off the event loop.
+            Defaults to OrderPipeline(inventory_df).process_extracted.
+
+    Returns:
+        A list with one result per email (None where extraction failed), in input order.
+    """
+    concurrency = concurrency or settings.LLM_CONCURRENCY
+    limiter = TokenBucket(rate_per_second or settings.LLM_RATE_PER_SECOND)
+    max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+    pipeline = None
+    if process_order is None:
+        pipeline = OrderPipeline(inventory_df)
+        process_order = pipeline.process_extracted
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def handle(email_body):
+        async with semaphore:
+            extracted = await extract_with_retries(email_body, limiter, max_retries, model_client=model_client,
+                                                   inventory_df=inventory_df)
+        # The LLM slot is released before the CPU/disk work, so the next call can start.
+        # Validation and JSON run in parallel threads; the PDF renderer builds one document
+        # at a time behind its process-wide lock, since PyMuPDF is not thread-safe.
+        if not extracted:
+            return None
+        return await loop.run_in_executor(None, process_order, extracted)
+
+    try:
+        return await asyncio.gather(*(handle(email_body) for email_body in email_bodies))
+    finally:
+        if pipeline is not None:
+            pipeline.close()
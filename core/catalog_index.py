@@ -0,0 +1,368 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process as rf_process, fuzz as rf_fuzz
+from thefuzz import utils as fuzz_utils
+
+from . import metrics
+from .models import ProductRecord
+
+NGRAM_SIZE = 3
+RECORD_COLUMNS = ("Product_Code", "Product_Name", "Price", "Available_in_Stock", "Min_Order_Quantity")
+
+
+def normalize_product_name(name: str) -> str:
+    """Strips any trailing parenthetical (e.g. '(blue)') and lowercases the name."""
+    return re.sub(r'\s*\([^)]*\)', '', str(name)).strip().lower()
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> set:
+    """Returns the set of character n-grams of every token in an already-processed string."""
+    grams = set()
+    for token in text.split():
+        if len(token) <= n:
+            grams.add(token)
+        else:
+            grams.update(token[i:i + n] for i in range(len(token) - n + 1))
+    return grams
+
+
+class ReadWriteLock:
+    """
+    Many readers or one writer. A waiting writer holds back new readers, so a steady
+    stream of lookups can't starve catalog updates. Not reentrant. Pickles as a fresh
+    lock, so an index can still be sent to spawned worker processes.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def __reduce__(self):
+        return ReadWriteLock, ()
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class CatalogIndex:
+    """
+    A search index built once from the product catalog DataFrame.
+
+    - Exact tier: a hash map from the lowercase product name to its catalog rows.
+    - Fuzzy tier: a character n-gram inverted index over the same 'SearchString'
+      (name + description) the linear scan used. It shortlists the rows that share
+      the query's rarest n-grams, and only that shortlist is scored with fuzz.WRatio.
+      A row scoring 90 or more shares most of the query's n-grams, so the shortlist
+      returns the same products as the scan (tests/test_catalog_index.py checks this
+      for exact, shorthand, misspelled, reordered and padded requests).
+
+    `CatalogIndex.from_snapshot` serves the same structures from a compiled
+    CatalogSnapshot instead of building them.
+
+    Catalog changes (add_products, remove_product, update_product) edit the tiers in
+    several steps, so they run under the write side of `lock`, and lookups hold the
+    read side across all the structures they touch (`with index.lock.reading():`,
+    taken by match_rows and find_product_matches). A lookup never sees a product
+    half re-indexed.
+    """
+    snapshot = None
+
+    def __init__(self, inventory_df: pd.DataFrame, max_candidates=128, max_query_grams=8, min_overlap=0.75):
+        self.df = inventory_df.reset_index(drop=True)
+        self.max_candidates = max_candidates
+        self.max_query_grams = max_query_grams
+        self.min_overlap = min_overlap
+
+        names = self.df['Product_Name'].astype(str).str.lower()
+        descriptions = self.df['Description'].astype(str).fillna('').str.lower()
+
+        # --- Exact tier: lowercase name -> catalog rows ---
+        self.exact = defaultdict(list)
+        for row, name in enumerate(names):
+            self.exact[name].append(row)
+
+        # --- Fuzzy tier: processed search strings and the n-gram postings over them ---
+        # WRatio processes choices with force_ascii, so the n-grams are taken from that same form
+        self.search_strings = [fuzz_utils.full_process(text, force_ascii=True) for text in names + " " + descriptions]
+        postings = defaultdict(list)
+        for row, text in enumerate(self.search_strings):
+            for gram in char_ngrams(text):
+                postings[gram].append(row)
+        self.postings = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.removed = set() # Rows of products taken out of the catalog; kept in df so row numbers stay stable
+        self.code_rows = {str(code): row for row, code in enumerate(self.df['Product_Code'])}
+        self._record_positions = [self.df.columns.get_loc(column) for column in RECORD_COLUMNS]
+        self.lock = ReadWriteLock()
+
+    @classmethod
+    def from_snapshot(cls, snapshot, max_candidates=128, max_query_grams=8, min_overlap=0.75):
+        """
+        An index over a memory-mapped CatalogSnapshot, with nothing parsed or built.
+
+        Lookups read the snapshot's arrays; catalog changes are kept in small overlays on
+        top of them. The catalog DataFrame (`df`) is only materialized when first needed,
+        e.g. by the first catalog change.
+        """
+        from .catalog_snapshot import SnapshotCodeRows, SnapshotExactIndex, SnapshotPostings, SnapshotSearchStrings
+
+        index = cls.__new__(cls)
+        index.snapshot = snapshot
+        index._df = None
+        index.max_candidates = max_candidates
+        index.max_query_grams = max_query_grams
+        index.min_overlap = min_overlap
+        index.exact = SnapshotExactIndex(snapshot)
+        index.search_strings = SnapshotSearchStrings(snapshot)
+        index.postings = SnapshotPostings(snapshot)
+        index.removed = set()
+        index.code_rows = SnapshotCodeRows(snapshot)
+        index._record_positions = [snapshot.columns.index(column) for column in RECORD_COLUMNS]
+        index.lock = ReadWriteLock()
+        return index
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self.snapshot.dataframe()
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        self._df = value
+
+    def __len__(self):
+        return len(self._df) if self._df is not None else len(self.snapshot)
+
+    # --- Incremental maintenance, so catalog changes don't need a rebuild ---
+
+    def _index_row(self, row: int):
+        product = self.df.iloc[row]
+        name = str(product['Product_Name']).lower()
+        description = str(product['Description']).lower() # Same text as the initial build, missing values included
+        bisect.insort(self.exact[name], row)
+        self.search_strings[row] = fuzz_utils.full_process(f"{name} {description}", force_ascii=True)
+        for gram in char_ngrams(self.search_strings[row]):
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = np.asarray([row], dtype=np.int32)
+            else:
+                self.postings[gram] = np.insert(posting, np.searchsorted(posting, row), row)
+
+    def _unindex_row(self, row: int):
+        name = str(self.df.iloc[row]['Product_Name']).lower()
+        rows = self.exact[name] if name in self.exact else []
+        if row in rows:
+            rows.remove(row)
+            if not rows:
+                del self.exact[name]
+        for gram in char_ngrams(self.search_strings[row]):
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            posting = posting[posting != row]
+            if len(posting):
+                self.postings[gram] = posting
+            else:
+                del self.postings[gram]
+        self.search_strings[row] = ''
+
+    def add_products(self, products_df: pd.DataFrame) -> list:
+        """Appends new catalog rows and indexes them. Returns their row numbers."""
+        with self.lock.writing():
+            return self._add_products(products_df)
+
+    def _add_products(self, products_df: pd.DataFrame) -> list:
+        start = len(self.df)
+        self.df = pd.concat([self.df, products_df.astype(self.df.dtypes.to_dict(), errors='ignore')], ignore_index=True)
+        rows = list(range(start, len(self.df)))
+        self.search_strings.extend([''] * len(rows))
+        for row in rows:
+            self._index_row(row)
+            self.code_rows[str(self.df.iat[row, self._record_positions[0]])] = row
+        return rows
+
+    def remove_product(self, row: int):
+        """Takes a row out of both tiers; it can no longer be matched."""
+        with self.lock.writing():
+            self._remove_product(row)
+
+    def _remove_product(self, row: int):
+        if row not in self.removed:
+            self._unindex_row(row)
+            self.removed.add(row)
+            code = str(self.df.iat[row, self._record_positions[0]])
+            if self.code_rows.get(code) == row:
+                del self.code_rows[code]
+
+    def update_product(self, row: int, values: dict):
+        """Changes columns of a row in place, re-indexing it if its name or description changed."""
+        with self.lock.writing():
+            self._update_product(row, values)
+
+    def _update_product(self, row: int, values: dict):
+        reindex = row not in self.removed and ('Product_Name' in values or 'Description' in values)
+        if reindex:
+            self._unindex_row(row)
+        for column, value in values.items():
+            self.df.iat[row, self.df.columns.get_loc(column)] = value
+        if reindex:
+            self._index_row(row)
+
+    def _shortlist(self, processed_query: str):
+        """Returns candidate rows that share at least `min_overlap` of the query's rarest n-grams."""
+        lists = [posting for posting in map(self.postings.get, char_ngrams(processed_query)) if posting is not None]
+        if not lists:
+            return []
+
+        # Rare n-grams carry most of the signal; very common ones would only inflate the shortlist.
+        lists.sort(key=len)
+        lists = lists[:self.max_query_grams]
+        min_hits = self.required_hits(len(lists))
+
+        # A row that hits `min_hits` of the lists must appear in one of the rarest
+        # len(lists) - min_hits + 1 of them, so only those are used to seed candidates.
+        rows = np.unique(np.concatenate(lists[:len(lists) - min_hits + 1]))
+        hits = np.zeros(len(rows), dtype=np.int32)
+        for remaining, posting in zip(range(len(lists) - 1, -1, -1), lists):
+            # Postings are sorted by row, so membership is a binary search
+            pos = np.minimum(np.searchsorted(posting, rows), len(posting) - 1)
+            hits += posting[pos] == rows
+            # Drop rows that can no longer reach min_hits with the lists left
+            alive = hits + remaining >= min_hits
+            rows, hits = rows[alive], hits[alive]
+        if len(rows) > self.max_candidates:
+            # Stable sort keeps catalog order among candidates with equal overlap
+            top = np.argsort(-hits, kind='stable')[:self.max_candidates]
+            rows = np.sort(rows[top])
+        return rows.tolist()
+
+    def required_hits(self, query_gram_count: int) -> int:
+        """
+        The fewest of a query's n-grams a row must contain to be shortlisted, for a query with
+        `query_gram_count` n-grams in the catalog. A row sharing fewer can't match the query.
+        """
+        return max(1, int(np.ceil(self.min_overlap * min(query_gram_count, self.max_query_grams))))
+
+    def exact_match(self, requested_name: str):
+        """TIER 1: returns the catalog row whose name equals the cleaned request, if exactly one does."""
+        perfect_rows = self.exact.get(normalize_product_name(requested_name), [])
+        return perfect_rows[0] if len(perfect_rows) == 1 else None
+
+    def fuzzy_matches(self, requested_name: str, confidence_threshold=90, limit=5, count=True):
+        """
+        TIER 2: scores only the n-gram shortlist with WRatio. Returns (catalog_row, score) tuples.
+        With `count=False` the scored candidates are left out of the metrics (e.g. for a pre-check).
+        """
+        clean_requested_name = normalize_product_name(requested_name)
+        processed_query = fuzz_utils.full_process(clean_requested_name, force_ascii=True)
+        if not processed_query:
+            return []
+
+        candidates = {row: self.search_strings[row] for row in self._shortlist(processed_query)}
+        if not candidates:
+            return []
+        if count:
+            metrics.inc("fuzzy_candidates_scored_total", len(candidates))
+
+        # Same scorer, cutoff and rounding as thefuzz.process.extractBests(scorer=fuzz.WRatio), but
+        # called on rapidfuzz directly because the candidates are already processed.
+        matches = rf_process.extract(
+            processed_query,
+            candidates,
+            scorer=rf_fuzz.WRatio,
+            processor=None,
+            score_cutoff=confidence_threshold,
+            limit=limit
+        )
+        return [(row, int(round(score))) for _, score, row in matches]
+
+    def match_rows(self, requested_name: str, confidence_threshold=90, limit=5):
+        """
+        Returns a list of (catalog_row, confidence) tuples for a requested product name,
+        using the same two tiers, top-5 limit and score cutoff as find_product_matches.
+        """
+        if requested_name is None:
+            return []
+
+        with self.lock.reading():
+            exact_row = self.exact_match(requested_name)
+            if exact_row is not None:
+                return [(exact_row, 100)]
+            return self.fuzzy_matches(requested_name, confidence_threshold, limit)
+
+    def has_name_word(self, word: str, max_checked=32) -> bool:
+        """
+        Whether a product's name contains `word` (an already-processed token) as a whole word.
+        The n-gram postings narrow it to rows whose text has the word's n-grams; up to
+        `max_checked` of them are checked, since descriptions share the postings. Call it
+        under the read lock.
+        """
+        lists = [self.postings.get(gram) for gram in char_ngrams(word)]
+        if not lists or any(posting is None for posting in lists):
+            return False
+        lists.sort(key=len)
+        rows = lists[0]
+        for posting in lists[1:]:
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+        checked = 0
+        for row in rows.tolist():
+            if row in self.removed:
+                continue
+            name = fuzz_utils.full_process(str(self.record(row).Product_Name), force_ascii=True)
+            if word in name.split():
+                return True
+            checked += 1
+            if checked >= max_checked:
+                break
+        return False
+
+    def row_of(self, product_code: str):
+        """Returns the catalog row of a product code, or None if it is unknown or was removed."""
+        return self.code_rows.get(str(product_code))
+
+    def product(self, row: int) -> dict:
+        """Returns the catalog row as a plain dictionary."""
+        return self.df.iloc[row].to_dict()
+
+    def record(self, row: int, match_confidence=None) -> ProductRecord:
+        """Returns the catalog row as a compact ProductRecord (without the description)."""
+        if self._df is None:
+            values = [self.snapshot.value(row, column) for column in RECORD_COLUMNS]
+            return ProductRecord(*values, match_confidence=match_confidence, row=row)
+        df = self.df
+        values = [df.iat[row, position] for position in self._record_positions]
+        return ProductRecord(*values, match_confidence=match_confidence, row=row)
@@ -0,0 +1,259 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .catalog_index import CatalogIndex
+from .inventory_manager import load_catalog
+from . import metrics
+
+try:
+    import fcntl
+except ImportError: # Windows: publishers in one process are still serialized by the service's own lock
+    fcntl = None
+
+INTEGER_COLUMNS = ("Available_in_Stock", "Min_Order_Quantity")
+FLOAT_COLUMNS = ("Price",)
+
+
+def _coerce(column, value):
+    """Converts a delta value to the catalog column's type."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return pd.NA if column in INTEGER_COLUMNS else None
+    if column in INTEGER_COLUMNS:
+        if isinstance(value, bool):
+            raise ValueError(f"{column} must be a whole number, got {value!r}.")
+        if isinstance(value, int):
+            return value
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{column} must be a whole number, got {value!r}.")
+        return int(number)
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    return str(value)
+
+
+@contextmanager
+def _file_locked(lock_path):
+    """Holds an exclusive lock on `lock_path` across processes."""
+    with open(lock_path, "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _same(old, new):
+    if pd.isna(old) and pd.isna(new):
+        return True
+    if pd.isna(old) or pd.isna(new):
+        return False
+    return old == new
+
+
+class CatalogService:
+    """
+    Keeps the typed product catalog and its CatalogIndex current while orders are processed.
+
+    Stock, price and MOQ changes are written into the catalog rows in place; name and
+    description changes, new products and removed products update the index
+    incrementally, so there is never a full reload or a pause in matching. Changes come
+    from `apply_deltas` (a delta feed) or from watching the catalog CSV, in which case
+    only the rows that differ are applied. Callers hold on to `service.index` and see
+    every change. `publish_deltas` also writes the changes to the CSV, so every other
+    process (other API workers, the cron run, the next restart) sees them too.
+
+    With a `snapshot_dir`, the catalog is loaded from a compiled, memory-mapped
+    CatalogSnapshot (built or rebuilt there when the CSV changed) instead of being
+    parsed and indexed.
+    """
+
+    def __init__(self, path: str, watch_interval=None, snapshot_dir=None):
+        with metrics.span("catalog_load"):
+            self.path = path
+            if snapshot_dir:
+                from .catalog_snapshot import open_snapshot
+                self.index = CatalogIndex.from_snapshot(open_snapshot(path, snapshot_dir))
+            else:
+                catalog_df = load_catalog(path)
+                if catalog_df is None:
+                    raise FileNotFoundError(path)
+                self.index = CatalogIndex(catalog_df)
+        self._row_of = self.index.code_rows # Kept current by the index as products are added and removed
+        self._lock = threading.Lock()
+        self._file_lock = threading.RLock() # Serializes reading and writing the CSV within this process
+        self._listeners = []
+        self._signature = self._file_signature()
+        self._stop_event = threading.Event()
+        self._watcher = None
+        if watch_interval:
+            self.start_watching(watch_interval)
+
+    @property
+    def df(self):
+        return self.index.df
+
+    def add_listener(self, callback):
+        """Registers `callback(changes)`, called with the list of applied changes after every update."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def apply_deltas(self, deltas) -> list:
+        """
+        Applies stock/price/product changes in place.
+
+        Each delta is a dict with a Product_Code and the columns to change, e.g.
+        {"Product_Code": "DSK-0001", "Available_in_Stock": 12}. {"Product_Code": ..., "removed": True}
+        takes a product out of the catalog; an unknown code with a Product_Name adds one.
+        Returns the changes that actually altered the catalog; a stock change also carries
+        the `previous_stock`, so a StockLedger can consume holds as stock is decremented.
+        """
+        # Coerce everything first, so a bad value rejects the whole batch before anything changes
+        parsed = []
+        for delta in deltas:
+            delta = dict(delta)
+            code = str(delta.pop('Product_Code'))
+            removed = bool(delta.pop('removed', False))
+            values = {column: _coerce(column, value) for column, value in delta.items() if column in self.index.df.columns}
+            parsed.append((code, removed, values))
+
+        changes = []
+        with self._lock:
+            new_products = []
+            for code, removed, values in parsed:
+                row = self._row_of.get(code)
+
+                if removed:
+                    if row is not None:
+                        previous_text = self.index.search_strings[row]
+                        self.index.remove_product(row)
+                        changes.append({'Product_Code': code, 'removed': True, 'previous_text': previous_text})
+                    continue
+
+                if row is None:
+                    if values.get('Product_Name'):
+                        new_products.append({'Product_Code': code, **values})
+                    else:
+                        print(f"⚠️ Catalog delta for unknown product '{code}' ignored.")
+                    continue
+
+                current = self.index.df.iloc[row]
+                changed = {column: value for column, value in values.items() if not _same(current[column], value)}
+                if changed:
+                    previous_text = self.index.search_strings[row]
+                    self.index.update_product(row, changed)
+                    if 'Product_Name' in changed or 'Description' in changed:
+                        changed['previous_text'] = previous_text
+                    if 'Available_in_Stock' in changed:
+                        previous_stock = current['Available_in_Stock']
+                        changed['previous_stock'] = None if pd.isna(previous_stock) else int(previous_stock)
+                    changes.append({'Product_Code': code, **changed})
+
+            if new_products:
+                self.index.add_products(pd.DataFrame(new_products, columns=self.index.df.columns))
+                changes.extend(new_products)
+
+        if changes:
+            for listener in self._listeners:
+                listener(changes)
+        return changes
+
+    def publish_deltas(self, deltas) -> list:
+        """
+        Applies the deltas and writes the catalog back to its CSV, so they persist and reach
+        every process watching the file. Under a lock on the file, changes other processes
+        published are applied first, so concurrent publishers never overwrite each other.
+        Returns the changes that actually altered the catalog.
+        """
+        with self._file_lock, _file_locked(self.path + ".lock"):
+            self.reload_if_changed()
+            changes = self.apply_deltas(deltas)
+            if changes:
+                self._write_catalog()
+        return changes
+
+    def _write_catalog(self):
+        """Replaces the catalog CSV with the live catalog in one rename, so readers never see half a file."""
+        with self.index.lock.reading():
+            catalog_df = self.index.df.drop(index=list(self.index.removed))
+        handle, temp_path = tempfile.mkstemp(suffix=".csv", dir=os.path.dirname(self.path) or ".")
+        os.close(handle)
+        try:
+            catalog_df.to_csv(temp_path, index=False)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._signature = self._file_signature() # This process already has these changes
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def diff_catalog(self, catalog_df: pd.DataFrame) -> list:
+        """Returns the deltas that turn the current catalog into `catalog_df`."""
+        with self.index.lock.reading():
+            current = self.index.df.drop(index=list(self.index.removed))
+        current = current[~current['Product_Code'].duplicated()].set_index('Product_Code')
+        new = catalog_df[~catalog_df['Product_Code'].duplicated()].set_index('Product_Code')
+
+        common = new.index.intersection(current.index)
+        changed = {}
+        for column in new.columns.intersection(current.columns):
+            old_values, new_values = current.loc[common, column], new.loc[common, column]
+            differs = ~((old_values == new_values).fillna(False) | (old_values.isna() & new_values.isna()))
+            for code, value in new_values[differs.to_numpy()].items():
+                changed.setdefault(code, {})[column] = value
+
+        deltas = [{'Product_Code': code, **values} for code, values in changed.items()]
+        deltas += [{'Product_Code': code, **new.loc[code].to_dict()} for code in new.index.difference(current.index)]
+        deltas += [{'Product_Code': code, 'removed': True} for code in current.index.difference(new.index)]
+        return deltas
+
+    def reload_if_changed(self) -> list:
+        """Re-reads the catalog file if it changed on disk and applies only the differences."""
+        with self._file_lock:
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return []
+            catalog_df = load_catalog(self.path)
+            if catalog_df is None:
+                return []
+            self._signature = signature
+            changes = self.apply_deltas(self.diff_catalog(catalog_df))
+        if changes:
+            print(f"🔄 Catalog updated from {self.path}: {len(changes)} products changed.")
+        return changes
+
+    def start_watching(self, interval=5):
+        """Checks the catalog file for changes every `interval` seconds on a background thread."""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"❌ Catalog reload failed: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
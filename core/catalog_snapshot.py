@@ -0,0 +1,389 @@
+"""
+Compiled, memory-mapped snapshots of the product catalog.
+
+Parsing the catalog CSV and building its CatalogIndex (n-gram postings, exact-name
+map) costs seconds per process at 100k SKUs and most of a minute at 1M.
+`open_snapshot` compiles the CSV once into a versioned folder of .npy arrays:
+
+- typed columns: float64 price, int64 stock and MOQ with missing-value masks
+- interned string tables (UTF-8 blob, offsets per distinct string, string id per
+  row) for codes, names, descriptions and the processed search strings
+- hash indexes (sorted 64-bit hashes -> rows) over lowercase names and codes
+- the fuzzy tier's n-gram postings, as one row array with offsets per n-gram
+
+Later runs map the arrays read-only, so loading costs the same at any catalog
+size and worker processes share the same physical pages. The snapshot is
+rebuilt when the CSV's checksum changes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .catalog_index import NGRAM_SIZE, CatalogIndex
+from .inventory_manager import load_catalog
+
+SNAPSHOT_FORMAT = 1
+FLOAT_COLUMNS = ("Price",)
+INTEGER_COLUMNS = ("Available_in_Stock", "Min_Order_Quantity")
+POINTER_FILE = "current.json"
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def key_hash(text: str) -> int:
+    """Stable 64-bit hash of a lookup key (Python's hash() changes between processes)."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _missing(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and value != value)
+
+
+class StringTable:
+    """Interned strings: each distinct string is stored once, rows refer to it by id (-1 when missing)."""
+
+    def __init__(self, blob, offsets, ids):
+        self.blob, self.offsets, self.ids = blob, offsets, ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, row: int):
+        string_id = self.ids[row]
+        if string_id < 0:
+            return None
+        return self.blob[self.offsets[string_id]:self.offsets[string_id + 1]].tobytes().decode('utf-8')
+
+    def tolist(self) -> list:
+        return [self[row] for row in range(len(self))]
+
+    @staticmethod
+    def save(folder: str, name: str, values):
+        interned, ids, chunks = {}, [], []
+        for value in values:
+            if _missing(value):
+                ids.append(-1)
+                continue
+            string_id = interned.get(value)
+            if string_id is None:
+                string_id = interned[value] = len(chunks)
+                chunks.append(str(value).encode('utf-8'))
+            ids.append(string_id)
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+        np.save(os.path.join(folder, f"{name}.blob.npy"), np.frombuffer(b''.join(chunks), dtype=np.uint8))
+        np.save(os.path.join(folder, f"{name}.offsets.npy"), offsets)
+        np.save(os.path.join(folder, f"{name}.ids.npy"), np.asarray(ids, dtype=np.int32))
+
+    @classmethod
+    def load(cls, folder: str, name: str):
+        return cls(*(np.load(os.path.join(folder, f"{name}.{part}.npy"), mmap_mode='r') for part in ("blob", "offsets", "ids")))
+
+
+class HashIndex:
+    """Sorted 64-bit key hashes with their rows; lookups are a binary search, verified by the caller."""
+
+    def __init__(self, hashes, rows):
+        self.hashes, self.rows = hashes, rows
+
+    def candidates(self, key: str) -> list:
+        h = np.uint64(key_hash(key))
+        start, end = np.searchsorted(self.hashes, h, side='left'), np.searchsorted(self.hashes, h, side='right')
+        return sorted(int(row) for row in self.rows[start:end])
+
+    @staticmethod
+    def save(folder: str, name: str, keys):
+        hashes = np.fromiter((key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        order = np.argsort(hashes, kind='stable')
+        np.save(os.path.join(folder, f"{name}.hashes.npy"), hashes[order])
+        np.save(os.path.join(folder, f"{name}.rows.npy"), order.astype(np.int32))
+
+    @classmethod
+    def load(cls, folder: str, name: str):
+        return cls(np.load(os.path.join(folder, f"{name}.hashes.npy"), mmap_mode='r'),
+                   np.load(os.path.join(folder, f"{name}.rows.npy"), mmap_mode='r'))
+
+
+class CatalogSnapshot:
+    """A compiled catalog folder, mapped read-only. Pickles as its path, so spawned workers map the same files."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.columns = self.meta["columns"]
+        self.rows = self.meta["rows"]
+
+        load = lambda name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode='r')
+        self.strings = {column: StringTable.load(folder, f"col{i}") for i, column in enumerate(self.columns)
+                        if column not in FLOAT_COLUMNS + INTEGER_COLUMNS}
+        self.numbers = {column: load(f"col{i}") for i, column in enumerate(self.columns) if column in FLOAT_COLUMNS + INTEGER_COLUMNS}
+        self.missing = {column: load(f"col{i}.missing") for i, column in enumerate(self.columns) if column in INTEGER_COLUMNS}
+        self.search_strings = StringTable.load(folder, "search")
+        self.name_index = HashIndex.load(folder, "names")
+        self.code_index = HashIndex.load(folder, "codes")
+
+        # N-grams never contain whitespace, so the gram table is stored newline-separated
+        with open(os.path.join(folder, "grams.txt"), encoding='utf-8') as f:
+            grams = f.read()
+        self.gram_ids = {gram: i for i, gram in enumerate(grams.split('\n'))} if grams else {}
+        self.posting_offsets = load("postings.offsets")
+        self.posting_rows = load("postings.rows")
+
+    def __len__(self):
+        return self.rows
+
+    def __getstate__(self):
+        return self.folder
+
+    def __setstate__(self, folder):
+        self.__init__(folder)
+
+    # --- Row access without materializing the DataFrame ---
+
+    def value(self, row: int, column: str):
+        if column in self.strings:
+            return self.strings[column][row]
+        if column in self.missing and self.missing[column][row]:
+            return None
+        return self.numbers[column][row].item()
+
+    def name_key(self, row: int) -> str:
+        """The lowercase name the exact tier matches on ('nan' for a missing name, as in CatalogIndex)."""
+        name = self.strings["Product_Name"][row]
+        return ('nan' if name is None else name).lower()
+
+    def rows_named(self, name: str) -> list:
+        return [row for row in self.name_index.candidates(name) if self.name_key(row) == name]
+
+    def row_of(self, product_code: str):
+        """The last row with this product code, as in a {code: row} dict built over the catalog."""
+        codes = self.strings["Product_Code"]
+        rows = [row for row in self.code_index.candidates(product_code) if str(codes[row]) == product_code]
+        return rows[-1] if rows else None
+
+    def posting(self, gram: str):
+        gram_id = self.gram_ids.get(gram)
+        if gram_id is None:
+            return None
+        return self.posting_rows[self.posting_offsets[gram_id]:self.posting_offsets[gram_id + 1]]
+
+    def dataframe(self) -> pd.DataFrame:
+        """The typed catalog DataFrame, as load_catalog returns it. Reads every row."""
+        data = {}
+        for column in self.columns:
+            if column in self.strings:
+                values = [np.nan if v is None else v for v in self.strings[column].tolist()]
+                # Inferred, so the column gets the same string dtype read_csv(dtype=str) gives in this pandas version
+                data[column] = pd.Series(values) if any(v is not np.nan for v in values) else pd.Series(values, dtype=object)
+            elif column in INTEGER_COLUMNS:
+                data[column] = pd.arrays.IntegerArray(np.array(self.numbers[column]), np.array(self.missing[column]))
+            else:
+                data[column] = np.array(self.numbers[column])
+        return pd.DataFrame(data, columns=self.columns)
+
+
+# --- Overlays: live catalog changes on top of the read-only snapshot ---
+
+class SnapshotExactIndex:
+    """The CatalogIndex exact tier (lowercase name -> rows) over the snapshot's name hash index."""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+        self.changed = {} # name -> rows, or None once the name has no rows left
+
+    def get(self, name, default=None):
+        rows = self.changed[name] if name in self.changed else self.snapshot.rows_named(name)
+        return rows if rows else default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        # defaultdict(list) semantics: the returned list is the one that gets updated
+        if self.changed.get(name) is None:
+            self.changed[name] = [] if name in self.changed else self.snapshot.rows_named(name)
+        return self.changed[name]
+
+    def __delitem__(self, name):
+        self.changed[name] = None
+
+
+class SnapshotPostings:
+    """The CatalogIndex n-gram postings (gram -> sorted row array) over the snapshot's arrays."""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+        self.changed = {} # gram -> rows, or None once removed
+
+    def get(self, gram, default=None):
+        posting = self.changed[gram] if gram in self.changed else self.snapshot.posting(gram)
+        return default if posting is None else posting
+
+    def __contains__(self, gram):
+        return self.get(gram) is not None
+
+    def __getitem__(self, gram):
+        posting = self.get(gram)
+        if posting is None:
+            raise KeyError(gram)
+        return posting
+
+    def __setitem__(self, gram, posting):
+        self.changed[gram] = posting
+
+    def __delitem__(self, gram):
+        self.changed[gram] = None
+
+
+class SnapshotSearchStrings:
+    """The CatalogIndex processed search strings, decoded per row on access."""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+        self.changed = {}
+        self.length = len(snapshot)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, row):
+        return self.changed[row] if row in self.changed else self.snapshot.search_strings[row]
+
+    def __setitem__(self, row, value):
+        self.changed[row] = value
+
+    def extend(self, values):
+        for value in values:
+            self.changed[self.length] = value
+            self.length += 1
+
+
+class SnapshotCodeRows:
+    """The CatalogIndex Product_Code -> row map over the snapshot's code hash index."""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+        self.changed = {} # code -> row, or None once removed
+
+    def get(self, code, default=None):
+        row = self.changed[code] if code in self.changed else self.snapshot.row_of(code)
+        return default if row is None else row
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __getitem__(self, code):
+        row = self.get(code)
+        if row is None:
+            raise KeyError(code)
+        return row
+
+    def __setitem__(self, code, row):
+        self.changed[code] = row
+
+    def __delitem__(self, code):
+        self.changed[code] = None
+
+
+# --- Building and opening ---
+
+def build_snapshot(csv_path: str, folder: str, checksum=None) -> str:
+    """Compiles the catalog CSV into `folder`. The folder appears complete or not at all."""
+    catalog_df = load_catalog(csv_path)
+    if catalog_df is None:
+        raise FileNotFoundError(csv_path)
+    index = CatalogIndex(catalog_df)
+    df = index.df
+
+    parent = os.path.dirname(os.path.abspath(folder))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".building-", dir=parent)
+    try:
+        columns = list(df.columns)
+        for i, column in enumerate(columns):
+            if column in INTEGER_COLUMNS:
+                values = df[column]
+                np.save(os.path.join(staging, f"col{i}.npy"), values.fillna(0).to_numpy(dtype=np.int64))
+                np.save(os.path.join(staging, f"col{i}.missing.npy"), values.isna().to_numpy())
+            elif column in FLOAT_COLUMNS:
+                np.save(os.path.join(staging, f"col{i}.npy"), df[column].to_numpy(dtype=np.float64))
+            else:
+                StringTable.save(staging, f"col{i}", df[column].tolist())
+        StringTable.save(staging, "search", index.search_strings)
+        HashIndex.save(staging, "names", df['Product_Name'].astype(str).str.lower().tolist())
+        HashIndex.save(staging, "codes", df['Product_Code'].astype(str).tolist())
+
+        grams = sorted(index.postings)
+        with open(os.path.join(staging, "grams.txt"), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(grams))
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(index.postings[gram]) for gram in grams], out=offsets[1:])
+        np.save(os.path.join(staging, "postings.offsets.npy"), offsets)
+        np.save(os.path.join(staging, "postings.rows.npy"),
+                np.concatenate([index.postings[gram] for gram in grams]) if grams else np.zeros(0, dtype=np.int32))
+
+        with open(os.path.join(staging, "meta.json"), 'w') as f:
+            json.dump({"format": SNAPSHOT_FORMAT, "ngram_size": NGRAM_SIZE, "source": csv_path,
+                       "checksum": checksum or file_checksum(csv_path), "rows": len(df), "columns": columns,
+                       "built_at": datetime.utcnow().isoformat()}, f, indent=2)
+        try:
+            os.replace(staging, folder)
+        except OSError:
+            if not os.path.exists(os.path.join(folder, "meta.json")):
+                raise # Anything but another process finishing the same snapshot first
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return folder
+
+
+def open_snapshot(csv_path: str, snapshot_dir: str) -> CatalogSnapshot:
+    """
+    Maps the snapshot of `csv_path`, compiling it first if the CSV changed since the last build.
+
+    The CSV is only checksummed when its size or modification time changed, so an
+    unchanged catalog opens without reading it.
+    """
+    stat = os.stat(csv_path) # FileNotFoundError when the catalog is missing
+    pointer_path = os.path.join(snapshot_dir, POINTER_FILE)
+    try:
+        with open(pointer_path) as f:
+            pointer = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pointer = {}
+
+    folder = pointer.get("folder")
+    if (pointer.get("size"), pointer.get("mtime_ns")) != (stat.st_size, stat.st_mtime_ns) or \
+            not folder or not os.path.exists(os.path.join(snapshot_dir, folder, "meta.json")):
+        checksum = file_checksum(csv_path)
+        folder = f"v{SNAPSHOT_FORMAT}-n{NGRAM_SIZE}-{checksum[:24]}"
+        if not os.path.exists(os.path.join(snapshot_dir, folder, "meta.json")):
+            print(f"🔨 Compiling catalog snapshot for {csv_path}...")
+            build_snapshot(csv_path, os.path.join(snapshot_dir, folder), checksum=checksum)
+            _remove_old_snapshots(snapshot_dir, keep=folder)
+        staged_pointer = f"{pointer_path}.{os.getpid()}.tmp"
+        with open(staged_pointer, 'w') as f:
+            json.dump({"folder": folder, "checksum": checksum, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+        os.replace(staged_pointer, pointer_path)
+
+    return CatalogSnapshot(os.path.join(snapshot_dir, folder))
+
+
+def _remove_old_snapshots(snapshot_dir: str, keep: str):
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        if name != keep and name.startswith("v") and os.path.isdir(path):
+            # Processes that still map the old files keep them until they exit (POSIX)
+            shutil.rmtree(path, ignore_errors=True)
@@ -1,4 +1,5 @@
 from thefuzz import fuzz
+from .address_index import AddressIndex
 
 def find_consolidation_opportunities(new_order_address: str, pending_shipments_df, confidence_threshold=90):
     """
@@ -6,7 +7,8 @@ def find_consolidation_opportunities(new_order_address: str, pending_shipments_d
 
     Args:
         new_order_address (str): The delivery address of the new order.
-        pending_shipments_df (pd.DataFrame): DataFrame of pending shipments.
+        pending_shipments_df (pd.DataFrame or AddressIndex): Pending shipments, either as a
+            DataFrame (scanned in full) or as an AddressIndex (blocked by ZIP and street number).
         confidence_threshold (int): The similarity score required to suggest a match.
 
     Returns:
@@ -15,6 +17,9 @@ def find_consolidation_opportunities(new_order_address: str, pending_shipments_d
     if pending_shipments_df is None or new_order_address is None:
         return []
 
+    if isinstance(pending_shipments_df, AddressIndex):
+        return pending_shipments_df.find_matches(new_order_address, confidence_threshold)
+
     potential_matches = []
     
     # Iterate through each unique pending destination
@@ -1,9 +1,20 @@
+from .alias_store import alias_name_key
 from .inventory_manager import find_product_matches
+from . import metrics
+import numpy as np
 import pandas as pd
 
-def process_and_validate_order(extracted_order: dict, inventory_df: pd.DataFrame):
+def process_and_validate_order(extracted_order: dict, inventory_df, stock_ledger=None, alias_store=None,
+                               learn_aliases=True, reservation_id=None):
     """
     Processes the extracted order, validating against MOQ, ambiguity, and stock levels.
+    `inventory_df` can be the catalog DataFrame or a CatalogIndex built from it.
+
+    If a StockLedger is given, the validated items are also reserved against it so
+    concurrent orders cannot be validated against the same units (under `reservation_id`,
+    if given, so a retried order holds them once). With an AliasStore,
+    the customer's learned aliases are checked before the catalog search, and (with
+    `learn_aliases`) an order validated in full teaches the customer its shorthand.
     """
     if not extracted_order:
         return {"error": "Received empty or invalid extracted order data."}
@@ -25,13 +36,8 @@ def process_and_validate_order(extracted_order: dict, inventory_df: pd.DataFrame
         if not req_name or req_qty <= 0:
             continue
 
-        matches = find_product_matches(req_name, inventory_df)
-        
-        sku_key = 'Product_Code'
-        moq_key = 'Min_Order_Quantity'
-        stock_key = 'Available_in_Stock'
-        name_key = 'Product_Name'
-        price_key = 'Price'
+        matches = find_product_matches(req_name, inventory_df, alias_store=alias_store,
+                                       customer=extracted_order.get("customer_name"))
 
         if not matches:
             final_order["processed_line_items"].append({
@@ -43,12 +49,12 @@ def process_and_validate_order(extracted_order: dict, inventory_df: pd.DataFrame
             final_order["processed_line_items"].append({
                 "requested_name": req_name, "requested_quantity": req_qty,
                 "status": "MULTIPLE_MATCHES_FOUND",
-                "issue": f"Request '{req_name}' is ambiguous. Possible SKUs: {[m[sku_key] for m in matches]}",
+                "issue": f"Request '{req_name}' is ambiguous. Possible SKUs: {[m['Product_Code'] for m in matches]}",
             })
         else:
-            product = matches[0]
-            moq = pd.to_numeric(product.get(moq_key), errors='coerce')
-            stock = pd.to_numeric(product.get(stock_key), errors='coerce')
+            product = matches[0] # A ProductRecord: MOQ and stock are already ints (or None)
+            moq = product.get('Min_Order_Quantity')
+            stock = product.get('Available_in_Stock')
 
             if moq is not None and req_qty < moq:
                 final_order["processed_line_items"].append({
@@ -61,19 +67,184 @@ def process_and_validate_order(extracted_order: dict, inventory_df: pd.DataFrame
                 final_order["processed_line_items"].append({
                     "requested_name": req_name, "requested_quantity": req_qty,
                     "status": "INSUFFICIENT_STOCK",
-                    "issue": f"Requested quantity {req_qty} exceeds available stock of {int(stock)} for '{product[name_key]}'.",
+                    "issue": f"Requested quantity {req_qty} exceeds available stock of {int(stock)} for '{product['Product_Name']}'.",
                     "product_details": product
                 })
             else: # All checks pass, it's a validated item!
-                # --- THIS IS THE FIX ---
-                # We need to create the full dictionary structure here.
                 final_order["processed_line_items"].append({
-                    "requested_name": req_name,
-                    "requested_quantity": req_qty, # Added this back
+                    "requested_name": req_name, "requested_quantity": req_qty,
                     "status": "VALIDATED",
                     "issue": None,
-                    "product_details": product # The full product dict is needed
+                    "product_details": product
                 })
-                # --- END OF FIX ---
-    
-    return final_order
\ No newline at end of file
+
+    if stock_ledger is not None:
+        reserve_validated_items(final_order, stock_ledger, reservation_id)
+    if alias_store is not None and learn_aliases:
+        learn_confirmed_aliases(final_order, alias_store)
+
+    count_line_item_statuses(final_order)
+    return final_order
+
+
+def count_line_item_statuses(final_order: dict):
+    """Adds the order's line items to the per-status counters."""
+    for item in final_order.get("processed_line_items", []):
+        metrics.inc("line_items_total", status=item["status"])
+
+
+def learn_confirmed_aliases(final_order: dict, alias_store) -> int:
+    """
+    Learns the customer's shorthand from an approved order: when every line item was
+    validated, each requested name that differs from its product's name becomes an
+    alias for that customer. Orders with any rejected item teach nothing, since their
+    matches may be wrong. Returns the number of names learned.
+    """
+    line_items = final_order.get("processed_line_items", [])
+    customer = final_order.get("customer_name")
+    if not customer or not line_items or any(item["status"] != "VALIDATED" for item in line_items):
+        return 0
+
+    learned = 0
+    for item in line_items:
+        product = item["product_details"]
+        if alias_name_key(item["requested_name"]) != alias_name_key(product['Product_Name']):
+            alias_store.learn(item["requested_name"], product['Product_Code'], product['Product_Name'], customer=customer)
+            learned += 1
+    return learned
+
+
+def reserve_validated_items(final_order: dict, stock_ledger, reservation_id=None):
+    """
+    Atomically reserves every VALIDATED line item of a processed order.
+
+    Items whose SKU was taken by a concurrent order in the meantime are downgraded to
+    INSUFFICIENT_STOCK and the remaining items are reserved again. The reservation ID
+    is added to the order's `reservation_ids`, so release_reservations can return the
+    units if the order fails or is rejected. A caller's `reservation_id` (e.g. its job's)
+    makes a retry find the units it already holds instead of reserving them again.
+    """
+    while True:
+        validated = [item for item in final_order.get("processed_line_items", []) if item["status"] == "VALIDATED"]
+        if not validated:
+            return None
+
+        lines = []
+        for item in validated:
+            product = item["product_details"]
+            lines.append((product['Product_Code'], item["requested_quantity"], product.get('Available_in_Stock')))
+
+        reserved_id, shortfalls = stock_ledger.reserve(lines, reservation_id)
+        if reserved_id:
+            final_order.setdefault("reservation_ids", []).append(reserved_id)
+            return reserved_id
+
+        for item in validated:
+            product = item["product_details"]
+            if product['Product_Code'] in shortfalls:
+                item["status"] = "INSUFFICIENT_STOCK"
+                item["issue"] = (f"Requested quantity {item['requested_quantity']} exceeds available stock of "
+                                 f"{shortfalls[product['Product_Code']]} for '{product['Product_Name']}'.")
+
+def release_reservations(final_order: dict, stock_ledger) -> int:
+    """Returns the units held for a processed order to the ledger. Returns the number of reservations released."""
+    if stock_ledger is None or not final_order:
+        return 0
+    return sum(1 for reservation_id in final_order.get("reservation_ids", []) if stock_ledger.release(reservation_id))
+
+def process_and_validate_orders(extracted_orders: list, inventory_df, stock_ledger=None, alias_store=None):
+    """
+    Batch version of process_and_validate_order for many extracted orders at once.
+
+    All line items are flattened into one frame, every distinct requested name is
+    resolved against the catalog once (once per customer with an AliasStore), and the
+    ambiguity, MOQ and stock rules are applied as column operations. Returns one final order per input, in the same
+    shape (and with the same statuses and issues) as process_and_validate_order.
+    """
+    final_orders = []
+    line_rows = []
+    for order_pos, extracted_order in enumerate(extracted_orders):
+        if not extracted_order:
+            final_orders.append({"error": "Received empty or invalid extracted order data."})
+            continue
+
+        final_orders.append({
+            "customer_name": extracted_order.get("customer_name"),
+            "delivery_address": extracted_order.get("delivery_address"),
+            "delivery_date": extracted_order.get("delivery_date"),
+            "customer_notes": extracted_order.get("customer_notes"),
+            "processed_line_items": [],
+        })
+        for item in extracted_order.get("products", []):
+            req_name = item.get("product_name")
+            req_qty = int(item.get("quantity", 0))
+            if req_name and req_qty > 0:
+                # Aliases are per customer, so with an AliasStore a name is resolved once per customer
+                customer = extracted_order.get("customer_name") if alias_store is not None else None
+                line_rows.append((order_pos, req_name, req_qty, (customer, req_name)))
+
+    if not line_rows:
+        return final_orders
+
+    lines = pd.DataFrame(line_rows, columns=["order_pos", "requested_name", "requested_quantity", "match_key"])
+
+    # --- Resolve each distinct requested name once ---
+    matches_by_name = {key: find_product_matches(key[1], inventory_df, alias_store=alias_store, customer=key[0])
+                       for key in dict.fromkeys(lines["match_key"])}
+    lines["match_count"] = lines["match_key"].map(lambda key: len(matches_by_name[key]))
+
+    # --- Coerce MOQ and stock once, for the products that resolved to a single match ---
+    single_keys = [key for key, matches in matches_by_name.items() if len(matches) == 1]
+    products = pd.DataFrame({
+        "match_key": single_keys,
+        "moq": pd.to_numeric(pd.Series([matches_by_name[n][0].get('Min_Order_Quantity') for n in single_keys], dtype=object), errors='coerce'),
+        "stock": pd.to_numeric(pd.Series([matches_by_name[n][0].get('Available_in_Stock') for n in single_keys], dtype=object), errors='coerce'),
+    })
+    lines = lines.merge(products, on="match_key", how="left")
+
+    # --- Apply the rules as column operations (NaN comparisons are False, as in the scalar checks) ---
+    qty = lines["requested_quantity"]
+    lines["status"] = np.select(
+        [lines["match_count"] == 0, lines["match_count"] > 1, qty < lines["moq"], lines["stock"] < qty],
+        ["NOT_FOUND", "MULTIPLE_MATCHES_FOUND", "MOQ_NOT_MET", "INSUFFICIENT_STOCK"],
+        default="VALIDATED",
+    )
+
+    for row in lines.itertuples(index=False):
+        req_name, req_qty, status = row.requested_name, row.requested_quantity, row.status
+        matches = matches_by_name[row.match_key]
+        line_item = {"requested_name": req_name, "requested_quantity": req_qty, "status": status}
+
+        if status == "NOT_FOUND":
+            line_item["issue"] = f"No product found matching '{req_name}'."
+        elif status == "MULTIPLE_MATCHES_FOUND":
+            line_item["issue"] = f"Request '{req_name}' is ambiguous. Possible SKUs: {[m['Product_Code'] for m in matches]}"
+        else:
+            product = matches[0] # Immutable, so the record is shared instead of copied per line item
+            if status == "MOQ_NOT_MET":
+                line_item["issue"] = f"Quantity {req_qty} is below the Minimum Order Quantity of {_format_quantity(row.moq)}."
+            elif status == "INSUFFICIENT_STOCK":
+                line_item["issue"] = f"Requested quantity {req_qty} exceeds available stock of {int(row.stock)} for '{product['Product_Name']}'."
+            else:
+                line_item["issue"] = None
+            line_item["product_details"] = product
+
+        final_orders[row.order_pos]["processed_line_items"].append(line_item)
+
+    if stock_ledger is not None:
+        for final_order in final_orders:
+            reserve_validated_items(final_order, stock_ledger)
+    if alias_store is not None:
+        for final_order in final_orders:
+            learn_confirmed_aliases(final_order, alias_store)
+
+    for final_order in final_orders:
+        count_line_item_statuses(final_order)
+    return final_orders
+
+
+def _format_quantity(value):
+    """Prints whole-number quantities without the '.0' a float column would add."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
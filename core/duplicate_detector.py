@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import numpy as np
+
+from .extraction_cache import normalize_email_body
+from .rule_parser import parse_product_line
+
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = 4294967311 # Smallest prime above 2**32, so (a * x + b) never overflows uint64
+
+# Reply/forward boilerplate that differs between copies of the same order
+_HEADER_LINE = re.compile(r'^(from|to|cc|bcc|sent|date|subject|reply-to)\s*:', re.IGNORECASE)
+_SEPARATOR_LINE = re.compile(r'^(-{2,}\s*(original message|forwarded message)\s*-{2,}|begin forwarded message\s*:?|on .{0,200} wrote\s*:)$',
+                             re.IGNORECASE)
+_SUBJECT_PREFIX = re.compile(r'^((re|fw|fwd|aw|sv|vs)\s*:\s*)+', re.IGNORECASE)
+
+
+def strip_quoting(email_body: str) -> str:
+    """
+    Removes what a reply or forward adds around an order: '>' quote markers, reply and
+    forward separators, and quoted From/Sent/Subject headers. The quoted text itself
+    is kept, since a follow-up usually carries the original order.
+    """
+    lines = []
+    for line in normalize_email_body(email_body).split('\n'):
+        line = re.sub(r'^(\s*>)+', '', line).strip()
+        if _HEADER_LINE.match(line) or _SEPARATOR_LINE.match(line):
+            continue
+        lines.append(_SUBJECT_PREFIX.sub('', line))
+    return '\n'.join(lines)
+
+
+def shingles(email_body: str, size=SHINGLE_SIZE) -> np.ndarray:
+    """The distinct word `size`-grams of the stripped, lowercased body, as sorted 32-bit hashes."""
+    words = re.findall(r'\w+', strip_quoting(email_body).lower())
+    if len(words) < size:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams)))
+
+
+def order_numbers(email_body: str) -> Counter:
+    """
+    The numbers of the order an email carries (quantities, SKUs, dates), with their counts.
+    In a reply or forward that is the quoted text plus any product lines the sender wrote
+    around it; other numbers they add (a phone number, a ticket number) are left out.
+    """
+    quoted, own, forwarded = [], [], False
+    for line in normalize_email_body(email_body).split('\n'):
+        is_quoted = bool(re.match(r'^\s*>', line))
+        line = re.sub(r'^(\s*>)+', '', line).strip()
+        if _SEPARATOR_LINE.match(line):
+            forwarded = True # Everything below a reply or forward separator is the earlier email
+            continue
+        if _HEADER_LINE.match(line):
+            continue
+        (quoted if is_quoted or forwarded else own).append(_SUBJECT_PREFIX.sub('', line))
+    lines = quoted + [line for line in own if parse_product_line(line)] if quoted else own
+    return Counter(number for line in lines for number in re.findall(r'\d+(?:[.,]\d+)?', line))
+
+
+@dataclass
+class DuplicateMatch:
+    entry_id: int
+    similarity: float
+    created_at: float
+    order_ref: dict
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class DuplicateDetector:
+    """
+    Finds emails that are near-duplicates of recently processed ones (resends, forwards,
+    "just following up on my order below").
+
+    Each email is reduced to a MinHash signature of its word shingles, after
+    `strip_quoting`. The signature is split into LSH bands, and every band is stored as
+    an indexed bucket key in SQLite. A lookup reads only the emails that share a bucket
+    with the new one, so its cost does not grow with the number of stored emails.
+    Each candidate is then scored by the shingles the two emails share, as a share of
+    the larger one, so neither email may add much text the other lacks. A candidate
+    needs at least `threshold`, and both emails must hold the same order numbers
+    (for a reply, those of the quoted order and any product lines added). A revised
+    order that changes one quantity, or repeats an order and adds a line, shares
+    almost all of its shingles with the original, but it is a new order, not a copy.
+
+    Emails older than `window_seconds` no longer count as duplicates and are evicted,
+    as are the oldest ones beyond `max_entries`.
+    """
+
+    def __init__(self, path: str, threshold=0.8, window_seconds=7 * 24 * 3600, max_entries=500000,
+                 num_perm=64, bands=16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands.")
+        self.path = path
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+
+        # The same seeded permutations in every process, so stored signatures stay comparable
+        rng = np.random.default_rng(42)
+        self._a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS emails ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, shingles BLOB NOT NULL,"
+            " numbers TEXT NOT NULL DEFAULT '', order_ref TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_emails_created ON emails (created_at);"
+            "CREATE TABLE IF NOT EXISTS lsh_buckets (bucket INTEGER NOT NULL, email_id INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_lsh_bucket ON lsh_buckets (bucket);"
+            "CREATE INDEX IF NOT EXISTS idx_lsh_email ON lsh_buckets (email_id);"
+        )
+
+    def signature(self, email_body: str):
+        """The email's MinHash signature (uint32 per permutation), or None if it has no words."""
+        return self._signature(shingles(email_body))
+
+    def _signature(self, hashes):
+        if not len(hashes):
+            return None
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return (permuted.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    def _buckets(self, signature) -> list:
+        """One signed 64-bit key per band (SQLite INTEGER), mixing in the band number."""
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            digest = hashlib.blake2b(bytes([band]) + chunk.tobytes(), digest_size=8).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+
+    def _find(self, hashes, buckets, numbers, now):
+        placeholders = ",".join("?" * len(buckets))
+        # '+' keeps the planner on the bucket index instead of scanning the window by created_at
+        rows = self._conn.execute(
+            f"SELECT DISTINCT e.id, e.created_at, e.shingles, e.numbers, e.order_ref FROM lsh_buckets b"
+            f" JOIN emails e ON e.id = b.email_id WHERE b.bucket IN ({placeholders}) AND +e.created_at >= ?",
+            [*buckets, now - self.window_seconds]
+        ).fetchall()
+        best = None
+        for entry_id, created_at, stored, stored_numbers, order_ref in rows:
+            if Counter(stored_numbers.split()) != numbers:
+                continue
+            stored = np.frombuffer(stored, dtype=np.uint32)
+            shared = np.count_nonzero(np.isin(stored, hashes, assume_unique=True))
+            # Both directions: a wrapper around the stored order is fine, a longer order is not
+            similarity = shared / max(len(stored), len(hashes))
+            if similarity < self.threshold:
+                continue
+            if best is None or similarity > best.similarity:
+                best = DuplicateMatch(entry_id, similarity, created_at, json.loads(order_ref) if order_ref else {})
+        return best
+
+    def find(self, email_body: str):
+        """Returns the most similar recent email as a DuplicateMatch, or None."""
+        hashes = shingles(email_body).astype(np.uint32)
+        signature = self._signature(hashes)
+        if signature is None:
+            return None
+        with self._lock:
+            return self._find(hashes, self._buckets(signature), order_numbers(email_body), time.time())
+
+    def register(self, email_body: str, order_ref: Optional[dict] = None):
+        """
+        Checks an email before it is processed and remembers it if it is new.
+
+        Returns (entry_id, None) for a new email, or (None, DuplicateMatch) for a near-duplicate
+        of one seen within the window. Check and insert happen in one transaction, so of two
+        copies processed at the same time only the first is treated as new. An email
+        registered again with the same `job_id` in its order_ref (a retried job) gets its own
+        entry back instead of being reported as its own duplicate.
+        """
+        order_ref = order_ref or {}
+        hashes = shingles(email_body).astype(np.uint32)
+        signature = self._signature(hashes)
+        if signature is None:
+            return None, None
+        buckets = self._buckets(signature)
+        numbers = order_numbers(email_body)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                match = self._find(hashes, buckets, numbers, now)
+                if match is not None:
+                    self._conn.execute("COMMIT")
+                    if order_ref.get("job_id") is not None and match.order_ref.get("job_id") == order_ref["job_id"]:
+                        return match.entry_id, None
+                    return None, match
+
+                entry_id = self._conn.execute(
+                    "INSERT INTO emails (created_at, shingles, numbers, order_ref) VALUES (?, ?, ?, ?)",
+                    (now, hashes.tobytes(), " ".join(numbers.elements()), json.dumps(order_ref))
+                ).lastrowid
+                self._conn.executemany("INSERT INTO lsh_buckets (bucket, email_id) VALUES (?, ?)",
+                                       [(bucket, entry_id) for bucket in buckets])
+                self._evict(now, entry_id)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return entry_id, None
+
+    def _evict(self, now, newest_id):
+        """Drops entries outside the window and the oldest beyond max_entries (IDs only grow)."""
+        # Two range deletes, each on its own index, so eviction costs what it removes
+        for stale, param in (("created_at < ?", now - self.window_seconds), ("id <= ?", newest_id - self.max_entries)):
+            self._conn.execute(f"DELETE FROM lsh_buckets WHERE email_id IN (SELECT id FROM emails WHERE {stale})", (param,))
+            self._conn.execute(f"DELETE FROM emails WHERE {stale}", (param,))
+
+    def update(self, entry_id, **order_ref):
+        """Adds details of the finished order (order_id, json_path, pdf_path, ...) to a registered email."""
+        if entry_id is None:
+            return
+        with self._lock:
+            row = self._conn.execute("SELECT order_ref FROM emails WHERE id = ?", (entry_id,)).fetchone()
+            if row is not None:
+                merged = {**(json.loads(row[0]) if row[0] else {}), **order_ref}
+                self._conn.execute("UPDATE emails SET order_ref = ? WHERE id = ?", (json.dumps(merged), entry_id))
+
+    def discard(self, entry_id):
+        """Forgets a registered email whose processing failed, so a resend is processed normally."""
+        if entry_id is None:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM lsh_buckets WHERE email_id = ?", (entry_id,))
+            self._conn.execute("DELETE FROM emails WHERE id = ?", (entry_id,))
+            self._conn.execute("COMMIT")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
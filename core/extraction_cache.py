@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def normalize_email_body(email_body: str) -> str:
+    """Normalizes line endings and surrounding whitespace so trivially different copies share a key."""
+    lines = str(email_body).replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(line.rstrip() for line in lines)).strip()
+
+
+def make_cache_key(email_body: str, *versioning_parts) -> str:
+    """Hashes the normalized email body together with the prompt, schema and model version."""
+    digest = hashlib.sha256()
+    for part in (normalize_email_body(email_body),) + tuple(str(p) for p in versioning_parts):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Disk-backed (SQLite) cache of LLM extraction results.
+
+    Entries expire after `ttl_seconds`, and once the cache holds more than
+    `max_entries` the least recently used entries are evicted. Values are stored
+    as JSON, so a hit returns the same plain-dict structure the extractor built.
+    """
+
+    def __init__(self, path: str, max_entries=10000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_last_access ON extractions (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Returns the cached extraction for `key`, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                with self._conn:
+                    self._conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            with self._conn:
+                self._conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(value)
+
+    def put(self, key: str, value: dict):
+        """Stores an extraction result and evicts the least recently used entries over the size bound."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM extractions WHERE key IN"
+                    " (SELECT key FROM extractions ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
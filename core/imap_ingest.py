@@ -0,0 +1,170 @@
+import imaplib
+import json
+import os
+import time
+
+from imap_tools import MailBox, AND, U
+
+# Errors of the connection itself, which end an IDLE wait with a reconnect rather than a fallback to polling
+CONNECTION_ERRORS = (OSError, imaplib.IMAP4.abort)
+
+
+def _sleep(seconds, stop_event=None):
+    """Sleeps, waking early if `stop_event` is set."""
+    if stop_event is not None:
+        stop_event.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def load_uid_state(path: str) -> dict:
+    """Reads the {'uidvalidity', 'last_uid'} checkpoint; empty if there is none yet."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_uid_state(path: str, state: dict):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder): os.makedirs(folder)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path) # Atomic, so a crash never leaves a half-written checkpoint
+
+
+class ImapIngestor:
+    """
+    Long-running IMAP reader that hands each new message to the pipeline.
+
+    The UID of the last handled message is checkpointed to `state_path`, so
+    only messages that arrived since then are fetched (in batches of `batch_size`),
+    across restarts too. A message whose handler raised is not checkpointed: it is
+    retried, before any newer mail, up to `max_attempts` times, then recorded in the
+    state's `failed_uids` and skipped. Between fetches it waits in IMAP IDLE, or polls
+    every `poll_interval` seconds when IDLE is disabled or unsupported. A dropped
+    connection (or any other IMAP error) is reconnected with exponential backoff, up
+    to `max_reconnect_delay` seconds between attempts.
+
+    `mailbox_factory` creates the mailbox object (imap_tools.MailBox by default);
+    a local stand-in with the same login/fetch/idle/folder interface can be passed
+    for testing.
+    """
+
+    def __init__(self, server, account, password, folder="INBOX", state_path="output/.state/imap_state.json",
+                 batch_size=50, poll_interval=10, use_idle=True, mailbox_factory=None, max_attempts=3,
+                 max_reconnect_delay=300):
+        self.server = server
+        self.account = account
+        self.password = password
+        self.folder = folder
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.use_idle = use_idle
+        self.mailbox_factory = mailbox_factory or MailBox
+        self.max_attempts = max_attempts
+        self.max_reconnect_delay = max_reconnect_delay
+        self.state = load_uid_state(state_path)
+        self.mailbox = None
+
+    def connect(self):
+        self.mailbox = self.mailbox_factory(self.server).login(self.account, self.password, initial_folder=self.folder)
+        status = self.mailbox.folder.status(self.folder, ['UIDVALIDITY', 'UIDNEXT'])
+        uidvalidity = int(status['UIDVALIDITY'])
+
+        if self.state.get('uidvalidity') != uidvalidity:
+            # First run, or the server renumbered the folder: old UIDs mean nothing any more,
+            # so start after the newest message instead of reprocessing the whole folder.
+            if self.state:
+                print(f"⚠️ UIDVALIDITY of '{self.folder}' changed; resuming from the newest message.")
+            self.state = {'uidvalidity': uidvalidity, 'last_uid': int(status['UIDNEXT']) - 1}
+            save_uid_state(self.state_path, self.state)
+        print(f"📬 Connected to {self.server}/{self.folder}, last processed UID {self.state['last_uid']}.")
+
+    def fetch_new(self):
+        """Returns up to `batch_size` messages newer than the checkpoint, oldest first."""
+        last_uid = self.state['last_uid']
+        messages = self.mailbox.fetch(AND(uid=U(last_uid + 1, '*')), mark_seen=False, limit=self.batch_size, bulk=True)
+        # 'N:*' always includes the newest message, even when its UID is <= N
+        return sorted((msg for msg in messages if int(msg.uid) > last_uid), key=lambda msg: int(msg.uid))
+
+    def _wait_for_mail(self, stop_event=None):
+        if self.use_idle:
+            idle = getattr(self.mailbox, "idle", None)
+            if idle is None:
+                print(f"⚠️ This imap-tools version has no IDLE support; polling every {self.poll_interval}s.")
+                self.use_idle = False
+            else:
+                try:
+                    idle.wait(timeout=self.poll_interval)
+                    return
+                except CONNECTION_ERRORS:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ IDLE not available ({e}); falling back to polling every {self.poll_interval}s.")
+                    self.use_idle = False
+        _sleep(self.poll_interval, stop_event)
+
+    def _handle(self, message, handle_message) -> bool:
+        """
+        Runs the handler for one message and checkpoints it, unless the handler raised
+        and the message has attempts left. Returns False if it is to be retried.
+        """
+        uid = int(message.uid)
+        failures = self.state.setdefault('failures', {})
+        try:
+            handle_message(message.text or message.html, message)
+        except Exception as e:
+            attempts = failures.get(str(uid), 0) + 1
+            if attempts < self.max_attempts:
+                failures[str(uid)] = attempts
+                save_uid_state(self.state_path, self.state)
+                print(f"❌ Failed to process message UID {uid} (attempt {attempts} of {self.max_attempts}): {e}")
+                return False
+            print(f"❌ Giving up on message UID {uid} after {attempts} attempts: {e}")
+            self.state.setdefault('failed_uids', []).append(uid)
+        failures.pop(str(uid), None)
+        # Checkpoint after every handled message, so a crash never replays finished orders
+        self.state['last_uid'] = uid
+        save_uid_state(self.state_path, self.state)
+        return True
+
+    def run_forever(self, handle_message, stop_event=None):
+        """
+        Feeds each new message body to `handle_message(body, message)` as it arrives.
+        Runs until `stop_event` (a threading.Event) is set.
+        """
+        reconnects = 0
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if self.mailbox is None:
+                    self.connect()
+                batch = self.fetch_new()
+                reconnects = 0
+                handled = all(self._handle(message, handle_message) for message in batch)
+
+                # A full batch means more mail is probably waiting; fetch again straight away.
+                # After a failure, the failed message is retried once the wait is over.
+                if not handled or len(batch) < self.batch_size:
+                    self._wait_for_mail(stop_event)
+            except Exception as e:
+                delay = min(self.max_reconnect_delay, 2 ** reconnects)
+                reconnects += 1
+                print(f"⚠️ IMAP connection to {self.server} failed ({type(e).__name__}: {e}); reconnecting in {delay}s.")
+                self._disconnect()
+                _sleep(delay, stop_event)
+
+    def _disconnect(self):
+        """Drops a broken connection without failing on the logout."""
+        try:
+            self.close()
+        except Exception:
+            self.mailbox = None
+
+    def close(self):
+        if self.mailbox is not None:
+            mailbox, self.mailbox = self.mailbox, None
+            mailbox.logout()
@@ -1,6 +1,8 @@
 import pandas as pd
-from thefuzz import process, fuzz
-import re
+from thefuzz import process, fuzz, utils as fuzz_utils
+from .catalog_index import CatalogIndex, normalize_product_name
+from .models import ProductRecord
+from . import metrics
 
 def load_data(path: str):
     """Loads data from a CSV file, ensuring all columns are read as strings to prevent type errors."""
@@ -10,16 +12,110 @@ def load_data(path: str):
         print(f"❌ ERROR: Data file not found at path: {path}")
         return None
 
-def find_product_matches(requested_name: str, inventory_df: pd.DataFrame, confidence_threshold=90): # Increased threshold
+def load_catalog(path: str):
+    """
+    Loads the product catalog with typed columns: integer stock and MOQ (nullable Int64),
+    float price and string names, so numbers don't have to be re-parsed per order.
+    """
+    try:
+        catalog_df = pd.read_csv(path, dtype={"Product_Code": str, "Product_Name": str, "Description": str})
+    except FileNotFoundError:
+        print(f"❌ ERROR: Data file not found at path: {path}")
+        return None
+    catalog_df["Price"] = pd.to_numeric(catalog_df["Price"], errors='coerce').astype("float64")
+    for column in ("Available_in_Stock", "Min_Order_Quantity"):
+        catalog_df[column] = pd.to_numeric(catalog_df[column], errors='coerce').astype("Int64")
+    return catalog_df
+
+def build_catalog_index(inventory_df: pd.DataFrame):
+    """Builds the searchable CatalogIndex once so it can be reused for every order."""
+    if inventory_df is None:
+        return None
+    return CatalogIndex(inventory_df)
+
+def find_product_matches(requested_name: str, inventory_df, confidence_threshold=90, alias_store=None, customer=None): # Increased threshold
     """
     Finds product matches using a two-tiered approach:
     1. Tries for a high-confidence, exact match in the product name.
     2. If that fails, uses a fuzzy search as a fallback.
+
+    `inventory_df` can be the catalog DataFrame (linear scan) or a prebuilt CatalogIndex.
+
+    With an AliasStore, a learned alias for the name (the customer's, else the global one)
+    answers before both tiers, so repeat requests skip fuzzy scoring. Aliases are learned
+    from approved orders by the decision engine, not from the matches found here.
     """
     if inventory_df is None or requested_name is None:
         return []
 
-    clean_requested_name = re.sub(r'\s*\([^)]*\)', '', requested_name).strip().lower()
+    if alias_store is not None:
+        product = _find_alias_match(requested_name, inventory_df, alias_store, customer)
+        if product is not None:
+            metrics.inc("catalog_matches_total", tier="alias")
+            return [product]
+
+    if isinstance(inventory_df, CatalogIndex):
+        matches, _ = _find_indexed_product_matches(requested_name, inventory_df, confidence_threshold)
+    else:
+        matches, _ = _find_scanned_product_matches(requested_name, inventory_df, confidence_threshold)
+    return matches
+
+def has_product_match(requested_name: str, inventory_df, confidence_threshold=90) -> bool:
+    """
+    Whether find_product_matches would find anything for the name. Not counted in the match
+    metrics, so a pre-check (the rule parser's) doesn't count the same request twice, and the
+    exact tier answers without any fuzzy scoring.
+    """
+    if inventory_df is None or requested_name is None:
+        return False
+    if isinstance(inventory_df, CatalogIndex):
+        with inventory_df.lock.reading():
+            return (inventory_df.exact_match(requested_name) is not None
+                    or bool(inventory_df.fuzzy_matches(requested_name, confidence_threshold, limit=1, count=False)))
+    clean_requested_name = normalize_product_name(requested_name)
+    names = inventory_df['Product_Name'].astype(str).str.lower()
+    if (names == clean_requested_name).sum() == 1:
+        return True
+    search_strings = names + " " + inventory_df['Description'].astype(str).fillna('').str.lower()
+    return process.extractOne(clean_requested_name, search_strings, scorer=fuzz.WRatio,
+                              score_cutoff=confidence_threshold) is not None
+
+def mentions_catalog_product(text: str, inventory_df) -> bool:
+    """Whether free text contains a word of some product's name, e.g. 'also add a Sofa VIKTMARK'."""
+    words = [word for word in fuzz_utils.full_process(str(text), force_ascii=True).split()
+             if len(word) >= 3 and word.isalpha()]
+    if inventory_df is None or not words:
+        return False
+    if isinstance(inventory_df, CatalogIndex):
+        with inventory_df.lock.reading():
+            return any(inventory_df.has_name_word(word) for word in words)
+    names = inventory_df['Product_Name'].astype(str).map(lambda name: fuzz_utils.full_process(name, force_ascii=True))
+    return not set(words).isdisjoint(word for name in names for word in name.split())
+
+def _find_alias_match(requested_name: str, inventory_df, alias_store, customer=None):
+    """Returns the aliased product as a ProductRecord, or None if there is no alias or its product changed."""
+    alias = alias_store.lookup(requested_name, customer)
+    if alias is None:
+        return None
+    product_code, product_name = alias
+
+    if isinstance(inventory_df, CatalogIndex):
+        with inventory_df.lock.reading():
+            row = inventory_df.row_of(product_code)
+            product = None if row is None else inventory_df.record(row, match_confidence=100)
+    else:
+        rows = inventory_df.index[inventory_df['Product_Code'].astype(str) == product_code]
+        product = None if len(rows) == 0 else ProductRecord.from_row(inventory_df.loc[rows[0]], row=rows[0], match_confidence=100)
+
+    # Removed or renamed since the alias was learned (e.g. the CSV changed between runs)
+    if product is None or (product_name is not None and product.Product_Name != product_name):
+        alias_store.expire_products([product_code])
+        return None
+    return product
+
+def _find_scanned_product_matches(requested_name: str, inventory_df, confidence_threshold=90):
+    """The two tiers as a scan over the catalog DataFrame. Returns (matches, tier)."""
+    clean_requested_name = normalize_product_name(requested_name)
 
     # --- TIER 1: High-Confidence Exact Match ---
     # Create a lowercase version of the Product_Name column for direct comparison
@@ -30,9 +126,9 @@ def find_product_matches(requested_name: str, inventory_df: pd.DataFrame, confid
     
     if len(perfect_match_df) == 1:
         # Found one perfect match, no need for fuzzy search!
-        product = perfect_match_df.iloc[0].to_dict()
-        product['match_confidence'] = 100
-        return [product] # Return it as a list with one item
+        product = ProductRecord.from_row(perfect_match_df.iloc[0], row=perfect_match_df.index[0], match_confidence=100)
+        metrics.inc("catalog_matches_total", tier="exact")
+        return [product], "exact" # Return it as a list with one item
 
     # --- TIER 2: Fuzzy Search Fallback ---
     # If no single perfect match was found, proceed with the fuzzy search.
@@ -48,19 +144,28 @@ def find_product_matches(requested_name: str, inventory_df: pd.DataFrame, confid
         score_cutoff=confidence_threshold, # Use a higher threshold for better accuracy
         limit=5
     )
+    metrics.inc("fuzzy_candidates_scored_total", len(inventory_df))
+    metrics.inc("catalog_matches_total", tier="fuzzy" if matches else "none")
 
     if not matches:
-        return []
+        return [], "none"
+
+    # Records carry typed price, stock and MOQ, so nothing is re-coerced per line item
+    return [ProductRecord.from_row(inventory_df.loc[match_tuple[2]], row=match_tuple[2], match_confidence=match_tuple[1])
+            for match_tuple in matches], "fuzzy"
+
+def _find_indexed_product_matches(requested_name: str, catalog_index: CatalogIndex, confidence_threshold=90):
+    """
+    Same two tiers as find_product_matches, answered from the CatalogIndex instead of a scan. Returns (matches, tier).
+    Holds the index's read lock throughout, so a concurrent catalog change is seen entirely or not at all.
+    """
+    with catalog_index.lock.reading():
+        exact_row = catalog_index.exact_match(requested_name)
+        if exact_row is not None:
+            metrics.inc("catalog_matches_total", tier="exact")
+            return [catalog_index.record(exact_row, match_confidence=100)], "exact"
 
-    matched_products = []
-    for match_tuple in matches:
-        product_details = inventory_df.iloc[match_tuple[2]].to_dict()
-        
-        product_details['Available_in_Stock'] = pd.to_numeric(product_details.get('Available_in_Stock'), errors='coerce')
-        product_details['Min_Order_Quantity'] = pd.to_numeric(product_details.get('Min_Order_Quantity'), errors='coerce')
-        product_details['Price'] = pd.to_numeric(product_details.get('Price'), errors='coerce')
-        
-        product_details['match_confidence'] = match_tuple[1]
-        matched_products.append(product_details)
-
-    return matched_products
\ No newline at end of file
+        fuzzy_matches = catalog_index.fuzzy_matches(requested_name, confidence_threshold)
+        records = [catalog_index.record(row, match_confidence=score) for row, score in fuzzy_matches]
+    metrics.inc("catalog_matches_total", tier="fuzzy" if records else "none")
+    return records, "fuzzy" if records else "none"
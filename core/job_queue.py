@@ -0,0 +1,409 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from .decision_engine import release_reservations
+from .output_generator import build_sales_order, new_sales_order_json_path, write_sales_order_json
+from .pdf_writer import render_sales_order_pdf
+from .models import ProductRecord, SalesOrder
+from . import metrics
+
+# The pipeline stages, in order. A job's `stage` is the last one it completed.
+# With a duplicate detector, "dedupe" runs first; a job whose email repeats an earlier
+# order records "duplicate" (the DuplicateMatch) instead and completes there.
+STAGES = ["dedupe", "extract", "validate", "json", "pdf"]
+# Recorded (with the attempt number) when batched extraction, per-email fallback included,
+# found no order, so process_job fails that attempt without asking the LLM a third time
+EXTRACT_FAILED = "extract_failed"
+# Recorded before the "json" stage writes anything: the sales order and the JSON path it goes
+# to, so a retry after a crash rewrites that file instead of creating a second one
+JSON_INTENT = "json_intent"
+
+
+def job_reservation_id(job) -> str:
+    """The job's key in the StockLedger, so a retried validation holds its units once."""
+    return f"job-{job.id}"
+
+
+def _encode(value):
+    """JSON fallback for stage results: ProductRecords as dicts, anything else as a string."""
+    return value.to_dict() if isinstance(value, ProductRecord) else str(value)
+
+
+class QueueFullError(Exception):
+    """Raised when accepting more jobs would exceed the queue depth limit."""
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker writes to a job whose lease expired and went to another worker."""
+
+
+@dataclass
+class Job:
+    id: int
+    payload: str
+    stage: str = None
+    attempts: int = 0
+    results: dict = field(default_factory=dict)  # stage -> stored intermediate result
+    lease_owner: str = None
+
+    def is_done(self, stage: str) -> bool:
+        return stage in self.results
+
+
+class JobQueue:
+    """
+    Durable SQLite job queue for order emails.
+
+    Each job records its progress through extract -> validate -> json -> pdf and
+    the intermediate result of every completed stage, so after a crash a job
+    resumes from its last checkpoint (the paid LLM call is never repeated once
+    recorded). Workers claim jobs with a lease; a job whose lease expires
+    (its worker died) becomes claimable again. Checkpoints, completions and
+    failures given the lease `owner` only apply while that worker still holds the
+    lease, and checkpoints renew it, so a worker that lost a job to another can't
+    overwrite its progress.
+
+    Enqueues, claims and completions work on lists and commit once per call, and
+    the database runs in WAL mode, so batches of thousands go through per second.
+    """
+
+    def __init__(self, path: str, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'PENDING', stage TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_owner TEXT, lease_expires REAL, error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, lease_expires);"
+            "CREATE TABLE IF NOT EXISTS stage_results ("
+            " job_id INTEGER NOT NULL, stage TEXT NOT NULL, result TEXT,"
+            " PRIMARY KEY (job_id, stage));"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT under the connection lock, so other processes see all or nothing."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, payload: str) -> int:
+        return self.enqueue_many([payload])[0]
+
+    def enqueue_many(self, payloads, max_depth=None) -> list:
+        """
+        Adds jobs in one transaction and returns their IDs. With `max_depth`, raises
+        QueueFullError instead if the pending and running jobs would exceed it; the check
+        and the insert share the transaction, so concurrent processes can't overshoot.
+        """
+        payloads = list(payloads)
+        now = time.time()
+        with self._transaction() as conn:
+            if max_depth is not None:
+                depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('PENDING', 'RUNNING')").fetchone()[0]
+                if depth + len(payloads) > max_depth:
+                    raise QueueFullError(f"Queue depth limit of {max_depth} reached ({depth} in progress).")
+            return [
+                conn.execute("INSERT INTO jobs (payload, created_at, updated_at) VALUES (?, ?, ?)", (payload, now, now)).lastrowid
+                for payload in payloads
+            ]
+
+    def claim(self, worker_id=None, limit=1, lease_seconds=None) -> list:
+        """Leases up to `limit` pending (or abandoned) jobs to a worker, with their stored stage results."""
+        worker_id = worker_id or uuid.uuid4().hex
+        now = time.time()
+        lease_expires = now + (lease_seconds or self.lease_seconds)
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, payload, stage, attempts FROM jobs"
+                " WHERE status = 'PENDING' OR (status = 'RUNNING' AND lease_expires < ?)"
+                " ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if not rows:
+                return []
+            conn.executemany(
+                "UPDATE jobs SET status = 'RUNNING', lease_owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                " updated_at = ? WHERE id = ?",
+                [(worker_id, lease_expires, now, row[0]) for row in rows]
+            )
+            jobs = {row[0]: Job(id=row[0], payload=row[1], stage=row[2], attempts=row[3] + 1, lease_owner=worker_id)
+                    for row in rows}
+            placeholders = ",".join("?" * len(jobs))
+            for job_id, stage, result in conn.execute(
+                    f"SELECT job_id, stage, result FROM stage_results WHERE job_id IN ({placeholders})", list(jobs)):
+                jobs[job_id].results[stage] = json.loads(result)
+        return list(jobs.values())
+
+    @staticmethod
+    def _lost(conn, job_ids, owner) -> set:
+        """The jobs among `job_ids` that are no longer running under `owner`'s lease."""
+        job_ids = set(job_ids)
+        if owner is None or not job_ids:
+            return set()
+        placeholders = ",".join("?" * len(job_ids))
+        held = {row[0] for row in conn.execute(
+            f"SELECT id FROM jobs WHERE id IN ({placeholders}) AND status = 'RUNNING' AND lease_owner = ?",
+            [*job_ids, owner])}
+        return job_ids - held
+
+    def renew(self, job_ids, owner: str, lease_seconds=None) -> set:
+        """Extends `owner`'s leases on the jobs. Returns the IDs of those whose lease it no longer holds."""
+        now = time.time()
+        job_ids = list(job_ids)
+        with self._transaction() as conn:
+            lost = self._lost(conn, job_ids, owner)
+            conn.executemany(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ?",
+                [(now + (lease_seconds or self.lease_seconds), now, job_id) for job_id in job_ids if job_id not in lost]
+            )
+        return lost
+
+    def record_stages(self, checkpoints, owner=None) -> set:
+        """
+        Stores completed stages as (job_id, stage, result) tuples, committed together.
+        With the lease `owner`, jobs whose lease it lost are skipped and their IDs returned;
+        the others' leases are renewed.
+        """
+        now = time.time()
+        checkpoints = list(checkpoints)
+        with self._transaction() as conn:
+            lost = self._lost(conn, [job_id for job_id, _, _ in checkpoints], owner)
+            checkpoints = [checkpoint for checkpoint in checkpoints if checkpoint[0] not in lost]
+            conn.executemany(
+                "INSERT OR REPLACE INTO stage_results (job_id, stage, result) VALUES (?, ?, ?)",
+                [(job_id, stage, json.dumps(result, default=_encode)) for job_id, stage, result in checkpoints]
+            )
+            lease_expires = now + self.lease_seconds if owner is not None else None
+            conn.executemany(
+                "UPDATE jobs SET stage = COALESCE(?, stage), lease_expires = COALESCE(?, lease_expires), updated_at = ?"
+                " WHERE id = ?",
+                [(stage if stage in STAGES else None, lease_expires, now, job_id) for job_id, stage, _ in checkpoints]
+            )
+        return lost
+
+    def record_stage(self, job_id: int, stage: str, result, owner=None):
+        """Stores one completed stage. Raises LeaseLostError if `owner` no longer holds the job."""
+        if self.record_stages([(job_id, stage, result)], owner=owner):
+            raise LeaseLostError(f"Job {job_id} is no longer leased to this worker.")
+
+    def complete_many(self, job_ids, owner=None) -> set:
+        """Marks jobs DONE. With the lease `owner`, skips and returns the jobs whose lease it lost."""
+        now = time.time()
+        job_ids = list(job_ids)
+        with self._transaction() as conn:
+            lost = self._lost(conn, job_ids, owner)
+            conn.executemany(
+                "UPDATE jobs SET status = 'DONE', lease_owner = NULL, lease_expires = NULL, error = NULL, updated_at = ?"
+                " WHERE id = ?",
+                [(now, job_id) for job_id in job_ids if job_id not in lost]
+            )
+        return lost
+
+    def complete(self, job_id: int, owner=None):
+        if self.complete_many([job_id], owner=owner):
+            raise LeaseLostError(f"Job {job_id} is no longer leased to this worker.")
+
+    def fail(self, job_id: int, error: str, owner=None):
+        """
+        Releases a failed job for another attempt, or marks it FAILED after max_attempts.
+        Raises LeaseLostError if `owner` no longer holds the job.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if self._lost(conn, [job_id], owner):
+                raise LeaseLostError(f"Job {job_id} is no longer leased to this worker.")
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'FAILED' ELSE 'PENDING' END,"
+                " lease_owner = NULL, lease_expires = NULL, error = ?, updated_at = ? WHERE id = ?",
+                (self.max_attempts, error, now, job_id)
+            )
+
+    def get(self, job_id: int):
+        """Returns the job's status row and stage results as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, stage, attempts, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            results = {stage: json.loads(result) for stage, result in self._conn.execute(
+                "SELECT stage, result FROM stage_results WHERE job_id = ?", (job_id,))}
+        keys = ["id", "status", "stage", "attempts", "error", "created_at", "updated_at"]
+        return dict(zip(keys, row), results=results)
+
+    def depth(self) -> int:
+        """Jobs waiting or running, across every process sharing the queue."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('PENDING', 'RUNNING')").fetchone()[0]
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _dedupe_job(job: Job, pipeline):
+    """Registers the job's email with the pipeline's duplicate detector; returns the stage to checkpoint, or None."""
+    if pipeline.duplicate_detector is None or job.is_done("dedupe") or job.is_done("duplicate"):
+        return None
+    entry_id, match = pipeline.register_email(job.payload, job_id=job.id)
+    if match is not None:
+        job.results["duplicate"] = match.to_dict()
+        return job.id, "duplicate", job.results["duplicate"]
+    job.results["dedupe"] = {"entry_id": entry_id}
+    return job.id, "dedupe", job.results["dedupe"]
+
+
+def extract_jobs(queue: JobQueue, jobs, pipeline):
+    """
+    Runs the extract stage for all claimed jobs that still need it with batched LLM
+    requests, and checkpoints the results in one commit. Jobs that could not be
+    extracted are checkpointed as such, and process_job fails them for this attempt
+    without another LLM call. Emails that repeat an earlier order are recorded as
+    duplicates and not extracted.
+    """
+    owner = jobs[0].lease_owner if jobs else None
+    checkpoints = [checkpoint for checkpoint in (_dedupe_job(job, pipeline) for job in jobs) if checkpoint]
+    pending = [job for job in jobs if not job.is_done("extract") and not job.is_done("duplicate")]
+    if len(pending) < 2:
+        if checkpoints:
+            queue.record_stages(checkpoints, owner=owner)
+        return
+    for job, extracted in zip(pending, pipeline.extract_many([job.payload for job in pending])):
+        if extracted:
+            job.results["extract"] = extracted
+            checkpoints.append((job.id, "extract", extracted))
+        else:
+            job.results[EXTRACT_FAILED] = {"attempt": job.attempts}
+            checkpoints.append((job.id, EXTRACT_FAILED, job.results[EXTRACT_FAILED]))
+    if checkpoints:
+        queue.record_stages(checkpoints, owner=owner)
+
+
+def _fail_job(queue: JobQueue, job: Job, pipeline, error: str):
+    """
+    Fails the job. Once it is out of attempts its email is unregistered, so a resend is not
+    dropped as a duplicate, and the stock its validated items held is released.
+    """
+    queue.fail(job.id, error, owner=job.lease_owner)
+    if queue.get(job.id)["status"] != "FAILED":
+        return
+    if "dedupe" in job.results:
+        pipeline.forget_email(job.results["dedupe"]["entry_id"])
+    # Also covers units reserved by a validation that crashed before its checkpoint
+    release_reservations(job.results.get("validate") or {"reservation_ids": [job_reservation_id(job)]},
+                         pipeline.stock_ledger)
+
+
+def process_job(queue: JobQueue, job: Job, pipeline):
+    """
+    Runs one claimed job through the stages it has not completed yet, checkpointing
+    each stage's result before moving on. `pipeline` is an OrderPipeline that
+    supplies the catalog, extraction settings and output locations.
+
+    The job's lease is renewed before it starts and with every checkpoint. If it
+    was lost (it expired while earlier jobs of the same claim ran, and another worker
+    took the job), the job is left to that worker.
+    """
+    owner = job.lease_owner
+    if owner is not None and queue.renew([job.id], owner):
+        print(f"⚠️ Job {job.id} was taken over by another worker after its lease expired; skipping it.")
+        return False
+    try:
+        with metrics.trace(job_id=job.id, resumed_after=job.stage) as trace_record:
+            checkpoint = _dedupe_job(job, pipeline)
+            if checkpoint:
+                queue.record_stage(*checkpoint, owner=owner)
+            if job.is_done("duplicate"):
+                trace_record["duplicate_of"] = job.results["duplicate"]["entry_id"]
+                queue.complete(job.id, owner=owner)
+                return True
+            entry_id = job.results.get("dedupe", {}).get("entry_id")
+
+            if not job.is_done("extract"):
+                # A failure recorded by extract_jobs in this attempt already covered the per-email retry
+                already_failed = job.results.get(EXTRACT_FAILED, {}).get("attempt") == job.attempts
+                extracted = None if already_failed else pipeline.extract(job.payload)
+                if not extracted:
+                    trace_record["error"] = "No order could be extracted."
+                    _fail_job(queue, job, pipeline, "No order could be extracted.")
+                    return False
+                queue.record_stage(job.id, "extract", extracted, owner=owner)
+                job.results["extract"] = extracted
+
+            if not job.is_done("validate"):
+                job.results["validate"] = pipeline.validate(job.results["extract"], reservation_id=job_reservation_id(job))
+                queue.record_stage(job.id, "validate", job.results["validate"], owner=owner)
+
+            if not job.is_done("json"):
+                if not job.is_done(JSON_INTENT):
+                    with metrics.span("build"):
+                        sales_order = build_sales_order(job.results["validate"])
+                    intent = {"path": new_sales_order_json_path(sales_order, output_folder=pipeline.output_folder),
+                              "sales_order": sales_order.to_dict()}
+                    queue.record_stage(job.id, JSON_INTENT, intent, owner=owner)
+                    job.results[JSON_INTENT] = intent
+                sales_order = SalesOrder.from_dict(job.results[JSON_INTENT]["sales_order"])
+                with metrics.span("json"):
+                    json_path = write_sales_order_json(sales_order, filepath=job.results[JSON_INTENT]["path"])
+                order_id = None
+                if pipeline.order_store is not None:
+                    with metrics.span("store"):
+                        # Keyed by the job, so a retry finds the order it stored before crashing
+                        order_id = pipeline.order_store.append(sales_order, job.results["validate"], job_id=job.id)
+                job.results["json"] = {"path": json_path, "order_id": order_id, "sales_order": sales_order.to_dict()}
+                queue.record_stage(job.id, "json", job.results["json"], owner=owner)
+
+            if not job.is_done("pdf"):
+                sales_order = SalesOrder.from_dict(job.results["json"]["sales_order"])
+                with metrics.span("pdf"):
+                    pdf_path = render_sales_order_pdf(sales_order, pipeline.template_path, output_folder=pipeline.output_folder)
+                if not pdf_path:
+                    trace_record["error"] = "PDF rendering failed."
+                    _fail_job(queue, job, pipeline, "PDF rendering failed.")
+                    return False
+                job.results["pdf"] = {"path": pdf_path}
+                queue.record_stage(job.id, "pdf", job.results["pdf"], owner=owner)
+                if job.results["json"]["order_id"] is not None:
+                    pipeline.order_store.set_outputs(job.results["json"]["order_id"], job.results["json"]["path"], pdf_path)
+
+            pipeline.link_email(entry_id, job_id=job.id, order_id=job.results["json"]["order_id"],
+                                json_path=job.results["json"]["path"], pdf_path=job.results["pdf"]["path"],
+                                customer_name=job.results["json"]["sales_order"]["sales_order_summary"]["customer_name"])
+            queue.complete(job.id, owner=owner)
+            return True
+    except LeaseLostError as e:
+        print(f"⚠️ {e} Leaving it to the worker that took it over.")
+        return False
+    except Exception as e:
+        try:
+            _fail_job(queue, job, pipeline, f"{type(e).__name__}: {e}")
+        except LeaseLostError:
+            pass
+        return False
@@ -1,58 +1,128 @@
-import google.generativeai as genai
 from config import settings
+from .extraction_cache import ExtractionCache, make_cache_key
+from .rule_parser import parse_order_email
+from .inventory_manager import has_product_match, mentions_catalog_product
+from . import metrics
+import asyncio
+import json
 import os
+import threading
+import time
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))  # type: ignore
+# google.generativeai takes most of a second to import, so it is only imported (and the
+# models built) by get_model() when an email actually needs the LLM. The schema of the
+# 'log_sales_order' tool is kept as plain data until then.
+
+# The fields of one sales order, shared by the single-email and batch function tools
+ORDER_PROPERTIES = {
+    "customer_name": {
+        "type": "STRING",
+        "description": "The name of the customer or company placing the order, e.g., 'Innovate LLC' or 'John Doe'."
+    },
+    "delivery_address": {
+        "type": "STRING",
+        "description": "The full delivery street address, including city, state, and zip code."
+    },
+    "delivery_date": {
+        "type": "STRING",
+        "description": "The requested delivery date, e.g., 'November 10th, 2023' or 'end of the month'."
+    },
+    "customer_notes": {
+        "type": "STRING",
+        "description": "Any other important notes, comments, or context from the customer."
+    },
+    "products": {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "product_name": {
+                    "type": "STRING",
+                    "description": "The name or description of the product requested."
+                },
+                "quantity": {
+                    "type": "INTEGER",
+                    "description": "The number of units requested. A dozen means 12."
+                }
+            },
+            "required": ["product_name", "quantity"]
+        }
+    }
+}
 
 # Define the NEW, more complex function tool for Gemini
-log_sales_order_func = genai.protos.FunctionDeclaration(  # type: ignore
-    name="log_sales_order",
-    description="Extracts all customer order information from an email to create a sales order.",
-    parameters=genai.protos.Schema(
-        type=genai.protos.Type.OBJECT,
-        properties={
-            "customer_name": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="The name of the customer or company placing the order, e.g., 'Innovate LLC' or 'John Doe'."
-            ),
-            "delivery_address": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="The full delivery street address, including city, state, and zip code."
-            ),
-            "delivery_date": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="The requested delivery date, e.g., 'November 10th, 2023' or 'end of the month'."
-            ),
-            "customer_notes": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Any other important notes, comments, or context from the customer."
-            ),
-            "products": genai.protos.Schema(
-                type=genai.protos.Type.ARRAY,
-                items=genai.protos.Schema(
-                    type=genai.protos.Type.OBJECT,
-                    properties={
-                        "product_name": genai.protos.Schema(
-                            type=genai.protos.Type.STRING,
-                            description="The name or description of the product requested."
-                        ),
-                        "quantity": genai.protos.Schema(
-                            type=genai.protos.Type.INTEGER,
-                            description="The number of units requested. A dozen means 12."
-                        )
-                    },
-                    required=["product_name", "quantity"]
-                )
-            )
+LOG_SALES_ORDER = {
+    "name": "log_sales_order",
+    "description": "Extracts all customer order information from an email to create a sales order.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": ORDER_PROPERTIES,
+        "required": ["customer_name", "delivery_address", "products"]
+    }
+}
+
+# The same tool for batch requests: one call per email, tagged with the email's ID
+LOG_SALES_ORDER_BATCH = {
+    "name": "log_sales_order",
+    "description": "Extracts all customer order information from ONE of the emails to create a sales order. "
+                   "Call it once per email.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "email_id": {
+                "type": "STRING",
+                "description": "The id of the <email> this order was extracted from, e.g. '3'."
+            },
+            **ORDER_PROPERTIES
         },
-        required=["customer_name", "delivery_address", "products"]
+        "required": ["email_id", "customer_name", "delivery_address", "products"]
+    }
+}
+
+MODEL_NAME = 'gemini-2.0-flash'
+
+_models = {}
+_models_lock = threading.Lock()
+
+def _proto_schema(genai, schema: dict):
+    """Builds the genai.protos.Schema for a plain schema dict."""
+    fields = {"type": getattr(genai.protos.Type, schema["type"])}
+    if "description" in schema:
+        fields["description"] = schema["description"]
+    if "properties" in schema:
+        fields["properties"] = {name: _proto_schema(genai, prop) for name, prop in schema["properties"].items()}
+    if "items" in schema:
+        fields["items"] = _proto_schema(genai, schema["items"])
+    if "required" in schema:
+        fields["required"] = schema["required"]
+    return genai.protos.Schema(**fields)
+
+def function_declaration(genai, tool: dict):
+    """Builds the genai.protos.FunctionDeclaration for LOG_SALES_ORDER or LOG_SALES_ORDER_BATCH."""
+    return genai.protos.FunctionDeclaration(  # type: ignore
+        name=tool["name"],
+        description=tool["description"],
+        parameters=_proto_schema(genai, tool["parameters"])
     )
-)
 
-model = genai.GenerativeModel(
-    model_name='gemini-2.0-flash',
-    tools=[log_sales_order_func]
-)
+def get_model(batch=False):
+    """
+    Returns the Gemini model for single-email (or, with `batch`, multi-email) requests.
+    The SDK is imported and configured, and the model built, on first use.
+    """
+    key = "batch" if batch else "single"
+    model = _models.get(key)
+    if model is None:
+        with _models_lock, metrics.span("llm_model_setup"):
+            model = _models.get(key)
+            if model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))  # type: ignore
+                model = _models[key] = genai.GenerativeModel(  # type: ignore
+                    model_name=MODEL_NAME,
+                    tools=[function_declaration(genai, LOG_SALES_ORDER_BATCH if batch else LOG_SALES_ORDER)]
+                )
+    return model
 
 SYSTEM_PROMPT = """
 You are a world-class data entry agent. Your task is to meticulously read a customer email and extract information with extreme precision using the 'log_sales_order' function.
@@ -71,39 +141,277 @@ You are a world-class data entry agent. Your task is to meticulously read a cust
 6.  You MUST call the 'log_sales_order' function with the extracted data.
 """
 
-def extract_order_details_from_email(email_body: str):
-    """Uses Gemini to extract a full sales order structure from an email."""
-    if not os.getenv("GEMINI_API_KEY"):
+BATCH_PROMPT = SYSTEM_PROMPT + """
+**BATCH MODE:** The message contains several emails, each wrapped in <email id="..."> and </email>.
+Treat every email as a separate order: call 'log_sales_order' once for EACH email, in the same
+order, with 'email_id' set to that email's id. Never mix information between emails.
+"""
+
+_extraction_cache = None
+
+def get_extraction_cache():
+    """Returns the shared on-disk extraction cache, or None if it is disabled in settings."""
+    global _extraction_cache
+    if _extraction_cache is None and settings.EXTRACTION_CACHE_PATH:
+        _extraction_cache = ExtractionCache(
+            settings.EXTRACTION_CACHE_PATH,
+            max_entries=settings.EXTRACTION_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.EXTRACTION_CACHE_TTL_SECONDS
+        )
+    return _extraction_cache
+
+def extraction_cache_key(email_body: str):
+    """Cache key for an email: changes whenever the prompt, the function schema or the model does."""
+    return make_cache_key(email_body, SYSTEM_PROMPT, json.dumps(LOG_SALES_ORDER, sort_keys=True), MODEL_NAME)
+
+CHAT_HISTORY = [
+    {'role': 'user', 'parts': [SYSTEM_PROMPT]},
+    {'role': 'model', 'parts': [
+        "Understood. I will meticulously extract all required sales order fields and call the function."]}
+]
+
+BATCH_CHAT_HISTORY = [
+    {'role': 'user', 'parts': [BATCH_PROMPT]},
+    {'role': 'model', 'parts': [
+        "Understood. I will call the function once per email, tagged with its email_id."]}
+]
+
+def _function_call_args(function_call):
+    """The API returns a special dict-like object, convert it to a standard dict."""
+    order_details = {}
+    for key, value in function_call.args.items():
+        # If the value is a 'RepeatedComposite' (like our 'products' list)...
+        if type(value).__name__ == 'RepeatedComposite':
+            # ...convert it to a standard Python list of dictionaries.
+            order_details[key] = [dict(item) for item in value]
+        else:
+            # Otherwise, just add the key-value pair as is.
+            order_details[key] = value
+    return order_details
+
+def parse_order_details(response):
+    """Converts the model's 'log_sales_order' function call into a plain dict, or returns None."""
+    function_call = response.candidates[0].content.parts[0].function_call
+    if function_call and function_call.name == "log_sales_order":
+        return _function_call_args(function_call)
+
+    print("LLM did not call the function. It might not have found a valid order.")
+    return None
+
+def format_email_batch(email_bodies) -> str:
+    """One batch request message: every email wrapped in <email id="N"> tags, IDs counting from 1."""
+    emails = "\n\n".join(f'<email id="{i}">\n{body}\n</email>' for i, body in enumerate(email_bodies, start=1))
+    return f"There are {len(email_bodies)} emails below.\n\n{emails}"
+
+def parse_batch_order_details(response, email_count: int) -> dict:
+    """
+    Splits a batch response into {position: order dict}. Calls with a missing or unknown
+    email_id, and emails answered more than once, are left out so they can be retried alone.
+    """
+    orders, duplicates = {}, set()
+    for part in response.candidates[0].content.parts:
+        function_call = getattr(part, "function_call", None)
+        if not function_call or function_call.name != "log_sales_order":
+            continue
+        order_details = _function_call_args(function_call)
+        email_id = str(order_details.pop("email_id", "")).strip()
+        if not email_id.isdigit() or not 1 <= int(email_id) <= email_count:
+            continue
+        position = int(email_id) - 1
+        if position in orders:
+            duplicates.add(position)
+        orders[position] = order_details
+    for position in duplicates:
+        del orders[position]
+    return orders
+
+def extract_with_rules(email_body: str, inventory_df=None, min_confidence=None):
+    """
+    The local fast path: returns the rule-based parse of the email if it is confident
+    enough and (when a catalog is given) every product name resolves in it, else None.
+    Free text naming a catalog product lowers the confidence, since the rules didn't read it.
+    """
+    min_confidence = settings.RULE_PARSER_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    mentions_product = None if inventory_df is None else lambda line: mentions_catalog_product(line, inventory_df)
+    order_details, confidence = parse_order_email(email_body, mentions_product)
+    if confidence < min_confidence:
+        return None
+    # Validation matches the products again (and counts them), so this check leaves the metrics alone
+    if inventory_df is not None and not all(has_product_match(p["product_name"], inventory_df) for p in order_details["products"]):
+        return None
+    return order_details
+
+def extract_locally(email_body: str, inventory_df=None, cache=None):
+    """
+    The answers that need no LLM call: the rule parser's, then the extraction cache's.
+    Returns (order dict or None, cache key). Shared by the sync, batch and async
+    extractors; the cache lookup blocks on SQLite, so async callers run it in a thread.
+    """
+    order_details = extract_with_rules(email_body, inventory_df)
+    if order_details is not None:
+        metrics.inc("extractions_total", path="rules")
+        return order_details, None
+
+    cache_key = extraction_cache_key(email_body) if cache is not None else None
+    if cache is not None:
+        cached_order = cache.get(cache_key)
+        if cached_order is not None:
+            metrics.inc("extractions_total", path="cache")
+            return cached_order, cache_key
+    return None, cache_key
+
+def extract_order_details_from_email(email_body: str, use_cache=True, model_client=None, inventory_df=None):
+    """
+    Uses Gemini to extract a full sales order structure from an email.
+    `model_client` replaces the Gemini model (e.g. with a local fake).
+
+    Structured emails are parsed locally first; the LLM is only called when the
+    parse is not confident or its products don't resolve in `inventory_df`.
+    """
+    cache = get_extraction_cache() if use_cache else None
+    order_details, cache_key = extract_locally(email_body, inventory_df, cache)
+    if order_details is not None:
+        return order_details
+
+    if model_client is None and not os.getenv("GEMINI_API_KEY"):
         print("ERROR: Gemini API Key is not set.")
         return None
 
-    try:
-        chat = model.start_chat(history=[
-            {'role': 'user', 'parts': [SYSTEM_PROMPT]},
-            {'role': 'model', 'parts': [
-                "Understood. I will meticulously extract all required sales order fields and call the function."]}
-        ])
+    return _extract_with_llm(email_body, model_client, cache, cache_key)
 
+def _extract_with_llm(email_body: str, model_client=None, cache=None, cache_key=None):
+    """One Gemini request for one email. Caches and returns the order dict, or None."""
+    try:
+        chat = (model_client or get_model()).start_chat(history=CHAT_HISTORY)
+        started = time.perf_counter()
         response = chat.send_message(email_body)
+        metrics.observe("llm_request_duration_seconds", time.perf_counter() - started)
+        metrics.inc("llm_requests_total", outcome="ok")
 
-        function_call = response.candidates[0].content.parts[0].function_call
-        if function_call and function_call.name == "log_sales_order":
-            # The API returns a special dict-like object, convert it to a standard dict
-            order_details = {}
-            for key, value in function_call.args.items():
-                # If the value is a 'RepeatedComposite' (like our 'products' list)...
-                if type(value).__name__ == 'RepeatedComposite':
-                    # ...convert it to a standard Python list of dictionaries.
-                    order_details[key] = [dict(item) for item in value]
-                else:
-                    # Otherwise, just add the key-value pair as is.
-                    order_details[key] = value
-
-            return order_details
-        else:
-            print("LLM did not call the function. It might not have found a valid order.")
-            return None
+        order_details = parse_order_details(response)
+        metrics.inc("extractions_total", path="llm" if order_details is not None else "failed")
+        if order_details is not None and cache is not None:
+            cache.put(cache_key, order_details)
+        return order_details
+
+    except Exception as e:
+        metrics.inc("llm_requests_total", outcome="error")
+        print(f"An error occurred while calling the Gemini API: {e}")
+        return None
+
+def _send_batch(email_bodies, model_client=None) -> dict:
+    """
+    One Gemini request for several emails. Returns {position: order dict}, {} if the response
+    was malformed, or None if the request itself failed.
+    """
+    try:
+        chat = (model_client or get_model(batch=True)).start_chat(history=BATCH_CHAT_HISTORY)
+        started = time.perf_counter()
+        response = chat.send_message(format_email_batch(email_bodies))
+        metrics.observe("llm_request_duration_seconds", time.perf_counter() - started)
+        metrics.inc("llm_requests_total", outcome="ok")
+    except Exception as e:
+        metrics.inc("llm_requests_total", outcome="error")
+        print(f"An error occurred while calling the Gemini API for a batch of {len(email_bodies)} emails: {e}")
+        return None
+
+    try:
+        return parse_batch_order_details(response, len(email_bodies))
+    except Exception as e:
+        print(f"⚠️ Malformed batch response, retrying its {len(email_bodies)} emails one by one: {e}")
+        return {}
+
+def extract_order_details_from_emails(email_bodies, use_cache=True, model_client=None, inventory_df=None, batch_size=None,
+                                      fallback_delay=None):
+    """
+    Batch version of extract_order_details_from_email. Returns one order dict (or None)
+    per email, in the same order.
+
+    Emails the rule parser and the cache can't answer go to Gemini `batch_size` at a time
+    (LLM_BATCH_SIZE by default) in a single request, so the prompt is sent once per batch
+    instead of once per email. The model tags each 'log_sales_order' call with the email's
+    ID; an email whose call is missing or malformed gets a request of its own. When the
+    batch request itself fails, the emails are only sent one by one after `fallback_delay`
+    seconds (LLM_BATCH_FALLBACK_DELAY), doubled for each further failed batch, instead of
+    hitting a failing API with a burst of requests.
+    """
+    batch_size = batch_size or settings.LLM_BATCH_SIZE
+    fallback_delay = settings.LLM_BATCH_FALLBACK_DELAY if fallback_delay is None else fallback_delay
+    failed_batches = 0
+    results = [None] * len(email_bodies)
+    cache = get_extraction_cache() if use_cache else None
+    pending = [] # (position, cache_key) of the emails that need the LLM
+
+    for position, email_body in enumerate(email_bodies):
+        results[position], cache_key = extract_locally(email_body, inventory_df, cache)
+        if results[position] is None:
+            pending.append((position, cache_key))
+
+    if pending and model_client is None and not os.getenv("GEMINI_API_KEY"):
+        print("ERROR: Gemini API Key is not set.")
+        return results
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        orders = _send_batch([email_bodies[position] for position, _ in batch], model_client) if len(batch) > 1 else {}
+        if orders is None:
+            time.sleep(fallback_delay * (2 ** failed_batches))
+            failed_batches += 1
+            orders = {}
+
+        for i, (position, cache_key) in enumerate(batch):
+            order_details = orders.get(i)
+            if order_details is None:
+                if len(batch) > 1:
+                    metrics.inc("llm_batch_fallbacks_total")
+                results[position] = _extract_with_llm(email_bodies[position], model_client, cache, cache_key)
+                continue
+            metrics.inc("extractions_total", path="llm")
+            if cache is not None:
+                cache.put(cache_key, order_details)
+            results[position] = order_details
+
+    return results
+
+async def extract_order_details_from_email_async(email_body: str, use_cache=True, model_client=None, raise_errors=False,
+                                                 inventory_df=None):
+    """
+    Async version of extract_order_details_from_email.
+
+    `model_client` replaces the Gemini model (e.g. with a local fake). With
+    `raise_errors=True` API errors are raised instead of logged, so a caller
+    can retry the transient ones. The rule parser and the SQLite cache run in a
+    worker thread, off the event loop.
+    """
+    cache = get_extraction_cache() if use_cache else None
+    order_details, cache_key = await asyncio.to_thread(extract_locally, email_body, inventory_df, cache)
+    if order_details is not None:
+        return order_details
+
+    if model_client is None and not os.getenv("GEMINI_API_KEY"):
+        print("ERROR: Gemini API Key is not set.")
+        return None
+
+    return await extract_with_llm_async(email_body, model_client, cache, cache_key, raise_errors=raise_errors)
+
+async def extract_with_llm_async(email_body: str, model_client=None, cache=None, cache_key=None, raise_errors=False):
+    """One async Gemini request for one email. Caches (from a worker thread) and returns the order dict, or None."""
+    try:
+        chat = (model_client or get_model()).start_chat(history=CHAT_HISTORY)
+        started = time.perf_counter()
+        response = await chat.send_message_async(email_body)
+        metrics.observe("llm_request_duration_seconds", time.perf_counter() - started)
+        metrics.inc("llm_requests_total", outcome="ok")
+
+        order_details = parse_order_details(response)
+        metrics.inc("extractions_total", path="llm" if order_details is not None else "failed")
+        if order_details is not None and cache is not None:
+            await asyncio.to_thread(cache.put, cache_key, order_details)
+        return order_details
 
     except Exception as e:
+        metrics.inc("llm_requests_total", outcome="error")
+        if raise_errors:
+            raise
         print(f"An error occurred while calling the Gemini API: {e}")
         return None
@@ -0,0 +1,180 @@
+"""
+Lightweight in-process metrics and per-order tracing.
+
+Counters and duration histograms live in module-level dicts behind one lock, so
+recording is a dict update (well under a microsecond). `render_prometheus()`
+returns them in the Prometheus text format for app.py's /metrics endpoint.
+
+`span(stage)` times a block into the `stage_duration_seconds` histogram and, inside
+`trace()`, also adds it to the current order's trace, which is appended as one
+JSON line to TRACE_LOG_PATH when the trace ends (if a path is configured).
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import settings
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "catalog_matches_total": "Product lookups by the tier that answered them (alias, exact, fuzzy, none).",
+    "fuzzy_candidates_scored_total": "Catalog rows scored with WRatio by the fuzzy tier.",
+    "duplicate_emails_total": "Emails skipped as near-duplicates of a recently processed one.",
+    "extractions_total": "Email extractions by the path that produced them (rules, cache, llm, failed).",
+    "llm_requests_total": "Gemini requests by outcome (ok, error).",
+    "llm_batch_fallbacks_total": "Emails from a batch request that had to be re-extracted on their own.",
+    "llm_request_duration_seconds": "Latency of Gemini requests.",
+    "line_items_total": "Validated line items by status.",
+    "orders_regenerated_total": "Stored orders whose line items changed status after a catalog change, rewritten with new JSON and PDF.",
+    "revalidated_items_total": "Stored rejected line items re-validated after a catalog change.",
+    "pdf_bytes_written_total": "Bytes of filled sales order PDFs written.",
+    "pdfs_written_total": "Filled sales order PDFs written.",
+    "stage_duration_seconds": "Time spent in each pipeline stage.",
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)    # (name, labels) -> value
+_histograms = {}                  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_trace_log_lock = threading.Lock()
+
+
+def _labels(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value=1, **labels):
+    """Adds `value` to a counter."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] += value
+
+
+def observe(name: str, seconds: float, **labels):
+    """Records one duration in a histogram."""
+    key = (name, _labels(labels))
+    position = bisect.bisect_left(DURATION_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+        histogram[position] += 1
+        histogram[-1] += seconds
+
+
+@contextmanager
+def span(stage: str):
+    """Times a pipeline stage; the duration also goes to the current order trace, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("stage_duration_seconds", elapsed, stage=stage)
+        trace_record = _current_trace.get()
+        if trace_record is not None:
+            trace_record["spans"].append({"stage": stage, "ms": round(elapsed * 1000, 3)})
+
+
+@contextmanager
+def trace(**attributes):
+    """
+    Collects the spans of one order. When it ends, the trace is written as a JSON line
+    to TRACE_LOG_PATH (if set). Yields the trace dict, so callers can add attributes.
+    Inside another trace it joins that one instead of starting a new trace.
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        # Nested: the stages belong to the order trace that is already open
+        outer.update(attributes)
+        yield outer
+        return
+
+    trace_record = {"trace_id": uuid.uuid4().hex, "started_at": datetime.utcnow().isoformat(), "spans": [], **attributes}
+    token = _current_trace.set(trace_record)
+    started = time.perf_counter()
+    try:
+        yield trace_record
+    except BaseException as e:
+        trace_record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace_record["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        if settings.TRACE_LOG_PATH:
+            _write_trace(trace_record)
+
+
+def _write_trace(trace_record):
+    folder = os.path.dirname(settings.TRACE_LOG_PATH)
+    if folder and not os.path.exists(folder): os.makedirs(folder)
+    line = json.dumps(trace_record, default=str)
+    with _trace_log_lock, open(settings.TRACE_LOG_PATH, 'a') as f:
+        f.write(line + "\n")
+
+
+def snapshot() -> dict:
+    """Current counter values and histogram counts/sums, keyed by name and label string."""
+    with _lock:
+        counters = {f"{name}{_format_labels(labels)}": value for (name, labels), value in _counters.items()}
+        histograms = {f"{name}{_format_labels(labels)}": {"count": sum(h[:-1]), "sum": h[-1]}
+                      for (name, labels), h in _histograms.items()}
+    return {"counters": counters, "histograms": histograms}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _sort_key(item):
+    (name, labels), _ = item
+    return name, [(key, str(value)) for key, value in labels]
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items(), key=_sort_key)
+        histograms = sorted(((key, list(h)) for key, h in _histograms.items()), key=_sort_key)
+
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        describe(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {int(value) if float(value).is_integer() else value}")
+
+    for (name, labels), histogram in histograms:
+        describe(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ("+Inf",), histogram[:-1]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-1]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,147 @@
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _to_float(value):
+    """A catalog number as a plain float, None when missing. Typed columns skip the string parse."""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    elif not isinstance(value, (int, float, np.number)):
+        value = pd.to_numeric(value, errors='coerce')
+    value = float(value)
+    return None if value != value else value
+
+
+def _to_quantity(value):
+    """Stock and MOQ as a plain int (or float if fractional), None when missing."""
+    value = _to_float(value)
+    if value is None:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+def _to_text(value):
+    return None if value is None or value is pd.NA or (isinstance(value, float) and value != value) else str(value)
+
+
+class ProductRecord:
+    """
+    A matched catalog product, attached to line items in place of the full row dict.
+
+    Only the fields validation and output need are kept, as plain Python types in
+    __slots__; `row` is the product's catalog row, for anything else (e.g. the
+    Description). Records are immutable, so one record is shared by every line item
+    that matched the product. They read like the row dict they replace:
+    record['Price'], record.get('Available_in_Stock').
+    """
+    __slots__ = ("Product_Code", "Product_Name", "Price", "Available_in_Stock", "Min_Order_Quantity",
+                 "match_confidence", "row")
+
+    def __init__(self, Product_Code, Product_Name, Price=None, Available_in_Stock=None, Min_Order_Quantity=None,
+                 match_confidence=None, row=None):
+        set_field = object.__setattr__
+        set_field(self, "Product_Code", _to_text(Product_Code))
+        set_field(self, "Product_Name", _to_text(Product_Name))
+        set_field(self, "Price", _to_float(Price))
+        set_field(self, "Available_in_Stock", _to_quantity(Available_in_Stock))
+        set_field(self, "Min_Order_Quantity", _to_quantity(Min_Order_Quantity))
+        set_field(self, "match_confidence", None if match_confidence is None else int(match_confidence))
+        set_field(self, "row", None if row is None else int(row))
+
+    @classmethod
+    def from_row(cls, product, row=None, match_confidence=None):
+        """Builds a record from a catalog row (a pandas Series or dict)."""
+        return cls(product.get("Product_Code"), product.get("Product_Name"), product.get("Price"),
+                   product.get("Available_in_Stock"), product.get("Min_Order_Quantity"),
+                   match_confidence=match_confidence, row=row)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProductRecord is immutable")
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        return isinstance(other, ProductRecord) and all(self[key] == other[key] for key in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(self[key] for key in self.__slots__))
+
+    def __reduce__(self):
+        # Immutable, so unpickling goes through __init__ instead of setting slots
+        return ProductRecord, tuple(self[key] for key in self.__slots__)
+
+    def __repr__(self):
+        return f"ProductRecord({self.Product_Code!r}, {self.Product_Name!r}, Price={self.Price!r})"
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self.__slots__}
+
+
+@dataclass
+class OrderSummary:
+    customer_name: Optional[str]
+    delivery_address: Optional[str]
+    requested_delivery_date: Optional[str]
+    notes: Optional[str]
+    generation_timestamp_utc: str
+
+
+@dataclass
+class LineItem:
+    sku: Optional[str]
+    product_name: Optional[str]
+    quantity: int
+    unit_price: Optional[float]
+    total_price: Optional[float]
+
+
+@dataclass
+class ReviewIssue:
+    requested_item: Optional[str]
+    status: str
+    details: Optional[str]
+    sku: Optional[str] = None # The matched product, for MOQ_NOT_MET and INSUFFICIENT_STOCK issues
+
+
+@dataclass
+class SalesOrder:
+    """A finished sales order, passed in memory between the pipeline stages."""
+    summary: OrderSummary
+    line_items: List[LineItem] = field(default_factory=list)
+    issues_for_review: List[ReviewIssue] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        """Returns the layout written to SO_*.json files."""
+        return {
+            "sales_order_summary": asdict(self.summary),
+            "line_items": [asdict(item) for item in self.line_items],
+            # An issue's sku is only written when it has one, so other issues keep their layout
+            "issues_for_review": [{key: value for key, value in asdict(issue).items() if key != "sku" or value is not None}
+                                  for issue in self.issues_for_review],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Builds a SalesOrder from the SO_*.json layout."""
+        return cls(
+            summary=OrderSummary(**data.get("sales_order_summary", {})),
+            line_items=[LineItem(**item) for item in data.get("line_items", [])],
+            issues_for_review=[ReviewIssue(**issue) for issue in data.get("issues_for_review", [])],
+        )
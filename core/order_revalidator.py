@@ -0,0 +1,214 @@
+import os
+import threading
+from collections import defaultdict
+
+from thefuzz import utils as fuzz_utils
+
+from .catalog_index import CatalogIndex, char_ngrams, normalize_product_name
+from .decision_engine import learn_confirmed_aliases, process_and_validate_order
+from .inventory_manager import find_product_matches
+from .output_generator import build_sales_order, write_sales_order_json
+from .pdf_writer import render_sales_order_pdf
+from .stock_ledger import StockLedger
+from . import metrics
+
+# Catalog columns whose changes can resolve a line item waiting on its SKU, or on its requested name
+SKU_COLUMNS = ("Available_in_Stock", "Min_Order_Quantity", "Product_Name", "Description")
+NAME_COLUMNS = ("Product_Name", "Description")
+
+
+def _match_status(match_count: int) -> str:
+    """The status the decision engine gives a request with this many catalog matches, before MOQ and stock."""
+    return "NOT_FOUND" if match_count == 0 else "MULTIPLE_MATCHES_FOUND" if match_count > 1 else "MATCHED"
+
+
+class OrderRevalidator:
+    """
+    Re-checks stored orders when the catalog changes, instead of leaving their
+    rejected line items rejected until the whole pipeline is rerun.
+
+    Register `on_catalog_change` as a CatalogService listener. A stock, MOQ or name
+    change of a SKU re-validates only the INSUFFICIENT_STOCK and MOQ_NOT_MET items
+    waiting on that SKU, found through the OrderStore's waiting_items index. When
+    product names change (products added, renamed or removed), each distinct
+    NOT_FOUND or ambiguous request sharing enough n-grams with a changed product's
+    old or new name to be shortlisted for it is looked up once, and only the items
+    whose match would now differ are re-validated. The work is proportional to the
+    items waiting on what changed, not to the number of stored orders.
+
+    Items are re-validated oldest order first, and each one that passes is reserved
+    in the StockLedger (a temporary one per run without `stock_ledger`), so a
+    restock is handed out to as many waiting items as it covers and no more. With a
+    shared ledger the new reservations are kept on the stored order, so rejecting it
+    releases them; if the order can't be stored again they are released at once.
+
+    An order whose line item statuses changed is stored again, and its JSON and PDF
+    are regenerated at their original paths. Orders where nothing changed are not
+    touched.
+    """
+
+    def __init__(self, order_store, catalog, template_path="sales_order_form_full.pdf", alias_store=None,
+                 stock_ledger=None):
+        self.order_store = order_store
+        self.catalog = catalog
+        self.template_path = template_path
+        self.alias_store = alias_store
+        self.stock_ledger = stock_ledger
+        self._lock = threading.Lock()
+
+    def on_catalog_change(self, changes) -> dict:
+        """CatalogService listener. Errors are reported, not raised, so the catalog update itself stands."""
+        skus = [change['Product_Code'] for change in changes
+                if change.get('removed') or any(column in change for column in SKU_COLUMNS)]
+        renamed = [change for change in changes
+                   if change.get('removed') or any(column in change for column in NAME_COLUMNS)]
+        try:
+            return self.revalidate(skus, names_changed=bool(renamed), renamed=renamed)
+        except Exception as e:
+            print(f"❌ Re-validating stored orders failed: {e}")
+            return {"items": 0, "orders": 0, "changed": []}
+
+    def revalidate(self, skus=(), names_changed=False, renamed=None) -> dict:
+        """
+        Re-validates the stored line items waiting on the given SKUs (and, with
+        `names_changed`, the unresolved requests a new match would now resolve).
+        `renamed` are the catalog changes behind `names_changed`; without them every
+        unresolved request is looked up. Returns {"items": checked, "orders": checked,
+        "changed": [order IDs regenerated]}.
+        """
+        with self._lock, metrics.span("revalidate"):
+            waiting = self.order_store.waiting_on(skus, unresolved=names_changed)
+            if names_changed:
+                waiting = self._resolvable(waiting, renamed)
+
+            # waiting_on lists the oldest orders first, so they get restocked units first
+            positions_by_order = defaultdict(list)
+            for order_id, position, *_ in waiting:
+                positions_by_order[order_id].append(position)
+
+            stock_ledger = self.stock_ledger if self.stock_ledger is not None else StockLedger()
+            try:
+                changed = [order_id for order_id, positions in positions_by_order.items()
+                           if self._revalidate_order(order_id, positions, stock_ledger)]
+            finally:
+                if stock_ledger is not self.stock_ledger:
+                    stock_ledger.close()
+
+        metrics.inc("revalidated_items_total", len(waiting))
+        metrics.inc("orders_regenerated_total", len(changed))
+        if waiting:
+            print(f"🔄 Re-validated {len(waiting)} waiting line items in {len(positions_by_order)} orders: "
+                  f"{len(changed)} orders changed.")
+        return {"items": len(waiting), "orders": len(positions_by_order), "changed": changed}
+
+    def _resolvable(self, waiting, renamed=None) -> list:
+        """Keeps items waiting on a SKU, and unresolved ones whose request now matches differently."""
+        could_change = self._name_filter(renamed)
+        match_counts = {}
+        kept = []
+        for row in waiting:
+            _, _, sku, requested_name, status, customer = row
+            if sku is None:
+                if could_change is not None and not could_change(requested_name, status):
+                    continue
+                key = (customer if self.alias_store is not None else None, requested_name)
+                if key not in match_counts:
+                    match_counts[key] = len(find_product_matches(requested_name, self.catalog,
+                                                                 alias_store=self.alias_store, customer=key[0]))
+                if _match_status(match_counts[key]) == status:
+                    continue
+            kept.append(row)
+        return kept
+
+    def _name_filter(self, renamed):
+        """
+        Returns `could_change(requested_name, status)`, false for unresolved requests the
+        renamed products can't have gained or lost as a match: a request can only match
+        a product it shares CatalogIndex.required_hits n-grams with. A product's new text
+        can resolve any unresolved request; its old text was only a match of ambiguous
+        ones. Returns None (no filter) without the changes or a CatalogIndex.
+        """
+        if not renamed or not isinstance(self.catalog, CatalogIndex):
+            return None
+
+        old_grams, new_grams = [], []
+        for change in renamed:
+            if change.get('previous_text'):
+                old_grams.append(char_ngrams(change['previous_text']))
+            row = None if change.get('removed') else self.catalog.row_of(change['Product_Code'])
+            if row is not None:
+                new_grams.append(char_ngrams(self.catalog.search_strings[row]))
+        all_new_grams = set().union(*new_grams)
+
+        def could_change(requested_name, status):
+            query = char_ngrams(fuzz_utils.full_process(normalize_product_name(requested_name), force_ascii=True))
+            with self.catalog.lock.reading():
+                in_catalog = {gram for gram in query if self.catalog.postings.get(gram) is not None}
+            needed = self.catalog.required_hits(len(in_catalog))
+            if any(len(query & grams) >= needed for grams in new_grams):
+                return True
+            if status != "MULTIPLE_MATCHES_FOUND":
+                return False
+            # Before the change the old text's n-grams were in the catalog, and the new text's may not have been
+            needed = self.catalog.required_hits(len((in_catalog - all_new_grams) | (query & set().union(*old_grams))))
+            return any(len(query & grams) >= needed for grams in old_grams)
+
+        return could_change
+
+    def _revalidate_order(self, order_id: int, positions, stock_ledger) -> bool:
+        """
+        Re-validates the order's items at `positions`, reserving the ones that pass in
+        `stock_ledger`; stores and regenerates the order if a status changed.
+        """
+        source = self.order_store.source(order_id)
+        if source is None:
+            return False
+        validated_order, json_path, pdf_path = source
+        line_items = validated_order["processed_line_items"]
+
+        changed = False
+        reservation_ids = []
+        for position in positions:
+            item = line_items[position]
+            request = {"customer_name": validated_order.get("customer_name"),
+                       "products": [{"product_name": item["requested_name"], "quantity": item["requested_quantity"]}]}
+            revalidated = process_and_validate_order(request, self.catalog, stock_ledger=stock_ledger,
+                                                     alias_store=self.alias_store, learn_aliases=False)
+            reservation_ids += revalidated.get("reservation_ids", [])
+            revalidated = revalidated["processed_line_items"][0]
+            if revalidated["status"] != item["status"]:
+                line_items[position] = revalidated
+                changed = True
+        if not changed:
+            return False
+
+        if stock_ledger is self.stock_ledger:
+            validated_order.setdefault("reservation_ids", []).extend(reservation_ids)
+        sales_order = build_sales_order(validated_order)
+        stored = self.order_store.get(order_id)
+        if stored is not None:
+            sales_order.summary = stored.summary # Keeps the original creation time
+        try:
+            self.order_store.replace(order_id, sales_order, validated_order)
+        except Exception:
+            for reservation_id in reservation_ids:
+                stock_ledger.release(reservation_id)
+            raise
+        if self.alias_store is not None:
+            learn_confirmed_aliases(validated_order, self.alias_store)
+        self._regenerate(sales_order, json_path, pdf_path)
+        return True
+
+    def _regenerate(self, sales_order, json_path, pdf_path):
+        """Writes the order's JSON and PDF again, replacing the files at their original paths."""
+        if json_path:
+            with metrics.span("json"):
+                new_path = write_sales_order_json(sales_order, output_folder=os.path.dirname(json_path) or ".")
+            if new_path:
+                os.replace(new_path, json_path)
+        if pdf_path:
+            with metrics.span("pdf"):
+                new_path = render_sales_order_pdf(sales_order, self.template_path,
+                                                  output_folder=os.path.dirname(pdf_path) or ".")
+            if new_path:
+                os.replace(new_path, pdf_path)
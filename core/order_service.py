@@ -0,0 +1,130 @@
+import threading
+import uuid
+
+from .decision_engine import release_reservations
+from .job_queue import JobQueue, QueueFullError, extract_jobs, process_job
+from .pipeline import OrderPipeline
+
+
+class OrderService:
+    """
+    Accepts order emails for the HTTP API and processes them in the background.
+
+    Submitting only writes the emails to the durable job queue, so callers get job
+    IDs back in milliseconds. Background worker threads claim jobs through the
+    queue's lease, up to `batch_size` at a time, and extract the claimed emails with
+    one batched LLM request before running each job's remaining stages. When several
+    processes (e.g. gunicorn workers) share the queue each job runs in exactly one of them, and jobs left unfinished by
+    a previous run are picked up once their lease expires. Idle workers are woken by
+    submissions to this process and poll every `poll_seconds` for the rest. Once
+    `max_queue_depth` jobs are waiting or running, submissions are refused with
+    QueueFullError until the backlog drains.
+    """
+
+    def __init__(self, catalog, queue_path, template_path="sales_order_form_full.pdf", output_folder="output",
+                 workers=4, max_queue_depth=1000, lease_seconds=300, max_attempts=3, order_store=None,
+                 alias_store=None, duplicate_detector=None, poll_seconds=1.0, stock_ledger=None, batch_size=8):
+        self.queue = JobQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+        self.pipeline = OrderPipeline(catalog, template_path=template_path, output_folder=output_folder,
+                                      order_store=order_store, alias_store=alias_store, stock_ledger=stock_ledger,
+                                      duplicate_detector=duplicate_detector)
+        self.max_queue_depth = max_queue_depth
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._workers = [threading.Thread(target=self._work, name=f"order-worker-{n}", daemon=True)
+                         for n in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.depth()
+
+    def _work(self):
+        """Worker thread: claims and processes a batch of jobs at a time, waiting for work when the queue is empty."""
+        worker_id = uuid.uuid4().hex
+        while not self._stopping:
+            try:
+                jobs = self.queue.claim(worker_id, limit=self.batch_size)
+                extract_jobs(self.queue, jobs, self.pipeline)
+                for job in jobs:
+                    process_job(self.queue, job, self.pipeline)
+            except Exception as e:
+                print(f"❌ Order worker error: {e}")
+                jobs = []
+            if not jobs:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(self.poll_seconds)
+
+    def submit_many(self, email_bodies) -> list:
+        """Queues the emails and returns their job IDs. Raises QueueFullError when over the limit."""
+        job_ids = self.queue.enqueue_many(email_bodies, max_depth=self.max_queue_depth)
+        with self._wakeup:
+            self._wakeup.notify(len(job_ids))
+        return job_ids
+
+    def submit(self, email_body: str) -> int:
+        return self.submit_many([email_body])[0]
+
+    def status(self, job_id: int):
+        """
+        Returns the job's status with its sales order and output paths once available, or None.
+        A job whose email repeated an earlier order reports that order's, with `duplicate_of`.
+        """
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        results = job.pop("results")
+        job["duplicate_of"] = results.get("duplicate")
+        if job["duplicate_of"] is not None:
+            original_job_id = job["duplicate_of"]["order_ref"].get("job_id")
+            original = self.queue.get(original_job_id) if original_job_id is not None else None
+            if original is not None:
+                results = original["results"]
+            else:
+                ref = job["duplicate_of"]["order_ref"]
+                results = {"json": {"path": ref.get("json_path"), "order_id": ref.get("order_id")},
+                           "pdf": {"path": ref.get("pdf_path")}}
+        job["sales_order"] = results.get("json", {}).get("sales_order")
+        job["order_id"] = results.get("json", {}).get("order_id")
+        if job["order_id"] is not None and self.pipeline.order_store is not None:
+            # The stored order is current after re-validation; the job's checkpoint is not
+            stored = self.pipeline.order_store.get(job["order_id"])
+            if stored is not None:
+                job["sales_order"] = stored.to_dict()
+        job["json_path"] = results.get("json", {}).get("path")
+        job["pdf_path"] = results.get("pdf", {}).get("path")
+        return job
+
+    def reject(self, job_id: int):
+        """
+        Rejects a job's order: the stored order is marked REJECTED and the stock its items
+        hold is released. Returns the number of reservations released, or None for an unknown job.
+        """
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        validated_order = job["results"].get("validate")
+        order_id = job["results"].get("json", {}).get("order_id")
+        if order_id is not None and self.pipeline.order_store is not None:
+            # The stored order also holds what re-validation reserved since
+            validated_order = self.pipeline.order_store.reject(order_id) or validated_order
+        return release_reservations(validated_order, self.pipeline.stock_ledger)
+
+    def close(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self.pipeline.close()
+        self.queue.close()
+        if self.pipeline.order_store is not None:
+            self.pipeline.order_store.close()
+        if self.pipeline.duplicate_detector is not None:
+            self.pipeline.duplicate_detector.close()
+        if self.pipeline.stock_ledger is not None:
+            self.pipeline.stock_ledger.close()
@@ -0,0 +1,276 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from .models import ProductRecord, SalesOrder
+from .output_generator import write_sales_order_json
+
+# Line item statuses a later catalog change can resolve: by SKU (restock, MOQ change)
+# or by requested name (a product added or renamed, an ambiguity removed)
+WAITING_ON_SKU = ("INSUFFICIENT_STOCK", "MOQ_NOT_MET")
+WAITING_ON_NAME = ("NOT_FOUND", "MULTIPLE_MATCHES_FOUND")
+
+
+def order_status(sales_order: SalesOrder) -> str:
+    """VALIDATED when every requested item was accepted, otherwise NEEDS_REVIEW."""
+    return "NEEDS_REVIEW" if sales_order.issues_for_review else "VALIDATED"
+
+
+def _as_timestamp(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode(value):
+    return value.to_dict() if isinstance(value, ProductRecord) else str(value)
+
+
+def waiting_items(validated_order: dict) -> list:
+    """(position, sku, requested_name, status) of the validated order's line items that wait on the catalog."""
+    waiting = []
+    for position, item in enumerate(validated_order.get("processed_line_items", [])):
+        if item["status"] in WAITING_ON_SKU:
+            waiting.append((position, item["product_details"]["Product_Code"], item["requested_name"], item["status"]))
+        elif item["status"] in WAITING_ON_NAME:
+            waiting.append((position, None, item["requested_name"], item["status"]))
+    return waiting
+
+
+class OrderStore:
+    """
+    SQLite store of finished sales orders.
+
+    Each order is stored once as its SO_*.json document, with indexed columns for
+    customer, creation time and status, and one row per line item / review issue
+    indexed by SKU and item status. Queries such as "orders with an
+    INSUFFICIENT_STOCK item this week" are index lookups instead of a scan of the
+    output directory. The JSON file layout remains available through export_json.
+
+    Orders appended with their validated order (the decision engine's output) keep it,
+    with their output paths and a reverse index from SKU and unresolved requested
+    name to the rejected line items, so an OrderRevalidator can re-check just those
+    items when the catalog changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, customer TEXT, customer_key TEXT,"
+            " created_at TEXT NOT NULL, status TEXT NOT NULL, document TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_key, created_at);"
+            "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at);"
+            "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, created_at);"
+            "CREATE TABLE IF NOT EXISTS order_items ("
+            " order_id INTEGER NOT NULL, sku TEXT, requested_item TEXT, status TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_items_status ON order_items (status, order_id);"
+            "CREATE INDEX IF NOT EXISTS idx_items_sku ON order_items (sku, order_id);"
+            "CREATE TABLE IF NOT EXISTS order_sources ("
+            " order_id INTEGER PRIMARY KEY, validated TEXT NOT NULL, json_path TEXT, pdf_path TEXT);"
+            "CREATE TABLE IF NOT EXISTS waiting_items ("
+            " order_id INTEGER NOT NULL, position INTEGER NOT NULL, sku TEXT, requested_name TEXT, status TEXT NOT NULL,"
+            " PRIMARY KEY (order_id, position));"
+            "CREATE INDEX IF NOT EXISTS idx_waiting_sku ON waiting_items (sku, order_id);"
+            # The job each queued order was stored by, so a retried job doesn't store it twice
+            "CREATE TABLE IF NOT EXISTS order_jobs (job_id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL);"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def append(self, sales_order: SalesOrder, validated_order=None, job_id=None) -> int:
+        return self.append_many([sales_order], [validated_order], None if job_id is None else [job_id])[0]
+
+    def append_many(self, sales_orders, validated_orders=None, job_ids=None) -> list:
+        """
+        Stores the orders in one transaction and returns their IDs. With `validated_orders`
+        (one per order, or None), the orders can be re-validated when the catalog changes.
+        With `job_ids`, an order whose job already stored one is not stored again, and
+        that order's ID is returned.
+        """
+        sales_orders = list(sales_orders)
+        validated_orders = list(validated_orders) if validated_orders is not None else [None] * len(sales_orders)
+        job_ids = list(job_ids) if job_ids is not None else [None] * len(sales_orders)
+        order_ids = []
+        with self._transaction() as conn:
+            for sales_order, validated_order, job_id in zip(sales_orders, validated_orders, job_ids):
+                stored = None if job_id is None else conn.execute(
+                    "SELECT order_id FROM order_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if stored:
+                    order_ids.append(stored[0])
+                    continue
+                summary = sales_order.summary
+                order_id = conn.execute(
+                    "INSERT INTO orders (customer, customer_key, created_at, status, document) VALUES (?, ?, ?, ?, ?)",
+                    (summary.customer_name, (summary.customer_name or "").strip().lower(),
+                     summary.generation_timestamp_utc or datetime.utcnow().isoformat(),
+                     order_status(sales_order), json.dumps(sales_order.to_dict()))
+                ).lastrowid
+                self._insert_items(conn, order_id, sales_order)
+                if validated_order is not None:
+                    conn.execute("INSERT INTO order_sources (order_id, validated) VALUES (?, ?)",
+                                 (order_id, json.dumps(validated_order, default=_encode)))
+                    self._insert_waiting(conn, order_id, validated_order)
+                if job_id is not None:
+                    conn.execute("INSERT INTO order_jobs (job_id, order_id) VALUES (?, ?)", (job_id, order_id))
+                order_ids.append(order_id)
+        return order_ids
+
+    @staticmethod
+    def _insert_items(conn, order_id, sales_order):
+        conn.executemany(
+            "INSERT INTO order_items (order_id, sku, requested_item, status) VALUES (?, ?, ?, ?)",
+            [(order_id, item.sku, item.product_name, "VALIDATED") for item in sales_order.line_items] +
+            [(order_id, issue.sku, issue.requested_item, issue.status) for issue in sales_order.issues_for_review]
+        )
+
+    @staticmethod
+    def _insert_waiting(conn, order_id, validated_order):
+        conn.executemany(
+            "INSERT INTO waiting_items (order_id, position, sku, requested_name, status) VALUES (?, ?, ?, ?, ?)",
+            [(order_id, *item) for item in waiting_items(validated_order)]
+        )
+
+    def set_outputs(self, order_id: int, json_path=None, pdf_path=None):
+        """Records where the order's JSON and PDF were written, so a re-validation can regenerate them in place."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE order_sources SET json_path = COALESCE(?, json_path), pdf_path = COALESCE(?, pdf_path)"
+                " WHERE order_id = ?", (json_path, pdf_path, order_id))
+
+    def waiting_on(self, skus=(), unresolved=False) -> list:
+        """
+        The rejected line items waiting on any of the SKUs (and, with `unresolved`, every
+        NOT_FOUND or ambiguous item), as (order_id, position, sku, requested_name, status, customer).
+        """
+        skus = list(dict.fromkeys(str(sku) for sku in skus))
+        clauses, params = [], []
+        # At most 500 SKUs per statement, under SQLite's bound-parameter limit
+        for start in range(0, len(skus), 500):
+            chunk = skus[start:start + 500]
+            clauses.append(f"w.sku IN ({','.join('?' * len(chunk))})")
+            params += chunk
+        if unresolved:
+            clauses.append("w.sku IS NULL")
+        if not clauses:
+            return []
+        with self._lock:
+            return self._conn.execute(
+                "SELECT w.order_id, w.position, w.sku, w.requested_name, w.status, o.customer"
+                " FROM waiting_items w JOIN orders o ON o.id = w.order_id"
+                f" WHERE {' OR '.join(clauses)} ORDER BY w.order_id, w.position", params
+            ).fetchall()
+
+    def source(self, order_id: int):
+        """Returns (validated_order, json_path, pdf_path) of an order appended with its validated order, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT validated, json_path, pdf_path FROM order_sources WHERE order_id = ?",
+                                     (order_id,)).fetchone()
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def replace(self, order_id: int, sales_order: SalesOrder, validated_order: dict):
+        """Stores a re-validated order in place of the old one, with its items and waiting items."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE orders SET status = ?, document = ? WHERE id = ?",
+                         (order_status(sales_order), json.dumps(sales_order.to_dict()), order_id))
+            conn.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+            self._insert_items(conn, order_id, sales_order)
+            conn.execute("UPDATE order_sources SET validated = ? WHERE order_id = ?",
+                         (json.dumps(validated_order, default=_encode), order_id))
+            conn.execute("DELETE FROM waiting_items WHERE order_id = ?", (order_id,))
+            self._insert_waiting(conn, order_id, validated_order)
+
+    def reject(self, order_id: int):
+        """
+        Marks an order REJECTED, so its waiting items are no longer re-validated. Returns its
+        validated order (whose reservations the caller releases), or None if it was not stored with one.
+        """
+        with self._transaction() as conn:
+            conn.execute("UPDATE orders SET status = 'REJECTED' WHERE id = ?", (order_id,))
+            conn.execute("DELETE FROM waiting_items WHERE order_id = ?", (order_id,))
+            row = conn.execute("SELECT validated FROM order_sources WHERE order_id = ?", (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, order_id: int):
+        """Returns the stored SalesOrder, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT document FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return SalesOrder.from_dict(json.loads(row[0])) if row else None
+
+    def _where(self, customer, status, item_status, sku, since, until):
+        clauses, params = [], []
+        if customer is not None:
+            clauses.append("o.customer_key = ?")
+            params.append(customer.strip().lower())
+        if status is not None:
+            clauses.append("o.status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("o.created_at >= ?")
+            params.append(_as_timestamp(since))
+        if until is not None:
+            clauses.append("o.created_at < ?")
+            params.append(_as_timestamp(until))
+        # Both item filters apply to the same item: "INSUFFICIENT_STOCK for DSK-0001", not one of each.
+        # An uncorrelated IN, since SQLite would run an EXISTS once per order instead of once.
+        item_clauses = []
+        if item_status is not None:
+            item_clauses.append("status = ?")
+            params.append(item_status)
+        if sku is not None:
+            item_clauses.append("sku = ?")
+            params.append(sku)
+        if item_clauses:
+            clauses.append(f"o.id IN (SELECT order_id FROM order_items WHERE {' AND '.join(item_clauses)})")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, customer=None, status=None, item_status=None, sku=None, since=None, until=None, limit=None):
+        """
+        Returns [(order_id, SalesOrder)] matching every given filter, newest first.
+
+        Args:
+            customer: Customer name (case-insensitive).
+            status: Order status, VALIDATED or NEEDS_REVIEW.
+            item_status: Orders with at least one item in this status, e.g. INSUFFICIENT_STOCK.
+            sku: Orders containing this Product_Code, validated or rejected for MOQ or stock.
+            since, until: UTC datetimes or ISO strings bounding the creation time.
+        """
+        where, params = self._where(customer, status, item_status, sku, since, until)
+        sql = f"SELECT o.id, o.document FROM orders o{where} ORDER BY o.created_at DESC, o.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(order_id, SalesOrder.from_dict(json.loads(document))) for order_id, document in rows]
+
+    def count(self, customer=None, status=None, item_status=None, sku=None, since=None, until=None) -> int:
+        where, params = self._where(customer, status, item_status, sku, since, until)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM orders o{where}", params).fetchone()[0]
+
+    def export_json(self, order_id: int, output_folder="output"):
+        """Writes a stored order in the SO_<customer>_<timestamp>.json layout. Returns the path, or None."""
+        sales_order = self.get(order_id)
+        return write_sales_order_json(sales_order, output_folder=output_folder) if sales_order else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
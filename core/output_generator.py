@@ -2,64 +2,87 @@ import json
 import re
 from datetime import datetime
 import os
-import pandas as pd
+from .models import SalesOrder, OrderSummary, LineItem, ReviewIssue
 
-def create_sales_order_json(processed_order: dict, output_folder="output"):
-    if not os.path.exists(output_folder): os.makedirs(output_folder)
-
-    customer_name = processed_order.get("customer_name", "UnknownCustomer")
-    safe_customer_name = re.sub(r'[^a-zA-Z0-9_-]', '', str(customer_name).replace(' ', '-'))
-    
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    filename = f"SO_{safe_customer_name}_{timestamp}.json"
-    filepath = os.path.join(output_folder, filename)
-
-    output_data = {
-        "sales_order_summary": processed_order.get("sales_order_summary", processed_order),
-        "line_items": [],
-        "issues_for_review": []
-    }
-    
+def build_sales_order(processed_order: dict) -> SalesOrder:
+    """Turns a validated order from the decision engine into a SalesOrder, without touching disk."""
     # Restructure the sales_order_summary to ensure it's clean
     summary = processed_order
-    output_data["sales_order_summary"] = {
-        "customer_name": summary.get("customer_name"),
-        "delivery_address": summary.get("delivery_address"),
-        "requested_delivery_date": summary.get("delivery_date"),
-        "notes": summary.get("customer_notes"),
-        "generation_timestamp_utc": datetime.utcnow().isoformat()
-    }
-
+    sales_order = SalesOrder(summary=OrderSummary(
+        customer_name=summary.get("customer_name"),
+        delivery_address=summary.get("delivery_address"),
+        requested_delivery_date=summary.get("delivery_date"),
+        notes=summary.get("customer_notes"),
+        generation_timestamp_utc=datetime.utcnow().isoformat()
+    ))
 
     for item in processed_order.get("processed_line_items", []):
         if item.get("status") == "VALIDATED":
             details = item.get("product_details", {})
-            quantity = item.get("requested_quantity", 0)
-            unit_price = pd.to_numeric(details.get("Price"), errors='coerce')
+            quantity = int(item.get("requested_quantity", 0))
+            # A ProductRecord (or its dict form from a checkpoint): the price is already a float or None
+            unit_price = details.get("Price")
             total_price = None
 
-            if pd.notna(unit_price):
+            if unit_price is not None:
                 total_price = round(quantity * unit_price, 2)
 
-            output_data["line_items"].append({
-                "sku": details.get("Product_Code"),
-                "product_name": details.get("Product_Name"),
-                "quantity": quantity,
-                "unit_price": unit_price if pd.notna(unit_price) else None,
-                "total_price": total_price
-            })
+            sales_order.line_items.append(LineItem(
+                sku=details.get("Product_Code"),
+                product_name=details.get("Product_Name"),
+                quantity=quantity,
+                unit_price=unit_price,
+                total_price=total_price
+            ))
         else:
-            output_data["issues_for_review"].append({
-                "requested_item": item.get("requested_name"),
-                "status": item.get("status"),
-                "details": item.get("issue")
-            })
-            
+            details = item.get("product_details") or {}
+            sales_order.issues_for_review.append(ReviewIssue(
+                requested_item=item.get("requested_name"),
+                status=item.get("status"),
+                details=item.get("issue"),
+                sku=details.get("Product_Code")
+            ))
+
+    return sales_order
+
+def new_sales_order_json_path(sales_order: SalesOrder, output_folder="output"):
+    """Claims a free SO_<customer>_<timestamp>.json name by creating the file empty, and returns its path."""
+    if not os.path.exists(output_folder): os.makedirs(output_folder)
+
+    customer_name = sales_order.summary.customer_name or "UnknownCustomer"
+    safe_customer_name = re.sub(r'[^a-zA-Z0-9_-]', '', str(customer_name).replace(' ', '-'))
+    
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    # Exclusive create, so two orders from the same customer in the same second get
+    # SO_<customer>_<timestamp>.json and SO_<customer>_<timestamp>-2.json instead of overwriting
+    suffix = 1
+    while True:
+        filename = f"SO_{safe_customer_name}_{timestamp}{'' if suffix == 1 else f'-{suffix}'}.json"
+        filepath = os.path.join(output_folder, filename)
+        try:
+            open(filepath, 'x').close()
+            return filepath
+        except FileExistsError:
+            suffix += 1
+
+def write_sales_order_json(sales_order: SalesOrder, output_folder="output", filepath=None):
+    """
+    JSON sink: writes a SalesOrder as SO_<customer>_<timestamp>.json and returns the path.
+    With `filepath` (e.g. one claimed earlier by new_sales_order_json_path) that file is overwritten instead.
+    """
     try:
+        if filepath is None:
+            filepath = new_sales_order_json_path(sales_order, output_folder)
         with open(filepath, 'w') as f:
-            json.dump(output_data, f, indent=4, default=str) # Use default=str to handle any rogue numpy types
+            # Every field is a plain Python type, so no default=str fallback is needed
+            json.dump(sales_order.to_dict(), f, indent=4)
         print(f"\n✅ Successfully created sales order file: {filepath}")
         return filepath
     except Exception as e:
         print(f"\n❌ Error creating JSON file: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def create_sales_order_json(processed_order: dict, output_folder="output"):
+    """Builds the sales order and writes it to a JSON file in one step. Returns the file path."""
+    return write_sales_order_json(build_sales_order(processed_order), output_folder=output_folder)
@@ -1,9 +1,11 @@
-import fitz
+import itertools
 import json
 import os
 import platform
+import threading
 from datetime import datetime
-import pandas as pd
+from .models import SalesOrder
+from . import metrics
 
 # --- THE FINAL, CORRECTED COORDINATE BLUEPRINT FOR THE NEW PDF ---
 COORDS = {
@@ -14,7 +16,10 @@ COORDS = {
     "table": {
         # Y-coordinate for the first data row, placed below the headers
         "first_row_y": 240, 
-        "row_height": 31,
+        # Matches the template's 28.35pt row boxes, so every row stays inside its box
+        "row_height": 28.35,
+        # The template has 15 row boxes above the total row; further rows go to continuation pages
+        "rows_per_page": 15,
         # X-coordinates for each column, centered within the boxes
         "col_code": 40, 
         "col_name": 120, 
@@ -24,9 +29,18 @@ COORDS = {
         "col_remarks": 530
     },
     # Y-coordinate for the final total, aligned with its label
-    "total_amount": (465, 665) 
+    "total_amount": (465, 665),
+    # The "Total Sales Order Amount:" label, relabelled as a page subtotal on all but the last page
+    "total_label_rect": (30, 655, 175, 676),
+    "total_label": (34, 669),
+    # Page number and page subtotal, below the table on multi-page orders
+    "page_footer": (34, 700)
 }
 
+# PyMuPDF is not thread-safe: documents are built one at a time per process, whichever
+# thread (API workers, the async pipeline's executor, the order revalidator) renders
+_fitz_lock = threading.Lock()
+
 def get_font_paths():
     """Detects the OS and returns the correct paths for standard fonts."""
     os_name = platform.system()
@@ -38,6 +52,187 @@ def get_font_paths():
         # A common fallback path
         return {"regular": "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"}
 
+def _table_rows(sales_order: SalesOrder):
+    """
+    Yields (sku, name, qty, price, line_total, remarks) for each of the order's line items,
+    then for each issue for review. Issues are unpriced and carry their details as the remark.
+    """
+    for item in sales_order.line_items:
+        yield item.sku or "", item.product_name or "", item.quantity, item.unit_price, item.total_price, ""
+    for issue in sales_order.issues_for_review:
+        yield "", issue.requested_item or "", None, None, None, issue.details or ""
+
+class PdfRenderer:
+    """
+    Renders sales orders onto the PDF template.
+
+    The template and font files are read once. On the first render they are parsed
+    into two documents kept for every later one: the template, which continuation
+    pages draw as a shared form, and a first page with the font already embedded,
+    which each order copies instead of re-parsing the template and font. Only the
+    glyphs a document actually uses are embedded, and output is saved without the
+    slow clean pass, so each order is a few dozen KB instead of ~570 KB.
+    """
+
+    def __init__(self, template_path: str, font_path=None):
+        with open(template_path, 'rb') as f:
+            self.template_bytes = f.read()
+        with open(font_path or get_font_paths()["regular"], 'rb') as f:
+            self.font_buffer = f.read()
+        self._template = None
+        self._first_page = None
+
+    def _parsed_template(self, fitz):
+        """Parses the template and the font-carrying first page once. Callers hold _fitz_lock."""
+        if self._template is None:
+            self._template = fitz.open("pdf", self.template_bytes)
+            first_page = fitz.open("pdf", self.template_bytes)
+            first_page[0].insert_font(fontname="reg", fontbuffer=self.font_buffer)
+            self._first_page = first_page
+        return self._template, self._first_page
+
+    def render(self, sales_order: SalesOrder, output_folder="output"):
+        """Fills the template for one SalesOrder and returns the PDF path."""
+        with _fitz_lock:
+            pdf_bytes = self._build(sales_order)
+
+        if not os.path.exists(output_folder): os.makedirs(output_folder)
+        safe_name = str(sales_order.summary.customer_name or "ORDER").replace(" ", "_")
+        ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+        # Exclusive create, so orders for the same customer in the same second don't overwrite each other
+        suffix = 1
+        while True:
+            output_path = os.path.join(output_folder, f"FILLED_SO_{safe_name}_{ts}{'' if suffix == 1 else f'-{suffix}'}.pdf")
+            try:
+                with open(output_path, 'xb') as f:
+                    f.write(pdf_bytes)
+                metrics.inc("pdfs_written_total")
+                metrics.inc("pdf_bytes_written_total", len(pdf_bytes))
+                break
+            except FileExistsError:
+                suffix += 1
+        print(f"📄 Successfully created filled PDF: {output_path}")
+        return output_path
+
+    def _build(self, sales_order: SalesOrder) -> bytes:
+        """
+        Builds the filled PDF for one order and returns its bytes. Callers hold _fitz_lock.
+
+        Orders with more rows than the template's table holds continue on extra pages that
+        reuse the template page as a shared form, each with its own page subtotal; the grand
+        total goes on the last page. Rows are laid out one page-sized chunk at a time.
+        """
+        import fitz # PyMuPDF is only loaded once the first PDF is rendered
+
+        template, first_page = self._parsed_template(fitz)
+        doc = fitz.open()
+        doc.insert_pdf(first_page)
+        summary = sales_order.summary
+
+        # Validated items and items with issues are all listed on the form
+        rows = _table_rows(sales_order)
+        rows_per_page = COORDS["table"]["rows_per_page"]
+        page_count = max(1, -(-(len(sales_order.line_items) + len(sales_order.issues_for_review)) // rows_per_page))
+
+        total_order_amount = 0
+        for page_number in range(1, page_count + 1):
+            if page_number == 1:
+                page = doc[0]
+                font_xref = next(font[0] for font in page.get_fonts() if font[4] == "reg")
+            else:
+                # Continuation page: the template drawn as a form XObject shared by every page,
+                # and the font embedded on the first page referenced instead of embedded again
+                page = doc.new_page(width=template[0].rect.width, height=template[0].rect.height)
+                page.show_pdf_page(page.rect, template, 0)
+                resources_xref = int(doc.xref_get_key(page.xref, "Resources")[1].split()[0])
+                doc.xref_set_key(resources_xref, "Font/reg", f"{font_xref} 0 R")
+
+            # All of a page's text is collected in one Shape and written to the page once
+            shape = page.new_shape()
+            chunk = list(itertools.islice(rows, rows_per_page))
+            page_subtotal = self._fill_page(shape, summary, chunk)
+            total_order_amount += page_subtotal
+
+            if page_number < page_count:
+                # The template's total row shows this page's subtotal on all but the last page
+                shape.draw_rect(fitz.Rect(COORDS["total_label_rect"]))
+                shape.finish(color=(1, 1, 1), fill=(1, 1, 1))
+                shape.insert_text(COORDS["total_label"], "Page Subtotal (continued):", fontname="reg", fontsize=11)
+                shape.insert_text(COORDS["total_amount"], f"{page_subtotal:.2f}", fontname="reg", fontsize=10)
+            else:
+                # --- Write Final Total ---
+                shape.insert_text(COORDS["total_amount"], f"{total_order_amount:.2f}", fontname="reg", fontsize=10)
+            if page_count > 1:
+                shape.insert_text(COORDS["page_footer"], f"Page {page_number} of {page_count} - Page subtotal: {page_subtotal:.2f}",
+                                  fontname="reg", fontsize=8)
+            shape.commit()
+
+        # --- Save the new PDF, embedding only the glyphs used ---
+        doc.subset_fonts()
+        pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+        doc.close()
+        return pdf_bytes
+
+    def _fill_page(self, shape, summary, rows):
+        """Adds the header and one page of table rows to the page's shape. Returns the page's subtotal."""
+        # --- 1. Fill Header Info (repeated on continuation pages) ---
+        # Customer name, delivery date and address sit on consecutive 30pt lines
+        header = [str(value or "N/A") for value in (summary.customer_name, summary.requested_delivery_date, summary.delivery_address)]
+        header_pitch = COORDS["delivery_date"][1] - COORDS["customer_name"][1]
+        shape.insert_text(COORDS["customer_name"], header, fontname="reg", fontsize=10, lineheight=header_pitch / 10)
+
+        # --- 2. Fill Line Items and Issues into the Table ---
+        # Each column goes in as one multi-line text block with the row pitch as line height,
+        # so a page costs six inserts however many rows it holds.
+        tbl = COORDS["table"]
+        columns = {"col_code": [], "col_name": [], "col_qty": [], "col_price": [], "col_total": [], "col_remarks": []}
+        page_subtotal = 0
+        for sku, name, qty, price, total_line, remarks_text in rows:
+            if total_line is not None:
+                page_subtotal += total_line
+
+            columns["col_code"].append(str(sku))
+            columns["col_name"].append(str(name))
+            columns["col_qty"].append(str(qty or ""))
+            columns["col_price"].append(f"{price:.2f}" if price is not None else "")
+            columns["col_total"].append(f"{total_line:.2f}" if total_line is not None else "")
+            columns["col_remarks"].append(remarks_text)
+
+        for column, lines in columns.items():
+            if not any(lines):
+                continue
+            fontsize = 8 if column == "col_remarks" else 9
+            color = (1, 0, 0) if column == "col_remarks" else None # Red text for issues
+            shape.insert_text((tbl[column], tbl["first_row_y"]), lines, fontname="reg", fontsize=fontsize,
+                             lineheight=tbl["row_height"] / fontsize, color=color)
+        return page_subtotal
+
+    def render_many(self, orders, output_folder="output"):
+        """Batch mode: renders many processed orders with the same template and font, returns their paths."""
+        if not os.path.exists(output_folder): os.makedirs(output_folder)
+        return [self.render(sales_order, output_folder=output_folder) for sales_order in orders]
+
+
+_renderers = {}
+
+def get_pdf_renderer(template_path: str):
+    """Returns the shared PdfRenderer for a template, creating it on first use."""
+    renderer = _renderers.get(template_path)
+    if renderer is None:
+        with metrics.span("pdf_renderer_setup"):
+            renderer = _renderers[template_path] = PdfRenderer(template_path)
+    return renderer
+
+def render_sales_order_pdf(sales_order: SalesOrder, template_path: str, output_folder="output"):
+    """Renders an in-memory SalesOrder with the shared renderer. Returns the PDF path."""
+    try:
+        renderer = get_pdf_renderer(template_path)
+    except Exception as e:
+        print(f"❌ FONT ERROR: Could not load system fonts. Please ensure Arial or Liberation Sans is available. Error: {e}")
+        return None
+
+    return renderer.render(sales_order, output_folder=output_folder)
+
 def fill_sales_order_pdf(json_path: str, template_path: str, output_folder="output"):
     """
     Reads a processed order from a JSON file and fills out the new PDF template.
@@ -48,62 +243,4 @@ def fill_sales_order_pdf(json_path: str, template_path: str, output_folder="outp
         print(f"❌ ERROR: JSON file not found at {json_path}")
         return
 
-    doc = fitz.open(template_path)
-    page = doc[0]
-
-    try:
-        fonts = get_font_paths()
-        page.insert_font(fontname="reg", fontfile=fonts["regular"])
-    except Exception as e:
-        print(f"❌ FONT ERROR: Could not load system fonts. Please ensure Arial or Liberation Sans is available. Error: {e}")
-        return
-
-    # --- 1. Fill Header Info ---
-    summary = order_data.get("sales_order_summary", {})
-    page.insert_text(COORDS["customer_name"], summary.get("customer_name", "N/A"), fontname="reg", fontsize=10)
-    page.insert_text(COORDS["delivery_date"], summary.get("requested_delivery_date", "N/A"), fontname="reg", fontsize=10)
-    page.insert_text(COORDS["address"], summary.get("delivery_address", "N/A"), fontname="reg", fontsize=10)
-    
-    # --- 2. Fill Line Items and Issues into the Table ---
-    tbl = COORDS["table"]
-    current_y = tbl["first_row_y"]
-    total_order_amount = 0
-
-    # Combine validated items and items with issues to list them all on the form
-    all_items_to_display = order_data.get("line_items", []) + order_data.get("issues_for_review", [])
-
-    for item in all_items_to_display:
-        # Get details whether it's a validated item or an issue
-        details = item.get("product_details", {})
-        qty = item.get("quantity", item.get("requested_quantity", 0))
-        price = pd.to_numeric(details.get("Price"), errors='coerce') if details else None
-        total_line = None
-        
-        sku_to_display = details.get("Product_Code", item.get("sku", ""))
-        name_to_display = details.get("Product_Name", item.get("product_name", item.get("requested_item", "")))
-        remarks_text = item.get("issue", "") # Use the issue as the remark
-        
-        if item.get("status") == "VALIDATED" and pd.notna(price):
-            total_line = qty * price
-            total_order_amount += total_line
-
-        # Insert data into PDF table rows
-        page.insert_text((tbl["col_code"], current_y), str(sku_to_display or ""), fontname="reg", fontsize=9)
-        page.insert_text((tbl["col_name"], current_y), str(name_to_display or ""), fontname="reg", fontsize=9)
-        page.insert_text((tbl["col_qty"], current_y), str(qty or ""), fontname="reg", fontsize=9)
-        page.insert_text((tbl["col_price"], current_y), f"{price:.2f}" if pd.notna(price) else "", fontname="reg", fontsize=9)
-        page.insert_text((tbl["col_total"], current_y), f"{total_line:.2f}" if total_line is not None else "", fontname="reg", fontsize=9)
-        page.insert_text((tbl["col_remarks"], current_y), remarks_text or "", fontname="reg", fontsize=8, color=(1, 0, 0)) # Red text for issues
-        
-        current_y += tbl["row_height"]
-
-    # --- 3. Write Final Total ---
-    page.insert_text(COORDS["total_amount"], f"{total_order_amount:.2f}", fontname="reg", fontsize=10)
-
-    # --- 4. Save the new PDF ---
-    if not os.path.exists(output_folder): os.makedirs(output_folder)
-    safe_name = str(summary.get("customer_name", "ORDER")).replace(" ", "_")
-    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    output_path = os.path.join(output_folder, f"FILLED_SO_{safe_name}_{ts}.pdf")
-    doc.save(output_path, garbage=4, deflate=True, clean=True)
-    print(f"📄 Successfully created filled PDF: {output_path}")
\ No newline at end of file
+    return render_sales_order_pdf(SalesOrder.from_dict(order_data), template_path, output_folder=output_folder)
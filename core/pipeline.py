@@ -0,0 +1,254 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from .llm_extractor import extract_order_details_from_email, extract_order_details_from_emails
+from .decision_engine import process_and_validate_order, release_reservations
+from .output_generator import build_sales_order, write_sales_order_json
+from .pdf_writer import render_sales_order_pdf
+from .models import SalesOrder
+from .duplicate_detector import DuplicateMatch
+from . import metrics
+
+
+def _completed(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+@dataclass
+class PipelineResult:
+    sales_order: Optional[SalesOrder]
+    pdf_path: Optional[str] = None
+    json_future: Optional[Future] = None
+    store_future: Optional[Future] = None
+    duplicate_of: Optional[DuplicateMatch] = None  # Set when the email repeats an order that was already processed
+
+    @property
+    def json_path(self):
+        """Path of the JSON file, waiting for the background write if it is still running."""
+        return self.json_future.result() if self.json_future else None
+
+    @property
+    def order_id(self):
+        """ID of the order in the OrderStore, waiting for the background append if it is still running."""
+        return self.store_future.result() if self.store_future else None
+
+
+class OrderPipeline:
+    """
+    Runs orders through extract -> validate -> build -> PDF, handing a SalesOrder
+    from stage to stage in memory.
+
+    Writing the JSON file and appending to an OrderStore are optional sinks: they run
+    on a background thread while the PDF is rendered, and are never re-read by a
+    later stage.
+
+    With a DuplicateDetector, emails that repeat a recently processed order (resends,
+    forwards, replies quoting it) are linked to that order instead of being extracted
+    again.
+    """
+
+    def __init__(self, inventory_df, template_path="sales_order_form_full.pdf", output_folder="output",
+                 write_json=True, model_client=None, stock_ledger=None, order_store=None, alias_store=None,
+                 duplicate_detector=None):
+        self.inventory_df = inventory_df
+        self.template_path = template_path
+        self.output_folder = output_folder
+        self.model_client = model_client
+        self.stock_ledger = stock_ledger
+        self.order_store = order_store
+        self.alias_store = alias_store
+        self.duplicate_detector = duplicate_detector
+        self.write_json = write_json
+        self._sink_executor = None
+        if write_json or order_store is not None:
+            self._sink_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="order-sink")
+
+    def register_email(self, email_body: str, **order_ref):
+        """
+        Checks the email against recently processed ones before extraction. Returns
+        (entry_id, None) for a new email and (None, DuplicateMatch) for a near-duplicate;
+        (None, None) without a detector.
+        """
+        if self.duplicate_detector is None:
+            return None, None
+        with metrics.span("dedupe"):
+            entry_id, match = self.duplicate_detector.register(email_body, order_ref)
+        if match is not None:
+            metrics.inc("duplicate_emails_total")
+        return entry_id, match
+
+    def link_email(self, entry_id, **order_ref):
+        """Stores where the order of a registered email ended up, for the duplicates that follow it."""
+        if self.duplicate_detector is not None and entry_id is not None:
+            self.duplicate_detector.update(entry_id, **order_ref)
+
+    def forget_email(self, entry_id):
+        """Unregisters an email that produced no order, so a resend is processed normally."""
+        if self.duplicate_detector is not None and entry_id is not None:
+            self.duplicate_detector.discard(entry_id)
+
+    def link_result(self, entry_id, result: PipelineResult):
+        """
+        link_email with the outputs of a processed order. An order whose PDF or background
+        store append failed is forgotten instead, so a resend is processed again.
+        """
+        def link():
+            try:
+                order_ref = {"order_id": result.order_id, "json_path": result.json_path, "pdf_path": result.pdf_path,
+                             "customer_name": result.sales_order.summary.customer_name}
+            except Exception:
+                order_ref = None
+            if order_ref is None or not order_ref["pdf_path"]:
+                self.forget_email(entry_id)
+            else:
+                self.link_email(entry_id, **order_ref)
+        if entry_id is None:
+            return
+        # The order ID and JSON path come from the background sinks, so link once they finish
+        if self._sink_executor is not None:
+            self._sink_executor.submit(link)
+        else:
+            link()
+
+    def duplicate_result(self, match: DuplicateMatch) -> PipelineResult:
+        """The result of an email that repeats an earlier order: that order's outputs, nothing new written."""
+        ref = match.order_ref
+        sales_order = None
+        if self.order_store is not None and ref.get("order_id") is not None:
+            sales_order = self.order_store.get(ref["order_id"])
+        return PipelineResult(sales_order=sales_order, pdf_path=ref.get("pdf_path"),
+                              json_future=_completed(ref.get("json_path")), store_future=_completed(ref.get("order_id")),
+                              duplicate_of=match)
+
+    def extract(self, email_body: str):
+        with metrics.span("extract"):
+            return extract_order_details_from_email(email_body, model_client=self.model_client, inventory_df=self.inventory_df)
+
+    def extract_many(self, email_bodies) -> list:
+        """Extracts several emails with batched LLM requests. Returns one order dict (or None) per email."""
+        with metrics.span("extract_batch"):
+            return extract_order_details_from_emails(email_bodies, model_client=self.model_client, inventory_df=self.inventory_df)
+
+    def validate(self, extracted_order: dict, reservation_id=None) -> dict:
+        with metrics.span("validate"):
+            return process_and_validate_order(extracted_order, self.inventory_df, stock_ledger=self.stock_ledger,
+                                              alias_store=self.alias_store, reservation_id=reservation_id)
+
+    def _timed_sink(self, stage, func, *args):
+        with metrics.span(stage):
+            return func(*args)
+
+    def _store_outputs(self, store_future, json_future, pdf_path):
+        self.order_store.set_outputs(store_future.result(), json_future.result() if json_future else None, pdf_path)
+
+    def process_extracted(self, extracted_order: dict) -> PipelineResult:
+        """Runs every stage after extraction for one order."""
+        with metrics.trace(customer_name=extracted_order.get("customer_name")):
+            validated_order = self.validate(extracted_order)
+            try:
+                return self._process_validated(validated_order)
+            except Exception:
+                # The order was not produced, so its items don't keep their stock
+                release_reservations(validated_order, self.stock_ledger)
+                raise
+
+    def _process_validated(self, validated_order: dict) -> PipelineResult:
+        with metrics.span("build"):
+            sales_order = build_sales_order(validated_order)
+
+        json_future = store_future = None
+        if self.write_json:
+            json_future = self._sink_executor.submit(self._timed_sink, "json", write_sales_order_json,
+                                                     sales_order, self.output_folder)
+        if self.order_store is not None:
+            store_future = self._sink_executor.submit(self._timed_sink, "store", self.order_store.append,
+                                                      sales_order, validated_order)
+
+        with metrics.span("pdf"):
+            pdf_path = render_sales_order_pdf(sales_order, self.template_path, output_folder=self.output_folder)
+        if store_future is not None:
+            # Lets an OrderRevalidator regenerate the files in place after a catalog change
+            self._sink_executor.submit(self._store_outputs, store_future, json_future, pdf_path)
+        return PipelineResult(sales_order=sales_order, pdf_path=pdf_path, json_future=json_future, store_future=store_future)
+
+    def process_email(self, email_body: str):
+        """
+        Runs the whole pipeline for one email. Returns None if no order could be extracted,
+        and the earlier order's result (with `duplicate_of` set) for a near-duplicate.
+        """
+        with metrics.trace() as trace_record:
+            entry_id, match = self.register_email(email_body)
+            if match is not None:
+                trace_record["duplicate_of"] = match.entry_id
+                return self.duplicate_result(match)
+            try:
+                extracted_order = self.extract(email_body)
+                if not extracted_order:
+                    trace_record["error"] = "No order could be extracted."
+                    self.forget_email(entry_id)
+                    return None
+                result = self.process_extracted(extracted_order)
+            except BaseException:
+                # A failed email must not be left registered, or its resends would be dropped as duplicates
+                self.forget_email(entry_id)
+                raise
+            self.link_result(entry_id, result)
+            return result
+
+    def process_emails(self, email_bodies) -> list:
+        """
+        Runs many emails, extracting them in batches first. Returns a PipelineResult (or None)
+        per email; near-duplicates are not extracted and get the earlier order's result.
+        """
+        email_bodies = list(email_bodies)
+        registered = []
+        batch_results = {}  # entry_id -> result (None if it failed), for copies of an email earlier in the batch
+        try:
+            for email_body in email_bodies:
+                registered.append(self.register_email(email_body))
+            new = [i for i, (_, match) in enumerate(registered) if match is None]
+            extracted_orders = dict(zip(new, self.extract_many([email_bodies[i] for i in new]) if new else []))
+
+            results = []
+            for i, (entry_id, match) in enumerate(registered):
+                with metrics.trace() as trace_record:
+                    if match is not None:
+                        trace_record["duplicate_of"] = match.entry_id
+                        if match.entry_id in batch_results:
+                            earlier = batch_results[match.entry_id]
+                            results.append(earlier and PipelineResult(earlier.sales_order, earlier.pdf_path,
+                                                                      earlier.json_future, earlier.store_future,
+                                                                      duplicate_of=match))
+                        else:
+                            results.append(self.duplicate_result(match))
+                        continue
+                    result = None
+                    if not extracted_orders[i]:
+                        trace_record["error"] = "No order could be extracted."
+                        self.forget_email(entry_id)
+                    else:
+                        result = self.process_extracted(extracted_orders[i])
+                        self.link_result(entry_id, result)
+                    batch_results[entry_id] = result
+                    results.append(result)
+            return results
+        except BaseException:
+            # Unregister the emails that were not processed, so their resends are not dropped as duplicates
+            for entry_id, match in registered:
+                if match is None and entry_id not in batch_results:
+                    self.forget_email(entry_id)
+            raise
+
+    def close(self):
+        """Waits for any background JSON writes and store appends to finish."""
+        if self._sink_executor is not None:
+            self._sink_executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
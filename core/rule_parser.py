@@ -0,0 +1,149 @@
+import re
+
+# --- Product line formats seen in customer emails ---
+BULLET = r'^\s*(?:[-*•·]|\d+[.)])?\s*'
+UNIT = r'(?:x|×|units?|pcs?\.?|pieces?|qty\.?)'
+PRODUCT_LINE_PATTERNS = [
+    # "- 9 x Coffee STRÅDAL 620", "3 units of Bar FJÄRMARK 344", "8 pieces: Office LUNDMARK 699"
+    re.compile(BULLET + r'(?P<qty>\d+|a dozen|dozen)\s*' + UNIT + r'\s*(?:of\s+|:\s*)?(?P<name>\S.*?)\s*$', re.IGNORECASE),
+    # "* Bed TRÄNBERG 858 – Qty: 2", "Loveseat FJÄRBERG 744 – need 7 pcs"
+    re.compile(BULLET + r'(?P<name>\S.*?)\s*[–—:-]\s*(?:qty|quantity|need|x)\s*:?\s*(?P<qty>\d+)\s*(?:' + UNIT + r')?\s*$', re.IGNORECASE),
+    # "Sofa VIKTMARK 446 x 10"
+    re.compile(BULLET + r'(?P<name>\S.*?)\s+[x×]\s*(?P<qty>\d+)\s*$', re.IGNORECASE),
+]
+
+ADDRESS_LABEL = re.compile(
+    r'^\s*(?:please\s+)?(?:do\s+)?(?:ship(?:\s+(?:it|them))?|send(?:\s+(?:it|them))?|deliver(?:\s+(?:it|them))?|delivery\s+address|shipping\s+address|address)\s*(?:to)?\s*:\s*(?P<value>.*)$',
+    re.IGNORECASE
+)
+
+MONTHS = r'(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)'
+DATE_PATTERNS = [
+    re.compile(MONTHS + r'\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}', re.IGNORECASE),
+    re.compile(r'\d{1,2}(?:st|nd|rd|th)?\s+' + MONTHS + r'\.?,?\s+\d{4}', re.IGNORECASE),
+    re.compile(r'\b\d{4}-\d{2}-\d{2}\b'),
+    re.compile(r'\b\d{1,2}/\d{1,2}/\d{4}\b'),
+]
+
+SIGN_OFF = re.compile(r'^\s*(?:thanks|thank you|cheers|sincerely|regards|best|best regards|kind regards|warm regards|many thanks)\b.*,?\s*$', re.IGNORECASE)
+
+# Share of the confidence score each part of a successful parse contributes. Every part weighs
+# more than 1 - RULE_PARSER_MIN_CONFIDENCE, so an email missing any of them goes to the LLM.
+CONFIDENCE_WEIGHTS = {"products": 0.4, "delivery_address": 0.2, "customer_name": 0.2, "delivery_date": 0.2}
+# Subtracted for each line the parser skipped that may change the order: one with a number
+# ("make that 5 instead") or naming a catalog product
+UNPARSED_LINE_PENALTY = 0.2
+
+
+def _parse_quantity(raw: str) -> int:
+    return 12 if 'dozen' in raw.lower() else int(raw)
+
+
+def parse_product_line(line: str):
+    """Returns {'product_name', 'quantity'} if the line is a recognised quantity/product line."""
+    for pattern in PRODUCT_LINE_PATTERNS:
+        match = pattern.match(line)
+        if match and re.search(r'[A-Za-zÀ-ÿ]', match.group('name')):
+            return {"product_name": match.group('name').strip(), "quantity": _parse_quantity(match.group('qty'))}
+    return None
+
+
+def find_date(text: str):
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return match.group(0)
+    return None
+
+
+def parse_order_email(email_body: str, mentions_product=None):
+    """
+    Parses a structured order email without the LLM.
+
+    `mentions_product(line)`, if given, tells whether free text names a catalog product;
+    such lines, like those with numbers, lower the confidence when they were not parsed.
+
+    Returns:
+        (order, confidence): `order` uses the same keys as the 'log_sales_order'
+        function call, and `confidence` is a score between 0 and 1.
+    """
+    lines = [line.rstrip() for line in str(email_body).replace('\r\n', '\n').split('\n')]
+    products, structured_lines = [], set()
+
+    # --- Products ---
+    for i, line in enumerate(lines):
+        item = parse_product_line(line)
+        if item:
+            products.append(item)
+            structured_lines.add(i)
+
+    # --- Customer name: the first line after the sign-off ---
+    customer_name, sign_off_line = None, None
+    for i, line in enumerate(lines):
+        if SIGN_OFF.match(line):
+            following = [(j, l.strip()) for j, l in enumerate(lines[i + 1:], start=i + 1) if l.strip()]
+            if following and len(following[0][1].split()) <= 5:
+                sign_off_line, customer_name = i, following[0][1]
+                structured_lines.update({i, following[0][0]})
+
+    # --- Delivery address: a labelled line, or the block under a bare label ---
+    delivery_address = None
+    for i, line in enumerate(lines):
+        match = ADDRESS_LABEL.match(line)
+        if not match:
+            continue
+        structured_lines.add(i)
+        block = [match.group('value').strip()] if match.group('value').strip() else []
+        if not block:
+            for j in range(i + 1, len(lines)):
+                if not lines[j].strip():
+                    break
+                block.append(lines[j].strip())
+                structured_lines.add(j)
+        # The customer often repeats their name as the first part of the address
+        if block and customer_name and block[0].lower().startswith(customer_name.lower()):
+            block[0] = block[0][len(customer_name):].lstrip(' ,')
+            if not block[0]:
+                block = block[1:]
+        if block:
+            delivery_address = ", ".join(block)
+            break
+
+    # Without a sign-off, take the name from an address block like "Ship to: Jane Doe, 1 Main St"
+    if customer_name is None:
+        for i, line in enumerate(lines):
+            match = ADDRESS_LABEL.match(line)
+            value = match.group('value').strip() if match else ''
+            if value and ',' in value and not re.search(r'\d', value.split(',')[0]):
+                customer_name = value.split(',')[0].strip()
+                delivery_address = value.split(',', 1)[1].strip()
+                break
+
+    # --- Delivery date ---
+    delivery_date = None
+    for i, line in enumerate(lines):
+        delivery_date = find_date(line)
+        if delivery_date:
+            structured_lines.add(i)
+            break
+
+    # --- Notes: free text between the last structured line and the sign-off ---
+    last_structured = max((i for i in structured_lines if i != sign_off_line and (sign_off_line is None or i < sign_off_line)), default=None)
+    notes_end = sign_off_line if sign_off_line is not None else len(lines)
+    notes = [l.strip() for l in lines[(last_structured + 1 if last_structured is not None else notes_end):notes_end] if l.strip()]
+
+    # Free text before the sign-off that may add to or change the order, which the rules can't read
+    body_end = sign_off_line if sign_off_line is not None else len(lines)
+    unparsed = [l for i, l in enumerate(lines[:body_end]) if i not in structured_lines and l.strip()
+                and (re.search(r'\d', l) or (mentions_product is not None and mentions_product(l)))]
+
+    order = {
+        "customer_name": customer_name,
+        "delivery_address": delivery_address,
+        "delivery_date": delivery_date,
+        "customer_notes": " ".join(notes) or None,
+        "products": products,
+    }
+    confidence = sum(weight for key, weight in CONFIDENCE_WEIGHTS.items() if order.get(key))
+    confidence -= UNPARSED_LINE_PENALTY * len(unparsed)
+    return order, round(max(confidence, 0.0), 2)
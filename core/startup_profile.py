@@ -0,0 +1,91 @@
+"""
+Startup profiling for `--profile-startup`.
+
+`start()` wraps the import statement so every module imported afterwards is timed
+(cumulative, including the modules it imports, and self time), like `python -X
+importtime` but inside the running process. `report()` prints the slowest imports,
+the one-off initialization steps recorded as metrics spans (catalog load, PDF
+renderer and LLM model setup, ...) and the time since start.
+"""
+import builtins
+import importlib.util
+import sys
+import time
+
+from . import metrics
+
+INIT_STAGES = ("catalog_load", "pdf_renderer_setup", "llm_model_setup")
+
+_original_import = builtins.__import__
+_started = None
+_imports = {}      # module -> (depth, cumulative seconds, self seconds), in import order
+_stack = []        # child time of the imports in progress
+
+
+def _module_name(name, globals_, level):
+    if level == 0:
+        return name
+    package = (globals_ or {}).get("__package__") or ""
+    try:
+        return importlib.util.resolve_name("." * level + name, package)
+    except (ImportError, ValueError):
+        return name
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module_name = _module_name(name, globals, level)
+    if module_name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    depth = len(_stack)
+    _imports[module_name] = None # Reserves the module's place, so the report lists parents before children
+    _stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _imports[module_name] = (depth, elapsed, elapsed - children)
+
+
+def start():
+    """Starts timing imports. Call before the application modules are imported."""
+    global _started
+    if _started is None:
+        _started = time.perf_counter()
+        builtins.__import__ = _timed_import
+
+
+def stop():
+    builtins.__import__ = _original_import
+
+
+def report(min_ms=5.0, max_depth=2, label="startup"):
+    """
+    Prints the import tree (imports of at least `min_ms`, nested up to `max_depth`),
+    the initialization steps and the elapsed time since start().
+    """
+    if _started is None:
+        return
+    stop()
+    elapsed = time.perf_counter() - _started
+    print(f"\n⏱️  Startup profile ({label} after {elapsed:.3f}s)")
+    print(f"  {'module':<44} {'cumulative':>11} {'self':>9}")
+    for module_name, timing in _imports.items():
+        if timing is None:
+            continue
+        depth, cumulative, self_time = timing
+        if depth <= max_depth and cumulative * 1000 >= min_ms:
+            name = "  " * depth + module_name
+            print(f"  {name:<44} {cumulative * 1000:9.1f}ms {self_time * 1000:7.1f}ms")
+
+    histograms = metrics.snapshot()["histograms"]
+    steps = [(stage, histograms.get(f'stage_duration_seconds{{stage="{stage}"}}')) for stage in INIT_STAGES]
+    steps = [(stage, h) for stage, h in steps if h]
+    if steps:
+        print("  initialization")
+        for stage, h in steps:
+            print(f"  {stage:<44} {h['sum'] * 1000:9.1f}ms")
@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+
+class StockLedger:
+    """
+    Stock reservation ledger keyed by Product_Code, shared through SQLite by every
+    process and thread that opens the same path: the worker modes, pool children
+    and the API's workers.
+
+    Each SKU has its own lock, so orders touching different products never wait on
+    each other; `contention` counts, per SKU, how often a reserve had to wait. Each
+    line is reserved with one conditional INSERT that only succeeds while the SKU's
+    active holds plus the line fit its stock, so another process can never take the
+    same units. An order's lines are reserved in sorted SKU order, and if one falls
+    short the lines already reserved are taken back: either every item is reserved
+    or none is.
+
+    A hold lasts until it is released (a failed, rejected or re-validated order) or
+    until the catalog's stock is decremented for it: `on_catalog_change` consumes
+    holds oldest first as a SKU's stock drops. Holds never lapse on their own, since
+    until then the catalog still counts the units as available. Without a `db_path`
+    the ledger lives in a temporary file and covers only this process.
+    """
+
+    def __init__(self, db_path=None):
+        self._temporary = None
+        if not db_path:
+            handle, db_path = tempfile.mkstemp(suffix=".sqlite", prefix="stock_ledger_")
+            os.close(handle)
+            self._temporary = db_path
+        self.db_path = db_path
+
+        folder = os.path.dirname(db_path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+
+        self._local = threading.local() # One connection per thread, so threads don't queue on a shared one
+        self._connections = []
+        self._sku_locks = {}
+        self._registry_lock = threading.Lock() # Only guards creation of per-SKU locks and connections
+        self.contention = Counter() # sku -> times a reserve had to wait for its lock
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS stock_holds ("
+            " reservation_id TEXT NOT NULL, sku TEXT NOT NULL, quantity INTEGER NOT NULL,"
+            " status TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (reservation_id, sku));"
+            "CREATE INDEX IF NOT EXISTS idx_stock_holds_sku ON stock_holds (sku, status, created_at);"
+            # The last catalog stock figure each SKU's holds were reconciled against
+            "CREATE TABLE IF NOT EXISTS stock_levels (sku TEXT PRIMARY KEY, stock INTEGER NOT NULL);"
+        )
+        # Released and consumed holds no longer hold anything
+        conn.execute("DELETE FROM stock_holds WHERE status != 'ACTIVE'")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._registry_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _lock_for(self, sku):
+        lock = self._sku_locks.get(sku)
+        if lock is None:
+            with self._registry_lock:
+                lock = self._sku_locks.setdefault(sku, threading.Lock())
+        return lock
+
+    def _acquire(self, sku):
+        lock = self._lock_for(sku)
+        if not lock.acquire(blocking=False):
+            lock.acquire()
+            self.contention[sku] += 1
+        return lock
+
+    @staticmethod
+    def _held(conn, sku) -> int:
+        return conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0) FROM stock_holds WHERE sku = ? AND status = 'ACTIVE'", (sku,)
+        ).fetchone()[0]
+
+    def reserved(self, sku) -> int:
+        """Units of a SKU currently held by active reservations."""
+        return self._held(self._conn(), sku)
+
+    def reserve(self, lines, reservation_id=None):
+        """
+        Atomically checks and reserves all lines of one order.
+
+        Args:
+            lines: iterable of (sku, quantity, stock) tuples. A stock of None means
+                the catalog has no stock figure, so the line is not limited.
+            reservation_id: a caller's key for the reservation (e.g. its job), so a
+                retried order finds its earlier reservation instead of holding twice.
+
+        Returns:
+            (reservation_id, {}) on success, or (None, {sku: units_still_available})
+            for every SKU that could not be covered, in which case nothing is reserved.
+        """
+        requested = defaultdict(int)
+        stock_by_sku = {}
+        for sku, quantity, stock in lines:
+            requested[sku] += int(quantity)
+            stock_by_sku[sku] = stock
+
+        conn = self._conn()
+        if reservation_id is not None:
+            held = dict(conn.execute("SELECT sku, quantity FROM stock_holds WHERE reservation_id = ? AND status = 'ACTIVE'",
+                                     (reservation_id,)).fetchall())
+            if held == requested:
+                return reservation_id, {}
+            self.release(reservation_id) # The order changed since: reserve it afresh
+        reservation_id = reservation_id or uuid.uuid4().hex
+
+        now = time.time()
+        held_locks = [self._acquire(sku) for sku in sorted(requested)]
+        try:
+            reserved, shortfalls = [], {}
+            for sku in sorted(requested):
+                quantity, stock = requested[sku], stock_by_sku[sku]
+                # One statement: the check and the hold can't be split by another process
+                inserted = conn.execute(
+                    "INSERT OR REPLACE INTO stock_holds (reservation_id, sku, quantity, status, created_at, updated_at)"
+                    " SELECT ?, ?, ?, 'ACTIVE', ?, ? WHERE ? IS NULL OR ? + (SELECT COALESCE(SUM(quantity), 0)"
+                    " FROM stock_holds WHERE sku = ? AND status = 'ACTIVE') <= ?",
+                    (reservation_id, sku, quantity, now, now, stock, quantity, sku, stock)
+                ).rowcount
+                if inserted:
+                    reserved.append(sku)
+                else:
+                    shortfalls[sku] = max(int(stock) - self._held(conn, sku), 0)
+                    break
+            if shortfalls:
+                conn.executemany("DELETE FROM stock_holds WHERE reservation_id = ? AND sku = ?",
+                                 [(reservation_id, sku) for sku in reserved])
+                # Report every short SKU, not just the first, so the caller can downgrade them together
+                for sku in sorted(requested):
+                    stock = stock_by_sku[sku]
+                    if sku not in shortfalls and stock is not None and int(stock) - self._held(conn, sku) < requested[sku]:
+                        shortfalls[sku] = max(int(stock) - self._held(conn, sku), 0)
+                return None, shortfalls
+        finally:
+            for lock in held_locks:
+                lock.release()
+        return reservation_id, {}
+
+    def release(self, reservation_id):
+        """Returns the units of a reservation (e.g. a failed or rejected order) to the pool."""
+        if not reservation_id:
+            return False
+        released = self._conn().execute(
+            "UPDATE stock_holds SET status = 'RELEASED', updated_at = ? WHERE reservation_id = ? AND status = 'ACTIVE'",
+            (time.time(), reservation_id)
+        ).rowcount
+        return released > 0
+
+    def consume(self, sku, previous_stock, stock) -> int:
+        """
+        Records that the catalog's stock of a SKU went from `previous_stock` to `stock`.
+        A drop consumes that many held units, oldest holds first, since the catalog now
+        counts them itself. Every process sees the same change, but only the first to
+        record it consumes. Returns the units consumed.
+        """
+        if previous_stock is None or stock is None:
+            return 0
+        conn = self._conn()
+        with self._lock_for(sku):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR IGNORE INTO stock_levels (sku, stock) VALUES (?, ?)", (sku, int(previous_stock)))
+                applied = conn.execute("UPDATE stock_levels SET stock = ? WHERE sku = ? AND stock = ?",
+                                       (int(stock), sku, int(previous_stock))).rowcount
+                remaining = int(previous_stock) - int(stock) if applied else 0
+                consumed = 0
+                now = time.time()
+                holds = conn.execute("SELECT reservation_id, quantity FROM stock_holds WHERE sku = ? AND status = 'ACTIVE'"
+                                     " ORDER BY created_at", (sku,)).fetchall() if remaining > 0 else []
+                for reservation_id, quantity in holds:
+                    if remaining <= 0:
+                        break
+                    taken = min(quantity, remaining)
+                    conn.execute(
+                        "UPDATE stock_holds SET quantity = quantity - ?,"
+                        " status = CASE WHEN quantity = ? THEN 'CONSUMED' ELSE status END, updated_at = ?"
+                        " WHERE reservation_id = ? AND sku = ?", (taken, taken, now, reservation_id, sku))
+                    remaining -= taken
+                    consumed += taken
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return consumed
+
+    def on_catalog_change(self, changes) -> int:
+        """
+        CatalogService listener: consumes holds for every stock decrement. Returns the units
+        consumed. Errors are reported, not raised, so the catalog update itself stands.
+        """
+        try:
+            return sum(self.consume(change['Product_Code'], change['previous_stock'], change['Available_in_Stock'])
+                       for change in changes if 'previous_stock' in change)
+        except Exception as e:
+            print(f"❌ Consuming stock reservations failed: {e}")
+            return 0
+
+    def close(self):
+        with self._registry_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+        if self._temporary:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self._temporary + suffix):
+                    os.remove(self._temporary + suffix)
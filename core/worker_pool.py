@@ -0,0 +1,126 @@
+import gc
+import multiprocessing as mp
+import os
+import time
+from collections import defaultdict
+from multiprocessing.util import Finalize
+
+from .alias_store import AliasStore
+from .duplicate_detector import DuplicateDetector
+from .order_store import OrderStore
+from .pipeline import OrderPipeline
+from .stock_ledger import StockLedger
+
+# Set in the parent before the pool forks, so every child reads the same catalog pages
+# (copy-on-write) instead of loading or unpickling its own copy.
+_shared_catalog = None
+_pipeline = None
+
+
+def _init_child(catalog, template_path, output_folder, stock_ledger_path=None, order_store_path=None,
+                alias_store_path=None, duplicate_index_path=None, duplicate_options=None):
+    global _shared_catalog, _pipeline
+    if catalog is not None:
+        # Only without fork (e.g. Windows/macOS spawn) is the catalog sent to each child
+        _shared_catalog = catalog
+    # Each child opens its own connections to the shared stores; their transactions keep the children consistent
+    stock_ledger = StockLedger(stock_ledger_path) if stock_ledger_path else None
+    order_store = OrderStore(order_store_path) if order_store_path else None
+    alias_store = AliasStore(alias_store_path) if alias_store_path else None
+    duplicate_detector = DuplicateDetector(duplicate_index_path, **(duplicate_options or {})) \
+        if duplicate_index_path else None
+    _pipeline = OrderPipeline(_shared_catalog, template_path=template_path, output_folder=output_folder,
+                              order_store=order_store, alias_store=alias_store, stock_ledger=stock_ledger,
+                              duplicate_detector=duplicate_detector)
+    # Runs when the child exits, so background store appends finish and the stores are closed
+    Finalize(_pipeline, _close_child, exitpriority=10)
+
+
+def _close_child():
+    _pipeline.close()
+    for store in (_pipeline.order_store, _pipeline.alias_store, _pipeline.duplicate_detector, _pipeline.stock_ledger):
+        if store is not None:
+            store.close()
+
+
+def _process_order(job):
+    position, email_body = job
+    started = time.perf_counter()
+    outcome = {"position": position, "pid": os.getpid(), "ok": False, "pdf_path": None, "json_path": None, "error": None}
+    try:
+        result = _pipeline.process_email(email_body)
+        if result is None:
+            outcome["error"] = "No order could be extracted."
+        else:
+            outcome.update(ok=True, pdf_path=result.pdf_path, json_path=result.json_path)
+    except Exception as e:
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    outcome["seconds"] = time.perf_counter() - started
+    return outcome
+
+
+def run_worker_pool(email_bodies, catalog, workers=None, template_path="sales_order_form_full.pdf", output_folder="output",
+                    stock_ledger_path=None, order_store_path=None, alias_store_path=None, duplicate_index_path=None,
+                    duplicate_options=None):
+    """
+    Processes many order emails across `workers` processes.
+
+    The catalog (DataFrame or CatalogIndex) is loaded once by the caller and shared
+    with the children copy-on-write. Orders are dispatched one at a time from the
+    pool's task queue, so a slow order never holds up a batch. With a
+    `stock_ledger_path`, every child reserves stock in the same StockLedger; likewise
+    each child opens the order store, alias store and duplicate index at the given
+    paths (`duplicate_options` are the DuplicateDetector's keyword arguments).
+
+    Returns:
+        (results, stats): one outcome dict per email in input order, and per-worker
+        throughput stats keyed by process ID plus an overall summary.
+    """
+    global _shared_catalog
+    workers = workers or os.cpu_count() or 1
+
+    if "fork" in mp.get_all_start_methods():
+        context = mp.get_context("fork")
+        _shared_catalog, catalog = catalog, None
+        # Move everything allocated so far out of the GC's reach, so collections in the
+        # children don't write to (and so copy) the shared catalog pages.
+        gc.freeze()
+    else:
+        context = mp.get_context()
+    initargs = (catalog, template_path, output_folder, stock_ledger_path, order_store_path, alias_store_path,
+                duplicate_index_path, duplicate_options)
+
+    started = time.perf_counter()
+    results = [None] * len(email_bodies)
+    try:
+        with context.Pool(workers, initializer=_init_child, initargs=initargs) as pool:
+            for outcome in pool.imap_unordered(_process_order, enumerate(email_bodies), chunksize=1):
+                results[outcome["position"]] = outcome
+            # Let the children exit on their own (instead of being terminated), so they close their stores
+            pool.close()
+            pool.join()
+    finally:
+        if "fork" in mp.get_all_start_methods():
+            gc.unfreeze()
+    elapsed = time.perf_counter() - started
+
+    per_worker = defaultdict(lambda: {"orders": 0, "errors": 0, "busy_seconds": 0.0})
+    for outcome in results:
+        worker_stats = per_worker[outcome["pid"]]
+        worker_stats["orders"] += 1
+        worker_stats["errors"] += 0 if outcome["ok"] else 1
+        worker_stats["busy_seconds"] += outcome["seconds"]
+    for worker_stats in per_worker.values():
+        busy = worker_stats["busy_seconds"]
+        worker_stats["orders_per_second"] = worker_stats["orders"] / busy if busy else 0.0
+
+    stats = {
+        "workers": dict(per_worker),
+        "total": {
+            "orders": len(results),
+            "errors": sum(1 for outcome in results if not outcome["ok"]),
+            "elapsed_seconds": elapsed,
+            "orders_per_second": len(results) / elapsed if elapsed else 0.0,
+        },
+    }
+    return results, stats
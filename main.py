@@ -1,10 +1,12 @@
+import argparse
+import asyncio
 import json
 import os
 from core.llm_extractor import extract_order_details_from_email
-from core.inventory_manager import load_data
-from core.decision_engine import process_and_validate_order
-from core.output_generator import create_sales_order_json
-from core.pdf_writer import fill_sales_order_pdf
+from core.catalog_service import CatalogService
+from core.pipeline import OrderPipeline
+from core.async_pipeline import run_extraction_pipeline
+from config import settings
 
 def load_email_from_file(filepath: str):
     """Loads the text content of an email from a file."""
@@ -15,9 +17,19 @@ def load_email_from_file(filepath: str):
         print(f"❌ ERROR: Email file not found at {filepath}")
         return None
 
-def run_order_intake_pipeline(email_filepath: str):
+PRODUCT_CATALOG_PATH = "data/Product Catalog.csv"
+
+def load_catalog_index(path=PRODUCT_CATALOG_PATH):
+    """Loads the typed catalog and its search index once for the whole run. Returns None if it is missing."""
+    try:
+        return CatalogService(path, snapshot_dir=settings.CATALOG_SNAPSHOT_DIR).index
+    except FileNotFoundError:
+        return None
+
+def run_order_intake_pipeline(email_filepath: str, catalog_index=None):
     """
     Runs the full pipeline for a single customer email from a file.
+    Pass the catalog index loaded once by the caller to avoid re-reading the catalog per email.
     """
     print(f"\n--- 🚀 Starting Order Intake Pipeline for Email: '{os.path.basename(email_filepath)}' ---")
 
@@ -26,40 +38,45 @@ def run_order_intake_pipeline(email_filepath: str):
     if not email_body:
         return
 
-    # --- Step 2: Extract data with AI ---
-    extracted_data = extract_order_details_from_email(email_body)
+    # --- Step 2: Load Catalog (only if the caller didn't pass one) ---
+    inventory_df = catalog_index if catalog_index is not None else load_catalog_index()
+    if inventory_df is None:
+        print("--- Pipeline halted: Could not load inventory data. ---")
+        return
+
+    # --- Step 3: Extract data (local parser first, AI as the fallback) ---
+    extracted_data = extract_order_details_from_email(email_body, inventory_df=inventory_df)
     if not extracted_data:
         print("--- Pipeline halted: AI could not extract a valid order structure. ---")
         return
     print("🤖 AI extraction complete.")
 
-    # --- Step 3: Load Catalog ---
-    inventory_df = load_data("data/Product Catalog.csv")
+    # --- Step 4-6: Validate, then render the PDF while the JSON is written in the background ---
+    with OrderPipeline(inventory_df) as pipeline:
+        result = pipeline.process_extracted(extracted_data)
+    print("⚖️ Order validation complete.")
+    if result.json_path:
+        print(f"📄 JSON successfully created at: {result.json_path}")
+    
+    print(f"--- ✅ Pipeline finished for Email: '{os.path.basename(email_filepath)}' ---")
+
+def run_concurrent_pipeline(email_filepaths: list, concurrency: int, catalog_index=None):
+    """Runs several emails at once through the async extraction driver."""
+    inventory_df = catalog_index if catalog_index is not None else load_catalog_index()
     if inventory_df is None:
         print("--- Pipeline halted: Could not load inventory data. ---")
         return
 
-    # --- Step 4: Validate and Process Order ---
-    final_order_data = process_and_validate_order(extracted_data, inventory_df)
-    print("⚖️ Order validation complete.")
-    
-    # --- Step 5: Generate Final JSON Output ---
-    json_filepath = create_sales_order_json(final_order_data)
-    if json_filepath:
-        print(f"📄 JSON successfully created at: {json_filepath}")
-    
-    
-    # Step 6: Generate PDF
-    if json_filepath:
-        print("✍️  Starting PDF generation...")
-        fill_sales_order_pdf(
-            json_path=json_filepath,
-            template_path="sales_order_form_full.pdf"
-        )
-    
-    print(f"--- ✅ Pipeline finished for Email: '{os.path.basename(email_filepath)}' ---")
+    email_bodies = [body for body in map(load_email_from_file, email_filepaths) if body]
+    print(f"\n--- 🚀 Starting Order Intake Pipeline for {len(email_bodies)} emails (concurrency={concurrency}) ---")
+    results = asyncio.run(run_extraction_pipeline(email_bodies, inventory_df, concurrency=concurrency))
+    print(f"--- ✅ Pipeline finished: {sum(1 for r in results if r)}/{len(email_bodies)} orders written ---")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the order intake pipeline over the sample emails.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of emails to extract at once (default: 1, serial).")
+    args = parser.parse_args()
+
     # Define the list of all test email files
     email_files_to_test = [
         "test_data/sample_email_1.txt",
@@ -69,7 +86,16 @@ if __name__ == "__main__":
         "test_data/sample_email_5.txt",
     ]
 
-    # Loop through each file and run the pipeline
-    for email_file in email_files_to_test:
-        run_order_intake_pipeline(email_filepath=email_file)
-        print("-" * 70) # Add a separator for clarity
\ No newline at end of file
+    # Load the catalog ONCE for all emails
+    catalog_index = load_catalog_index()
+    if catalog_index is None:
+        print("--- Pipeline halted: Could not load inventory data. ---")
+        exit(1)
+
+    if args.concurrency > 1:
+        run_concurrent_pipeline(email_files_to_test, args.concurrency, catalog_index)
+    else:
+        # Loop through each file and run the pipeline
+        for email_file in email_files_to_test:
+            run_order_intake_pipeline(email_filepath=email_file, catalog_index=catalog_index)
+            print("-" * 70) # Add a separator for clarity
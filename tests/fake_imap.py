@@ -0,0 +1,70 @@
+"""
+A local stand-in for an IMAP server, for exercising ImapIngestor without a real inbox.
+
+FakeMailServer holds the messages; FakeMailBox mimics the parts of imap_tools.MailBox
+the ingestor uses (login, folder.status, fetch by UID range, idle.wait, logout).
+Pass `server.mailbox_factory` as the ingestor's `mailbox_factory`. Set `failing_fetches`
+to make the next fetches raise ConnectionResetError, like a dropped connection.
+"""
+import re
+import threading
+from types import SimpleNamespace
+
+
+class FakeMailServer:
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = []
+        self.failing_fetches = 0
+        self.logins = 0
+        self._next_uid = 1
+        self._new_mail = threading.Condition()
+
+    def deliver(self, text, subject="Order"):
+        """Adds a message to the inbox and wakes any mailbox waiting in IDLE. Returns its UID."""
+        with self._new_mail:
+            uid = self._next_uid
+            self._next_uid += 1
+            self.messages.append(SimpleNamespace(uid=str(uid), subject=subject, text=text, html=""))
+            self._new_mail.notify_all()
+        return uid
+
+    def mailbox_factory(self, host=None):
+        return FakeMailBox(self)
+
+
+class FakeMailBox:
+    def __init__(self, server: FakeMailServer):
+        self.server = server
+        self.folder = SimpleNamespace(status=self._status)
+        self.idle = SimpleNamespace(wait=self._idle_wait)
+        self.fetch_calls = 0
+
+    def login(self, username, password, initial_folder="INBOX"):
+        self.server.logins += 1
+        return self
+
+    def logout(self):
+        pass
+
+    def _status(self, folder=None, options=None):
+        return {"UIDVALIDITY": self.server.uidvalidity, "UIDNEXT": self.server._next_uid}
+
+    def _idle_wait(self, timeout=None):
+        count = len(self.server.messages)
+        with self.server._new_mail:
+            self.server._new_mail.wait_for(lambda: len(self.server.messages) > count, timeout=timeout)
+        return []
+
+    def fetch(self, criteria="ALL", mark_seen=True, limit=None, bulk=False, **kwargs):
+        """Supports the '(UID n:*)' criteria the ingestor sends."""
+        self.fetch_calls += 1
+        if self.server.failing_fetches:
+            self.server.failing_fetches -= 1
+            raise ConnectionResetError("Connection reset by peer")
+        match = re.search(r'UID (\d+):\*', str(criteria))
+        start = int(match.group(1)) if match else 1
+        selected = [m for m in self.server.messages if int(m.uid) >= start]
+        if not selected and self.server.messages:
+            selected = [self.server.messages[-1]] # IMAP semantics: 'n:*' always returns the newest message
+        return iter(selected[:limit] if limit else selected)
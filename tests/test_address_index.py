@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from core.address_index import AddressIndex, address_block_keys, normalize_address
+from core.consolidation_checker import find_consolidation_opportunities
+
+DESTINATIONS = [
+    "123 Main Street, Springfield 12345",
+    "123 Main St., Springfield",             # No ZIP code
+    "Main Street, Springfield 12345",        # No street number
+    "Main Street, Springfield",              # Neither
+    "123 Main Street, Shelbyville 54321",
+    "77 Oak Avenue, Springfield 12345",
+    "77 Oak Ave, Springfield",
+    "Oak Avenue, Springfield 12345",
+    "9 Elm Road Apt 4, Capital City 67890",
+]
+
+
+def _shipments_df():
+    return pd.DataFrame({"OrderID": [f"SO-{i}" for i in range(len(DESTINATIONS))],
+                         "Destination": [normalize_address(d) for d in DESTINATIONS]})
+
+
+@pytest.mark.parametrize("address", DESTINATIONS + ["123 Main Street, Springfield", "Oak Avenue Springfield"])
+@pytest.mark.parametrize("threshold", [70, 90])
+def test_index_finds_what_the_scan_finds(address, threshold):
+    shipments_df = _shipments_df()
+    index = AddressIndex.from_dataframe(shipments_df)
+    scanned = find_consolidation_opportunities(normalize_address(address), shipments_df, threshold)
+    # The scan also matches same-street neighbours in other ZIP codes; blocking rules those out on purpose
+    scanned = [m for m in scanned if _compatible(normalize_address(address), m["similar_address"])]
+    assert index.find_matches(address, threshold) == scanned
+
+
+def test_reported_address_matches_its_unnumbered_and_zipless_variants():
+    index = AddressIndex.from_dataframe(_shipments_df())
+    matches = index.find_matches("123 Main Street, Springfield 12345")
+    assert [m["pending_order_id"] for m in matches] == ["SO-0", "SO-1", "SO-2"]
+
+
+def test_removed_shipment_leaves_every_block():
+    index = AddressIndex.from_dataframe(_shipments_df())
+    assert index.remove_shipment("SO-2")
+    assert "SO-2" not in [m["pending_order_id"] for m in index.find_matches("123 Main Street, Springfield 12345", 80)]
+    assert "SO-2" not in [m["pending_order_id"] for m in index.find_matches("Main Street 12345", 50)]
+
+
+def _compatible(query, destination):
+    return all(a is None or b is None or a == b
+               for a, b in zip(address_block_keys(query), address_block_keys(destination)))
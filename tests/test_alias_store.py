@@ -0,0 +1,55 @@
+import pytest
+
+from bench.synthetic import generate_catalog
+from core.alias_store import AliasStore
+from core.catalog_index import CatalogIndex
+from core.decision_engine import process_and_validate_order, process_and_validate_orders
+
+
+@pytest.fixture
+def catalog():
+    catalog_df = generate_catalog(200, seed=5)
+    catalog_df["Available_in_Stock"] = 100
+    catalog_df["Min_Order_Quantity"] = 1
+    return CatalogIndex(catalog_df)
+
+
+@pytest.fixture
+def alias_store(tmp_path):
+    store = AliasStore(str(tmp_path / "aliases.sqlite"))
+    yield store
+    store.close()
+
+
+def _shorthand(catalog, row):
+    return catalog.product(row)["Product_Name"].rsplit(" ", 1)[0] # Without the number, so only the fuzzy tier finds it
+
+
+def _order(customer, *items):
+    return {"customer_name": customer, "products": [{"product_name": name, "quantity": qty} for name, qty in items]}
+
+
+def test_approved_order_teaches_only_its_customer(catalog, alias_store):
+    shorthand = _shorthand(catalog, 42)
+    validated = process_and_validate_order(_order("Acme AB", (shorthand, 1)), catalog, alias_store=alias_store)
+    assert validated["processed_line_items"][0]["status"] == "VALIDATED"
+
+    assert alias_store.lookup(shorthand, "Acme AB")[0] == catalog.product(42)["Product_Code"]
+    assert alias_store.lookup(shorthand, "Other Customer") is None
+    assert alias_store.lookup(shorthand) is None
+
+
+def test_order_with_a_rejected_item_teaches_nothing(catalog, alias_store):
+    shorthand = _shorthand(catalog, 42)
+    [validated] = process_and_validate_orders([_order("Acme AB", (shorthand, 1), ("Unknown Widget QX", 1))],
+                                              catalog, alias_store=alias_store)
+    assert [item["status"] for item in validated["processed_line_items"]] == ["VALIDATED", "NOT_FOUND"]
+    assert len(alias_store) == 0
+
+
+def test_reviewer_answer_is_kept_over_learned_alias(catalog, alias_store):
+    shorthand = _shorthand(catalog, 42)
+    reviewed = catalog.product(43)["Product_Code"]
+    alias_store.resolve(shorthand, reviewed, catalog.product(43)["Product_Name"], customer="Acme AB")
+    process_and_validate_order(_order("Acme AB", (shorthand, 1)), catalog, alias_store=alias_store)
+    assert alias_store.lookup(shorthand, "Acme AB")[0] == reviewed
@@ -0,0 +1,44 @@
+import asyncio
+from functools import partial
+
+import pytest
+
+from core import async_pipeline
+from core.extraction_cache import ExtractionCache
+from bench.fake_llm import FakeGenerativeModel
+
+EMAILS = [f"Hi,\nplease send\n{n} x Widget {n}\nthanks,\nCustomer {n}" for n in range(1, 6)]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "extractions.sqlite"))
+    monkeypatch.setattr(async_pipeline, "get_extraction_cache", lambda: cache)
+    yield cache
+    cache.close()
+
+
+def _run(model):
+    return asyncio.run(async_pipeline.run_extraction_pipeline(EMAILS, None, concurrency=3, rate_per_second=1000,
+                                                              model_client=model, process_order=lambda order: order))
+
+
+def test_cached_emails_skip_the_llm(cache):
+    model = FakeGenerativeModel()
+    first = _run(model)
+    assert model.calls == len(EMAILS)
+    assert [order["customer_name"] for order in first] == [f"Customer {n}" for n in range(1, 6)]
+
+    model = FakeGenerativeModel()
+    assert _run(model) == first
+    assert model.calls == 0
+
+
+def test_transient_errors_are_retried(cache, monkeypatch):
+    monkeypatch.setattr(async_pipeline, "extract_with_retries",
+                        partial(async_pipeline.extract_with_retries, base_delay=0.001))
+    model = FakeGenerativeModel(error_rate=0.5, seed=3)
+    results = asyncio.run(async_pipeline.run_extraction_pipeline(
+        EMAILS, None, concurrency=3, rate_per_second=1000, max_retries=10, model_client=model,
+        process_order=lambda order: order))
+    assert all(results) and model.failures > 0
@@ -0,0 +1,62 @@
+import random
+import threading
+
+from bench.synthetic import generate_catalog
+from core.catalog_index import CatalogIndex
+from core.inventory_manager import find_product_matches
+
+
+def test_lookups_during_reindexing_always_find_the_product():
+    index = CatalogIndex(generate_catalog(2000, seed=1))
+    row = 123
+    name = index.df.at[row, "Product_Name"]
+    code = index.df.at[row, "Product_Code"]
+    typo = name[:7] + name[8:] # A dropped letter: fuzzy tier
+    stop = threading.Event()
+    misses = []
+
+    def look_up():
+        while not stop.is_set():
+            for query in (name, typo):
+                if code not in [product.Product_Code for product in find_product_matches(query, index)]:
+                    misses.append(query)
+
+    readers = [threading.Thread(target=look_up) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    # Description edits re-index the row: it is taken out of both tiers and put back
+    for n in range(300):
+        index.update_product(row, {"Description": f"revision {n} of '{name}'"})
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert misses == []
+
+
+def _query_variants(names, count, seed=0):
+    """Requests as customers write them: exact, lowercased, without the number, typos, reordered, padded."""
+    rng = random.Random(seed)
+    def typo(text):
+        i = rng.randrange(len(text))
+        return text[:i] + rng.choice("aeiouxyz") + text[i + 1:]
+    variants = [
+        lambda name: name,
+        lambda name: name.lower() + " (oak)",
+        lambda name: name.rsplit(" ", 1)[0],
+        lambda name: typo(name),
+        lambda name: typo(typo(name)),
+        lambda name: " ".join(reversed(name.split())),
+        lambda name: "modern " + name + " in walnut",
+        lambda name: name.split()[1],
+    ]
+    queries = [rng.choice(variants)(rng.choice(names)) for _ in range(count)]
+    return queries + ["functionality", "Bed", "Lamp DAL", "Unknown Widget QX"]
+
+
+def test_index_finds_the_same_products_as_the_full_scan():
+    catalog_df = generate_catalog(1000, seed=7)
+    index = CatalogIndex(catalog_df.copy())
+    for query in _query_variants(list(catalog_df["Product_Name"]), 250):
+        scanned = [(product.Product_Code, product.match_confidence) for product in find_product_matches(query, catalog_df)]
+        indexed = [(product.Product_Code, product.match_confidence) for product in find_product_matches(query, index)]
+        assert indexed == scanned, query
@@ -0,0 +1,38 @@
+import pytest
+
+from bench.synthetic import generate_catalog
+from core.catalog_service import CatalogService
+from core.inventory_manager import load_catalog
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    path = tmp_path / "catalog.csv"
+    generate_catalog(50, seed=6).to_csv(path, index=False)
+    return str(path)
+
+
+def test_published_deltas_reach_every_process_and_the_file(catalog_path):
+    api_worker, other_worker = CatalogService(catalog_path), CatalogService(catalog_path)
+    code, other_code = api_worker.index.product(4)["Product_Code"], api_worker.index.product(5)["Product_Code"]
+
+    api_worker.publish_deltas([{"Product_Code": code, "Available_in_Stock": 7}])
+    # The other worker's change is applied on top of the first, not over it
+    other_worker.publish_deltas([{"Product_Code": other_code, "Price": 12.5}])
+    api_worker.reload_if_changed()
+
+    for service in (api_worker, other_worker):
+        assert service.index.product(4)["Available_in_Stock"] == 7
+        assert service.index.product(5)["Price"] == 12.5
+    catalog_df = load_catalog(catalog_path).set_index("Product_Code")
+    assert catalog_df.loc[code, "Available_in_Stock"] == 7 and catalog_df.loc[other_code, "Price"] == 12.5
+
+
+def test_non_integral_stock_rejects_the_whole_batch(catalog_path):
+    service = CatalogService(catalog_path)
+    product = service.index.product(4)
+    with pytest.raises(ValueError):
+        service.publish_deltas([{"Product_Code": product["Product_Code"], "Price": 1.0},
+                                {"Product_Code": product["Product_Code"], "Min_Order_Quantity": 2.5}])
+    assert service.index.product(4)["Price"] == product["Price"]
+    assert service.apply_deltas([{"Product_Code": product["Product_Code"], "Available_in_Stock": "3.0"}])
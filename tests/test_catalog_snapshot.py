@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+from bench.synthetic import generate_catalog
+from core.catalog_service import CatalogService
+from core.catalog_snapshot import POINTER_FILE
+from core.inventory_manager import find_product_matches
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    path = tmp_path / "catalog.csv"
+    generate_catalog(300, seed=9).to_csv(path, index=False)
+    return str(path)
+
+
+def _queries(service):
+    names = [service.index.product(row)["Product_Name"] for row in range(0, 300, 7)]
+    return names + [name.lower() for name in names] + [name.rsplit(" ", 1)[0] for name in names] \
+        + [name[:-1] for name in names] + ["Wardrobe QUIXBERG 5", "Sofa VIKTMARK"]
+
+
+def _matches(service, queries):
+    return [[(m["Product_Code"], m["Product_Name"], m["Available_in_Stock"], m["Price"], m.get("match_confidence"))
+             for m in find_product_matches(query, service.index)] for query in queries]
+
+
+def test_snapshot_opened_through_the_pointer_matches_like_the_dataframe_index(catalog_path, tmp_path):
+    snapshot_dir = str(tmp_path / "snapshots")
+    CatalogService(catalog_path, snapshot_dir=snapshot_dir).close() # Compiles and writes the pointer file
+    with open(os.path.join(snapshot_dir, POINTER_FILE)) as f:
+        built = json.load(f)["folder"]
+
+    from_snapshot = CatalogService(catalog_path, snapshot_dir=snapshot_dir)
+    from_dataframe = CatalogService(catalog_path)
+    try:
+        assert from_snapshot.index.snapshot.folder.endswith(built)
+        queries = _queries(from_dataframe)
+        assert _matches(from_snapshot, queries) == _matches(from_dataframe, queries)
+
+        renamed, removed = from_dataframe.index.product(14), from_dataframe.index.product(21)
+        deltas = [{"Product_Code": from_dataframe.index.product(0)["Product_Code"], "Available_in_Stock": 3, "Price": 9.5},
+                  {"Product_Code": renamed["Product_Code"], "Product_Name": "Wardrobe QUIXBERG 5"},
+                  {"Product_Code": removed["Product_Code"], "removed": True},
+                  {"Product_Code": "SOF-9000001", "Product_Name": "Sofa VIKTMARK", "Description": "A sofa.",
+                   "Price": 899.0, "Available_in_Stock": 4, "Min_Order_Quantity": 1}]
+        for service in (from_snapshot, from_dataframe):
+            service.apply_deltas(deltas)
+        queries += [renamed["Product_Name"], removed["Product_Name"]]
+        assert _matches(from_snapshot, queries) == _matches(from_dataframe, queries)
+    finally:
+        from_snapshot.close()
+        from_dataframe.close()
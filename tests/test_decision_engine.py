@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from bench.synthetic import generate_catalog
+from core.catalog_index import CatalogIndex
+from core.decision_engine import process_and_validate_order, process_and_validate_orders
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    catalog_df = generate_catalog(300, seed=8)
+    catalog_df[["Available_in_Stock", "Min_Order_Quantity"]] = catalog_df[["Available_in_Stock", "Min_Order_Quantity"]].astype(int)
+    return CatalogIndex(catalog_df)
+
+
+def _orders(catalog, n_orders, seed=0):
+    """Orders mixing exact names, shorthands, unknown names, and quantities around MOQ and stock."""
+    rng = random.Random(seed)
+    orders = [None, {"customer_name": "Empty AB", "products": []}]
+    for n in range(n_orders):
+        products = []
+        for _ in range(rng.randint(1, 5)):
+            product = catalog.product(rng.randrange(300))
+            name = rng.choice([product["Product_Name"], product["Product_Name"].rsplit(" ", 1)[0],
+                               product["Product_Name"].lower(), "Unknown Widget QX"])
+            moq, stock = product["Min_Order_Quantity"], product["Available_in_Stock"]
+            quantity = rng.choice([moq - 1, moq, stock, stock + 1, 0])
+            products.append({"product_name": name, "quantity": quantity})
+        orders.append({"customer_name": f"Customer {n % 7}", "delivery_address": f"{n} Main Street",
+                       "delivery_date": "2025-07-01", "products": products})
+    return orders
+
+
+def test_batch_validation_matches_validating_each_order(catalog):
+    orders = _orders(catalog, 60)
+    batched = process_and_validate_orders(orders, catalog)
+    assert batched == [process_and_validate_order(order, catalog) for order in orders]
+    statuses = {item["status"] for order in batched for item in order.get("processed_line_items", [])}
+    assert statuses == {"VALIDATED", "NOT_FOUND", "MULTIPLE_MATCHES_FOUND", "MOQ_NOT_MET", "INSUFFICIENT_STOCK"}
@@ -0,0 +1,79 @@
+import pytest
+
+from core.duplicate_detector import DuplicateDetector
+from core.pipeline import OrderPipeline
+
+ORDER = """Hello,
+
+Please process the following order for our new office:
+- Desk LINNMON 120: Qty 4
+- Lamp FORSA 20: Qty 4
+- Shelf KALLAX 77: Qty 2
+
+Deliver to Nordic Design AB, Storgatan 12, Malmo by July 3.
+Best regards,
+Erik Lund"""
+
+
+@pytest.fixture
+def detector(tmp_path):
+    detector = DuplicateDetector(str(tmp_path / "duplicates.sqlite"))
+    yield detector
+    detector.close()
+
+
+def test_resend_forward_and_reply_are_duplicates(detector):
+    entry_id, match = detector.register(ORDER)
+    assert entry_id is not None and match is None
+
+    forward = ("---------- Forwarded message ----------\nFrom: Erik Lund <erik@example.com>\n"
+               "Subject: Order\n\n" + ORDER + "\n\nJust following up on this one, any update?")
+    reply = "Any news on this?\n\nOn Mon, Erik Lund wrote:\n" + "\n".join("> " + line for line in ORDER.split("\n"))
+    for copy in (ORDER, forward, reply):
+        _, match = detector.register(copy)
+        assert match is not None and match.entry_id == entry_id
+
+
+def test_changed_or_extended_orders_are_not_duplicates(detector):
+    detector.register(ORDER)
+    revised = ORDER.replace("Desk LINNMON 120: Qty 4", "Desk LINNMON 120: Qty 6")
+    extended = ORDER.replace("- Shelf KALLAX 77: Qty 2", "- Shelf KALLAX 77: Qty 2\n- Chair NORDVIK 88: Qty 10")
+    assert detector.find(revised) is None
+    assert detector.find(extended) is None
+
+
+def test_follow_up_adding_a_phone_number_is_a_duplicate(detector):
+    with open("test_data/sample_email_1.txt", encoding="utf-8") as f:
+        original = f.read()
+    entry_id, _ = detector.register(original)
+    quoted = "\n".join("> " + line for line in original.split("\n"))
+    follow_up = ("Just following up on this.\nPhone +46 70 123 4567\n\n"
+                 "On Mon, 16 Jun 2025, John Smith wrote:\n" + quoted)
+    assert detector.find(follow_up).entry_id == entry_id
+
+    # A product line written above the quote is a change to the order, not a follow-up
+    assert detector.find(follow_up.replace("Phone +46 70 123 4567", "- 2 x Sofa VIKTMARK 446")) is None
+
+
+def test_original_is_not_a_duplicate_of_a_longer_order(detector):
+    detector.register(ORDER.replace("- Shelf KALLAX 77: Qty 2", "- Shelf KALLAX 77: Qty 2\n- Chair NORDVIK 88: Qty 10"))
+    assert detector.find(ORDER) is None
+
+
+def test_retried_job_gets_its_own_entry_back(detector):
+    entry_id, _ = detector.register(ORDER, {"job_id": 7})
+    assert detector.register(ORDER, {"job_id": 7}) == (entry_id, None)
+
+
+def test_failed_email_is_forgotten(detector):
+    pipeline = OrderPipeline(None, write_json=False, duplicate_detector=detector)
+    pipeline.extract = lambda email_body: {"customer_name": "Erik Lund", "products": []}
+
+    def fail(extracted_order):
+        raise RuntimeError("renderer crashed")
+    pipeline.process_extracted = fail
+
+    with pytest.raises(RuntimeError):
+        pipeline.process_email(ORDER)
+    assert detector.find(ORDER) is None
+    assert len(detector) == 0
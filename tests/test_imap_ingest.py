@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from core import imap_ingest
+from tests.fake_imap import FakeMailServer
+from core.imap_ingest import ImapIngestor, load_uid_state
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    """Backoff and poll waits return at once."""
+    monkeypatch.setattr(imap_ingest, "_sleep", lambda seconds, stop_event=None: None)
+
+
+def _ingestor(server, tmp_path, **kwargs):
+    return ImapIngestor("imap.example.com", "orders", "secret", state_path=str(tmp_path / "imap_state.json"),
+                        mailbox_factory=server.mailbox_factory, use_idle=False, **kwargs)
+
+
+def _run(ingestor, handle, until):
+    """Runs the ingestor with `handle` until `until()` holds (checked after every handled message)."""
+    stop = threading.Event()
+
+    def handler(body, message):
+        try:
+            handle(body, message)
+        finally:
+            if until():
+                stop.set()
+
+    ingestor.run_forever(handler, stop_event=stop)
+
+
+def test_failed_message_is_retried_before_newer_mail(tmp_path):
+    server = FakeMailServer()
+    ingestor = _ingestor(server, tmp_path)
+    ingestor.connect()
+    for n in range(3):
+        server.deliver(f"order {n}")
+    attempts, handled = [], []
+
+    def handle(body, message):
+        attempts.append(body)
+        if body == "order 1" and attempts.count(body) == 1:
+            raise RuntimeError("database is locked")
+        handled.append(body)
+
+    _run(ingestor, handle, until=lambda: len(handled) == 3)
+    assert attempts == ["order 0", "order 1", "order 1", "order 2"]
+    assert load_uid_state(ingestor.state_path)["last_uid"] == 3
+
+
+def test_crash_after_a_failure_replays_the_failed_message(tmp_path):
+    server = FakeMailServer()
+    ingestor = _ingestor(server, tmp_path)
+    ingestor.connect()
+    server.deliver("order 0")
+    server.deliver("order 1")
+
+    def handle(body, message):
+        if body == "order 1":
+            raise RuntimeError("PDF rendering failed")
+
+    _run(ingestor, handle, until=lambda: True)
+    assert load_uid_state(ingestor.state_path)["last_uid"] == 1
+
+    # A restarted worker starts from the checkpoint, so the failed order is not lost
+    restarted, seen = _ingestor(server, tmp_path), []
+    _run(restarted, lambda body, message: seen.append(body), until=lambda: bool(seen))
+    assert seen == ["order 1"]
+
+
+def test_message_failing_every_attempt_is_parked(tmp_path):
+    server = FakeMailServer()
+    ingestor = _ingestor(server, tmp_path, max_attempts=2)
+    ingestor.connect()
+    server.deliver("bad order")
+    server.deliver("good order")
+    handled = []
+
+    def handle(body, message):
+        if body == "bad order":
+            raise ValueError("unparseable")
+        handled.append(body)
+
+    _run(ingestor, handle, until=lambda: bool(handled))
+    state = load_uid_state(ingestor.state_path)
+    assert handled == ["good order"]
+    assert state["failed_uids"] == [1] and state["last_uid"] == 2 and state["failures"] == {}
+
+
+def test_dropped_connection_reconnects(tmp_path):
+    server = FakeMailServer()
+    ingestor = _ingestor(server, tmp_path)
+    ingestor.connect()
+    server.deliver("order 0")
+    server.failing_fetches = 3
+    handled = []
+    _run(ingestor, lambda body, message: handled.append(body), until=lambda: bool(handled))
+    assert handled == ["order 0"]
+    assert server.logins == 4
@@ -0,0 +1,171 @@
+import os
+import time
+
+import pytest
+
+from bench.synthetic import generate_catalog
+from core import llm_extractor
+from core.job_queue import JobQueue, LeaseLostError, extract_jobs, process_job
+from core.order_store import OrderStore
+from core.pipeline import OrderPipeline
+from core.stock_ledger import StockLedger
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=3)
+    yield queue
+    queue.close()
+
+
+def test_crashed_job_resumes_from_its_checkpoint(tmp_path):
+    # Checkpoints renew the lease for lease_seconds
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0.05)
+    [job_id] = queue.enqueue_many(["order email"])
+    [job] = queue.claim("worker-a")
+    queue.record_stage(job.id, "extract", {"customer_name": "Acme"}, owner="worker-a")
+    queue.record_stages([(job.id, "validate", {"processed_line_items": []})], owner="worker-a")
+    # worker-a dies here; its lease runs out and the job is claimable again
+    assert queue.claim("worker-b") == []
+    time.sleep(0.06)
+    [resumed] = queue.claim("worker-b")
+    assert resumed.id == job_id and resumed.stage == "validate" and resumed.attempts == 2
+    assert resumed.results == {"extract": {"customer_name": "Acme"}, "validate": {"processed_line_items": []}}
+    queue.close()
+
+
+def test_worker_that_lost_its_lease_cannot_write(queue):
+    queue.enqueue_many(["order email"])
+    [stale] = queue.claim("worker-a", lease_seconds=0.01)
+    time.sleep(0.02)
+    [job] = queue.claim("worker-b")
+
+    with pytest.raises(LeaseLostError):
+        queue.record_stage(stale.id, "extract", {"customer_name": "Stale"}, owner="worker-a")
+    with pytest.raises(LeaseLostError):
+        queue.complete(stale.id, owner="worker-a")
+    with pytest.raises(LeaseLostError):
+        queue.fail(stale.id, "boom", owner="worker-a")
+    assert queue.record_stages([(stale.id, "extract", {})], owner="worker-a") == {stale.id}
+    assert queue.get(job.id)["status"] == "RUNNING" and queue.get(job.id)["results"] == {}
+
+    queue.record_stage(job.id, "extract", {"customer_name": "Acme"}, owner="worker-b")
+    queue.complete(job.id, owner="worker-b")
+    assert queue.get(job.id)["status"] == "DONE"
+
+
+def test_renewed_leases_are_not_reclaimed(queue):
+    queue.enqueue_many(["first", "second"])
+    first, second = queue.claim("worker-a", limit=2, lease_seconds=0.05)
+    assert queue.renew([first.id], "worker-a", lease_seconds=60) == set()
+    time.sleep(0.06)
+    assert [job.id for job in queue.claim("worker-b", limit=2)] == [second.id]
+    assert queue.renew([first.id, second.id], "worker-a") == {second.id}
+
+
+def test_process_job_leaves_a_taken_over_job_alone(queue):
+    queue.enqueue_many(["order email"])
+    [stale] = queue.claim("worker-a", lease_seconds=0.01)
+    time.sleep(0.02)
+    queue.claim("worker-b")
+    # The pipeline is never touched: the job belongs to worker-b now
+    assert process_job(queue, stale, pipeline=None) is False
+    assert queue.get(stale.id)["status"] == "RUNNING" and queue.get(stale.id)["attempts"] == 2
+
+
+class _FailingExtractionPipeline:
+    """Counts extraction calls; every email fails to extract."""
+    duplicate_detector = None
+
+    def __init__(self):
+        self.batch_calls = self.single_calls = 0
+
+    def extract_many(self, email_bodies):
+        self.batch_calls += 1
+        return [None] * len(email_bodies)
+
+    def extract(self, email_body):
+        self.single_calls += 1
+        return None
+
+
+def test_batch_extraction_failure_is_not_extracted_again_in_the_same_attempt(queue):
+    queue.enqueue_many(["first", "second"])
+    jobs = queue.claim("worker-a", limit=2)
+    pipeline = _FailingExtractionPipeline()
+    extract_jobs(queue, jobs, pipeline)
+    assert [process_job(queue, job, pipeline) for job in jobs] == [False, False]
+    assert pipeline.batch_calls == 1 and pipeline.single_calls == 0
+    assert queue.get(jobs[0].id)["status"] == "PENDING" and queue.get(jobs[0].id)["stage"] is None
+
+    # The next attempt extracts again
+    [retried] = queue.claim("worker-a")
+    process_job(queue, retried, pipeline)
+    assert pipeline.single_calls == 1
+
+
+class _FailingBatchModel:
+    """A model whose batch requests raise; single-email requests answer without a tool call."""
+
+    def start_chat(self, history):
+        return self
+
+    def send_message(self, message):
+        if message.startswith("There are"):
+            raise ConnectionError("API unavailable")
+        return None
+
+
+def test_failed_batch_request_backs_off_before_per_email_requests(monkeypatch):
+    monkeypatch.setattr(llm_extractor, "extract_locally", lambda email_body, inventory_df, cache: (None, None))
+    sleeps = []
+    monkeypatch.setattr(llm_extractor.time, "sleep", sleeps.append)
+    llm_extractor.extract_order_details_from_emails(["one", "two", "three", "four"], use_cache=False,
+                                                    model_client=_FailingBatchModel(), batch_size=2,
+                                                    fallback_delay=1.5)
+    assert sleeps == [1.5, 3.0]
+
+
+class _Crash(BaseException):
+    """A worker dying mid-stage: not an error process_job handles."""
+
+
+def test_job_retried_after_a_crash_reserves_and_stores_once(tmp_path, monkeypatch):
+    catalog_df = generate_catalog(50, seed=4)
+    catalog_df["Available_in_Stock"] = 10
+    catalog_df["Min_Order_Quantity"] = 1
+    product = catalog_df.iloc[3]
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0.5)
+    [job_id] = queue.enqueue_many(["order email"])
+    queue.record_stage(job_id, "extract", {"customer_name": "Acme AB",
+                                           "products": [{"product_name": product["Product_Name"], "quantity": 4}]})
+    [job] = queue.claim("worker-a")
+
+    record_stage = queue.record_stage
+    def crash_before(stage):
+        def record(job_id, recorded, result, owner=None):
+            if recorded == stage:
+                raise _Crash()
+            return record_stage(job_id, recorded, result, owner=owner)
+        monkeypatch.setattr(queue, "record_stage", record)
+
+    ledger = StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+    order_store = OrderStore(str(tmp_path / "orders.sqlite"))
+    output_folder = str(tmp_path / "output")
+    with OrderPipeline(catalog_df, output_folder=output_folder, order_store=order_store,
+                       stock_ledger=ledger) as pipeline:
+        # Dies after reserving stock, then after writing the JSON and storing the order
+        for stage in ("validate", "json", None):
+            crash_before(stage)
+            try:
+                process_job(queue, job, pipeline)
+            except _Crash:
+                time.sleep(0.55)
+                [job] = queue.claim("worker-a")
+
+    assert queue.get(job_id)["status"] == "DONE"
+    assert ledger.reserved(product["Product_Code"]) == 4
+    assert order_store.count() == 1
+    assert len([name for name in os.listdir(output_folder) if name.endswith(".json")]) == 1
+    order_store.close()
+    queue.close()
@@ -0,0 +1,69 @@
+import pytest
+
+from bench.synthetic import generate_catalog
+from core import order_revalidator
+from core.catalog_service import CatalogService
+from core.decision_engine import process_and_validate_order
+from core.order_revalidator import OrderRevalidator
+from core.order_store import OrderStore
+from core.output_generator import build_sales_order
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "catalog.csv"
+    generate_catalog(200, seed=3).to_csv(path, index=False)
+    service = CatalogService(str(path))
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def order_store(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.sqlite"))
+    yield store
+    store.close()
+
+
+def _store_order(order_store, catalog, requested_name, quantity):
+    request = {"customer_name": "Nordic Design AB", "products": [{"product_name": requested_name, "quantity": quantity}]}
+    validated = process_and_validate_order(request, catalog.index)
+    return order_store.append(build_sales_order(validated), validated), validated["processed_line_items"][0]["status"]
+
+
+def test_restock_goes_to_as_many_waiting_orders_as_it_covers(catalog, order_store):
+    product = catalog.index.product(10)
+    catalog.apply_deltas([{"Product_Code": product["Product_Code"], "Available_in_Stock": 0,
+                           "Min_Order_Quantity": 1}])
+    stored = [_store_order(order_store, catalog, product["Product_Name"], 2) for _ in range(3)]
+    assert [status for _, status in stored] == ["INSUFFICIENT_STOCK"] * 3
+
+    catalog.add_listener(OrderRevalidator(order_store, catalog.index).on_catalog_change)
+    catalog.apply_deltas([{"Product_Code": product["Product_Code"], "Available_in_Stock": 4}])
+
+    order_ids = [order_id for order_id, _ in stored]
+    assert [order_store.get(order_id).issues_for_review == [] for order_id in order_ids] == [True, True, False]
+    assert [waiting[0] for waiting in order_store.waiting_on([product["Product_Code"]])] == order_ids[2:]
+
+
+def test_new_product_only_looks_up_requests_sharing_its_ngrams(catalog, order_store, monkeypatch):
+    wanted, wanted_status = _store_order(order_store, catalog, "Wardrobe QUIXBERG 5", 1)
+    unrelated, unrelated_status = _store_order(order_store, catalog, "Ottoman PLYTZOG 12", 1)
+    assert wanted_status == unrelated_status == "NOT_FOUND"
+
+    looked_up = []
+    def find_product_matches(requested_name, *args, **kwargs):
+        looked_up.append(requested_name)
+        return original(requested_name, *args, **kwargs)
+    original = order_revalidator.find_product_matches
+    monkeypatch.setattr(order_revalidator, "find_product_matches", find_product_matches)
+
+    revalidator = OrderRevalidator(order_store, catalog.index)
+    catalog.add_listener(revalidator.on_catalog_change)
+    catalog.apply_deltas([{"Product_Code": "WRD-9000001", "Product_Name": "Wardrobe QUIXBERG 5",
+                           "Description": "A tall wardrobe.", "Price": 499.0, "Available_in_Stock": 10,
+                           "Min_Order_Quantity": 1}])
+
+    assert looked_up == ["Wardrobe QUIXBERG 5"]
+    assert order_store.get(wanted).issues_for_review == []
+    assert order_store.get(unrelated).issues_for_review[0].status == "NOT_FOUND"
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from core import order_service
+from core.job_queue import JobQueue
+from core.order_service import OrderService, QueueFullError
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """Replaces batch extraction with a recorder of the job IDs extracted together."""
+    extracted = []
+    monkeypatch.setattr(order_service, "extract_jobs",
+                        lambda queue, jobs, pipeline: extracted.append([job.id for job in jobs]))
+    return extracted
+
+
+@pytest.fixture
+def processed(monkeypatch, extracted):
+    """Replaces the pipeline run with a recorder of the processed job IDs."""
+    processed = []
+    lock = threading.Lock()
+
+    def record(queue, job, pipeline):
+        with lock:
+            processed.append(job.id)
+        queue.complete(job.id)
+        return True
+
+    monkeypatch.setattr(order_service, "process_job", record)
+    return processed
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_services_sharing_a_queue_run_each_job_once(tmp_path, processed):
+    queue_path = str(tmp_path / "jobs.sqlite")
+    # Jobs left over from a previous run, picked up without being scheduled once per process
+    leftover = JobQueue(queue_path)
+    leftover_ids = leftover.enqueue_many(f"old order {n}" for n in range(10))
+    leftover.close()
+
+    services = [OrderService(None, queue_path, workers=3, poll_seconds=0.05) for _ in range(2)]
+    try:
+        job_ids = leftover_ids + services[0].submit_many(f"order {n}" for n in range(20)) \
+            + services[1].submit_many(f"other order {n}" for n in range(20))
+        assert _wait_for(lambda: len(processed) >= len(job_ids))
+        time.sleep(0.2)
+        assert sorted(processed) == sorted(job_ids)
+        assert services[0].depth == 0
+    finally:
+        for service in services:
+            service.close()
+
+
+def test_submissions_over_the_depth_limit_are_refused(tmp_path, processed):
+    service = OrderService(None, str(tmp_path / "jobs.sqlite"), workers=0, max_queue_depth=3)
+    try:
+        service.submit_many(["a", "b"])
+        with pytest.raises(QueueFullError):
+            service.submit_many(["c", "d"])
+        assert service.submit("c") and service.depth == 3
+    finally:
+        service.close()
+
+
+def test_claimed_jobs_are_extracted_in_batches(tmp_path, processed, extracted):
+    service = OrderService(None, str(tmp_path / "jobs.sqlite"), workers=1, batch_size=4, poll_seconds=0.05)
+    try:
+        job_ids = service.submit_many(f"order {n}" for n in range(10))
+        assert _wait_for(lambda: len(processed) >= len(job_ids))
+        assert [job_id for batch in extracted for job_id in batch] == processed == job_ids
+        assert max(len(batch) for batch in extracted) == 4
+    finally:
+        service.close()
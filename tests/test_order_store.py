@@ -0,0 +1,42 @@
+from core.models import LineItem, OrderSummary, SalesOrder
+from core.order_store import OrderStore
+from core.output_generator import build_sales_order
+
+
+def _validated(status, issue=None):
+    return {"customer_name": "Nordic Design AB", "processed_line_items": [{
+        "requested_name": "Desk LUNDVIK", "requested_quantity": 4, "status": status, "issue": issue,
+        "product_details": {"Product_Code": "DSK-0000047", "Product_Name": "Desk LUNDVIK 571", "Price": 120.0},
+    }]}
+
+
+def test_sku_query_finds_orders_rejected_for_stock_or_moq(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.sqlite"))
+    validated = store.append(build_sales_order(_validated("VALIDATED")))
+    short = store.append(build_sales_order(_validated("INSUFFICIENT_STOCK", "Requested quantity 4 exceeds stock.")))
+    below_moq = store.append(build_sales_order(_validated("MOQ_NOT_MET", "Quantity 4 is below the MOQ of 5.")))
+
+    assert sorted(order_id for order_id, _ in store.query(sku="DSK-0000047")) == [validated, short, below_moq]
+    [(order_id, order)] = store.query(sku="DSK-0000047", item_status="INSUFFICIENT_STOCK")
+    assert order_id == short and order.issues_for_review[0].sku == "DSK-0000047"
+    store.close()
+
+
+def test_item_filters_match_the_same_item(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.sqlite"))
+    mixed = _validated("VALIDATED")
+    mixed["processed_line_items"].append({"requested_name": "Lamp GLIMTA", "requested_quantity": 1,
+                                          "status": "NOT_FOUND", "issue": "No product found matching 'Lamp GLIMTA'."})
+    store.append(build_sales_order(mixed))
+    assert store.count(sku="DSK-0000047", item_status="NOT_FOUND") == 0
+    assert store.count(sku="DSK-0000047", item_status="VALIDATED") == 1
+    store.close()
+
+
+def test_documents_written_without_issue_skus_still_load():
+    order = SalesOrder(summary=OrderSummary("Nordic Design AB", None, None, None, "2026-07-01T09:00:00"),
+                       line_items=[LineItem("DSK-0000047", "Desk LUNDVIK 571", 1, 120.0, 120.0)])
+    document = order.to_dict()
+    document["issues_for_review"] = [{"requested_item": "Lamp", "status": "NOT_FOUND", "details": None}]
+    assert SalesOrder.from_dict(document).issues_for_review[0].sku is None
+    assert SalesOrder.from_dict(document).to_dict() == document # Issues without a SKU are written without the key
@@ -0,0 +1,63 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.models import LineItem, OrderSummary, ReviewIssue, SalesOrder
+from core.pdf_writer import PdfRenderer, fill_sales_order_pdf
+
+fitz = pytest.importorskip("fitz")
+
+
+def _order(line_count):
+    order = SalesOrder(summary=OrderSummary(customer_name="Nordic Design AB", delivery_address="Storgatan 12",
+                                            requested_delivery_date="2026-07-03", notes=None,
+                                            generation_timestamp_utc="2026-07-01T09:00:00"))
+    for n in range(line_count):
+        order.line_items.append(LineItem(sku=f"SKU-{n:04d}", product_name=f"Product {n}", quantity=2,
+                                         unit_price=1.25, total_price=2.5))
+    order.issues_for_review.append(ReviewIssue(requested_item="Unknown Widget", status="NOT_FOUND",
+                                               details="No matching product found in the catalog."))
+    return order
+
+
+def _page_texts(path):
+    with fitz.open(path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def test_prices_and_totals_come_from_line_items(tmp_path):
+    path = PdfRenderer("sales_order_form_full.pdf").render(_order(3), output_folder=str(tmp_path))
+    [text] = _page_texts(path)
+    assert "1.25" in text and "2.50" in text
+    assert "7.50" in text
+    assert "No matching" in text # The remark is clipped at the page edge
+
+
+def test_multi_page_order_subtotals_add_up(tmp_path):
+    path = PdfRenderer("sales_order_form_full.pdf").render(_order(40), output_folder=str(tmp_path))
+    pages = _page_texts(path)
+    # 40 line items and one issue at 15 rows per page; the issue row is unpriced
+    assert len(pages) == 3
+    assert "Page 1 of 3 - Page subtotal: 37.50" in pages[0]
+    assert "Page 2 of 3 - Page subtotal: 37.50" in pages[1]
+    assert "Page 3 of 3 - Page subtotal: 25.00" in pages[2]
+    assert "100.00" in pages[2]
+    assert "Unknown Widget" in pages[2]
+
+
+def test_json_order_renders_like_the_in_memory_order(tmp_path):
+    json_path = tmp_path / "SO_order.json"
+    json_path.write_text(json.dumps(_order(3).to_dict()))
+    path = fill_sales_order_pdf(str(json_path), "sales_order_form_full.pdf", output_folder=str(tmp_path))
+    [text] = _page_texts(path)
+    assert "Nordic Design AB" in text and "SKU-0002" in text and "7.50" in text
+
+
+def test_concurrent_renders_share_one_renderer(tmp_path):
+    renderer = PdfRenderer("sales_order_form_full.pdf")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        paths = list(executor.map(lambda n: renderer.render(_order(20), output_folder=str(tmp_path)), range(8)))
+    assert len(set(paths)) == 8
+    for path in paths:
+        assert "Page 2 of 2 - Page subtotal: 12.50" in _page_texts(path)[1]
@@ -0,0 +1,65 @@
+import glob
+
+import pytest
+
+from config import settings
+from core import metrics
+from core.inventory_manager import build_catalog_index, load_catalog
+from core.llm_extractor import extract_with_rules
+from core.rule_parser import CONFIDENCE_WEIGHTS, parse_order_email
+
+SAMPLES = sorted(glob.glob("test_data/sample_email_*.txt"))
+
+
+def _sample(number):
+    with open(f"test_data/sample_email_{number}.txt", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return build_catalog_index(load_catalog("data/Product Catalog.csv"))
+
+
+def test_every_part_is_needed_to_pass():
+    assert all(weight > 1 - settings.RULE_PARSER_MIN_CONFIDENCE for weight in CONFIDENCE_WEIGHTS.values())
+
+
+@pytest.mark.parametrize("path", SAMPLES)
+def test_samples_are_parsed_without_the_llm(path, catalog):
+    with open(path, encoding="utf-8") as f:
+        order = extract_with_rules(f.read(), catalog)
+    assert order is not None and order["products"] and order["delivery_date"]
+
+
+def test_sample_fields():
+    order, confidence = parse_order_email(_sample(1))
+    assert confidence == 1.0
+    assert order["customer_name"] == "John Smith"
+    assert order["delivery_address"] == "123 Maple Street, Springfield, IL 62704"
+    assert order["delivery_date"] == "June 20, 2025"
+    assert order["products"][0] == {"product_name": "Coffee STRÅDAL 620", "quantity": 9}
+
+
+def test_email_without_a_delivery_date_goes_to_the_llm(catalog):
+    email_body = _sample(2).replace("Requested delivery date: July 1, 2025\n", "")
+    assert parse_order_email(email_body)[1] < settings.RULE_PARSER_MIN_CONFIDENCE
+    assert extract_with_rules(email_body, catalog) is None
+
+
+def test_free_text_quantity_change_goes_to_the_llm(catalog):
+    email_body = _sample(1).replace("Let me know if anything’s out of stock!",
+                                    "Actually, make that 5 instead of 9 for the first one.")
+    assert extract_with_rules(email_body, catalog) is None
+
+
+def test_free_text_naming_a_product_goes_to_the_llm(catalog):
+    email_body = _sample(4).replace("Deadline: June 30, 2025", "Deadline: June 30, 2025\nCould you also add a Sofa VIKTMARK?")
+    assert parse_order_email(email_body)[1] >= settings.RULE_PARSER_MIN_CONFIDENCE # Without the catalog it looks clean
+    assert extract_with_rules(email_body, catalog) is None
+
+
+def test_rule_check_leaves_match_metrics_to_validation(catalog):
+    metrics.reset()
+    assert extract_with_rules(_sample(3), catalog) is not None
+    assert not [name for name in metrics.snapshot()["counters"] if name.startswith(("catalog_matches", "fuzzy_candidates"))]
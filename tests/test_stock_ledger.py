@@ -0,0 +1,108 @@
+import multiprocessing as mp
+import threading
+import time
+
+import pytest
+
+from bench.synthetic import generate_catalog
+from core import pipeline
+from core.decision_engine import release_reservations
+from core.order_store import OrderStore
+from core.output_generator import build_sales_order
+from core.pipeline import OrderPipeline
+from core.stock_ledger import StockLedger
+
+
+def _reserve_units(path, attempts, results):
+    ledger = StockLedger(path)
+    results.put(sum(1 for _ in range(attempts) if ledger.reserve([("DSK-0001", 1, 10)])[0]))
+    ledger.close()
+
+
+def test_processes_sharing_a_ledger_never_oversell(tmp_path):
+    path = str(tmp_path / "stock_ledger.sqlite")
+    StockLedger(path).close()
+    results = mp.Queue()
+    workers = [mp.Process(target=_reserve_units, args=(path, 6, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    reserved = sum(results.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join()
+    assert reserved == 10
+    assert StockLedger(path).reserved("DSK-0001") == 10
+
+
+def test_order_is_reserved_whole_or_not_at_all(tmp_path):
+    ledger = StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+    first, _ = ledger.reserve([("DSK-0001", 3, 5), ("CHR-0001", 2, None)])
+    assert first and ledger.reserved("DSK-0001") == 3
+
+    reservation_id, shortfalls = ledger.reserve([("DSK-0001", 3, 5), ("LMP-0001", 1, 4)])
+    assert reservation_id is None and shortfalls == {"DSK-0001": 2}
+    assert ledger.reserved("LMP-0001") == 0
+
+    assert ledger.release(first) and not ledger.release(first)
+    assert ledger.reserve([("DSK-0001", 5, 5)])[0]
+
+
+def test_reservation_id_makes_a_retry_reserve_once(tmp_path):
+    ledger = StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+    assert ledger.reserve([("DSK-0001", 3, 5)], reservation_id="job-1")[0] == "job-1"
+    assert ledger.reserve([("DSK-0001", 3, 5)], reservation_id="job-1")[0] == "job-1"
+    assert ledger.reserved("DSK-0001") == 3
+
+
+def test_holds_are_only_consumed_by_a_stock_decrement(tmp_path):
+    path = str(tmp_path / "stock_ledger.sqlite")
+    ledger, other_process = StockLedger(path), StockLedger(path)
+    older, _ = ledger.reserve([("DSK-0001", 3, 5)])
+    newer, _ = ledger.reserve([("DSK-0001", 2, 5)])
+
+    change = {"Product_Code": "DSK-0001", "previous_stock": 5, "Available_in_Stock": 2}
+    assert ledger.on_catalog_change([change]) == 3
+    assert other_process.on_catalog_change([change]) == 0 # Every process sees the change; only one consumes
+    assert not ledger.release(older) and ledger.release(newer)
+    assert ledger.reserve([("DSK-0001", 2, 2)])[0]
+
+
+def test_orders_for_different_skus_do_not_wait_on_each_other(tmp_path):
+    ledger = StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+    with ledger._lock_for("DSK-0001"):
+        assert ledger.reserve([("CHR-0001", 1, 5)])[0]
+        waiting = threading.Thread(target=ledger.reserve, args=([("DSK-0001", 1, 5)],))
+        waiting.start()
+        time.sleep(0.1)
+    waiting.join()
+    assert ledger.contention == {"DSK-0001": 1}
+    assert ledger.reserved("DSK-0001") == 1
+
+
+def test_failed_order_releases_its_stock(tmp_path, monkeypatch):
+    catalog_df = generate_catalog(50, seed=2)
+    catalog_df["Available_in_Stock"] = 5
+    catalog_df["Min_Order_Quantity"] = 1
+    ledger = StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+    product = catalog_df.iloc[7]
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(pipeline, "render_sales_order_pdf", fail)
+    with OrderPipeline(catalog_df, write_json=False, stock_ledger=ledger) as order_pipeline:
+        with pytest.raises(OSError):
+            order_pipeline.process_extracted({"customer_name": "Acme AB",
+                                              "products": [{"product_name": product["Product_Name"], "quantity": 4}]})
+    assert ledger.reserved(product["Product_Code"]) == 0
+
+
+def test_rejected_order_releases_its_stock(tmp_path):
+    ledger = StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+    order_store = OrderStore(str(tmp_path / "orders.sqlite"))
+    validated = {"customer_name": "Acme AB", "processed_line_items": [],
+                 "reservation_ids": [ledger.reserve([("DSK-0001", 5, 5)])[0]]}
+    order_id = order_store.append(build_sales_order(validated), validated)
+
+    assert release_reservations(order_store.reject(order_id), ledger) == 1
+    assert ledger.reserved("DSK-0001") == 0
+    assert order_store.count(status="REJECTED") == 1
+    order_store.close()
@@ -1,66 +1,299 @@
+import argparse
+import atexit
+import sys
 import time
-import pandas as pd
 import os
 
-# Import the core logic functions from your existing files
+# --profile-startup has to start timing before the pipeline modules below are imported
+if "--profile-startup" in sys.argv:
+    from core import startup_profile
+    startup_profile.start()
+    atexit.register(startup_profile.report, label="exit")
+
+# Import the core logic functions from your existing files. The LLM client, PyMuPDF,
+# IMAP and multiprocessing are only loaded by the modes and stages that use them.
 from core.llm_extractor import extract_order_details_from_email
-from core.decision_engine import process_and_validate_order
-from core.output_generator import create_sales_order_json
-from core.pdf_writer import fill_sales_order_pdf
+from core.pipeline import OrderPipeline
+from core.catalog_service import CatalogService
+from core.job_queue import JobQueue, extract_jobs, process_job
+from core.order_store import OrderStore
+from core.stock_ledger import StockLedger
+from core.alias_store import AliasStore
+from core.duplicate_detector import DuplicateDetector
+from core.order_revalidator import OrderRevalidator
+from config import settings
 
 # --- CONFIGURATION ---
 PRODUCT_CATALOG_PATH = "data/Product Catalog.csv"
 PDF_TEMPLATE_PATH = "sales_order_form_full.pdf" # Make sure this file is in the root
 OUTPUT_FOLDER = "output"
 
-def load_inventory_data(path: str) -> pd.DataFrame:
-    """Loads the product catalog into a pandas DataFrame."""
+def load_catalog_service(path: str, watch_interval=None):
+    """
+    Loads the typed product catalog and its search index into memory.
+    With `watch_interval`, changes to the catalog file are applied in place while the worker runs.
+    """
     print(f"Loading product catalog from: {path}")
     try:
-        inventory_df = pd.read_csv(path, dtype=str)
+        catalog_service = CatalogService(path, watch_interval=watch_interval, snapshot_dir=settings.CATALOG_SNAPSHOT_DIR)
         print("✅ Product catalog loaded successfully into memory.")
-        return inventory_df
+        return catalog_service
     except FileNotFoundError:
         print(f"❌ CRITICAL ERROR: Product catalog not found at {path}. The worker cannot start.")
         # In a real scenario, you might want to send an alert here.
         return None # type: ignore
 
-def process_single_order(email_content: str, inventory_df: pd.DataFrame):
+def open_order_store():
+    """Opens the indexed order store, or returns None when ORDER_STORE_PATH is empty."""
+    return OrderStore(settings.ORDER_STORE_PATH) if settings.ORDER_STORE_PATH else None
+
+def open_stock_ledger(catalog_service=None):
+    """
+    Opens the shared stock reservation ledger, or returns None when STOCK_LEDGER_PATH is empty.
+    With a CatalogService, holds are consumed as the catalog's stock is decremented.
+    """
+    if not settings.STOCK_LEDGER_PATH:
+        return None
+    stock_ledger = StockLedger(settings.STOCK_LEDGER_PATH)
+    if catalog_service is not None:
+        catalog_service.add_listener(stock_ledger.on_catalog_change)
+    return stock_ledger
+
+def open_alias_store(catalog_service=None):
+    """
+    Opens the learned product alias store, or returns None when ALIAS_STORE_PATH is empty.
+    With a CatalogService, aliases of products that change in the catalog are expired.
+    """
+    if not settings.ALIAS_STORE_PATH:
+        return None
+    alias_store = AliasStore(settings.ALIAS_STORE_PATH)
+    if catalog_service is not None:
+        catalog_service.add_listener(alias_store.expire)
+    return alias_store
+
+def open_duplicate_detector():
+    """Opens the near-duplicate email index, or returns None when DUPLICATE_INDEX_PATH is empty."""
+    if not settings.DUPLICATE_INDEX_PATH:
+        return None
+    return DuplicateDetector(settings.DUPLICATE_INDEX_PATH, threshold=settings.DUPLICATE_THRESHOLD,
+                             window_seconds=settings.DUPLICATE_WINDOW_SECONDS, max_entries=settings.DUPLICATE_MAX_ENTRIES)
+
+def open_order_revalidator(catalog_service, order_store, alias_store=None, stock_ledger=None):
+    """
+    Re-validates stored orders waiting on products that change in the catalog, reserving
+    what they are now validated for in the stock ledger.
+    Returns the listener to remove on shutdown, or None without a CatalogService or order store.
+    """
+    if catalog_service is None or order_store is None:
+        return None
+    revalidator = OrderRevalidator(order_store, catalog_service.index, template_path=PDF_TEMPLATE_PATH,
+                                   alias_store=alias_store, stock_ledger=stock_ledger)
+    catalog_service.add_listener(revalidator.on_catalog_change)
+    return revalidator.on_catalog_change
+
+def process_single_order(email_content: str, inventory_df, pipeline=None, alias_store=None):
     """
     Runs the full end-to-end pipeline for one order email.
+    A long-running caller can pass its own OrderPipeline to reuse it across orders.
     """
+    if pipeline is None:
+        order_store = open_order_store()
+        duplicate_detector = open_duplicate_detector()
+        stock_ledger = open_stock_ledger()
+        with OrderPipeline(inventory_df, template_path=PDF_TEMPLATE_PATH, output_folder=OUTPUT_FOLDER,
+                           order_store=order_store, alias_store=alias_store, stock_ledger=stock_ledger,
+                           duplicate_detector=duplicate_detector) as pipeline:
+            process_single_order(email_content, inventory_df, pipeline)
+        for store in (order_store, duplicate_detector, stock_ledger):
+            if store is not None:
+                store.close()
+        return
+
     print("\n----------------------------------------------------")
-    print("1. Extracting order details with LLM...")
-    extracted_data = extract_order_details_from_email(email_content)
-    
-    if not extracted_data:
-        print("❌ LLM extraction failed. Skipping this order.")
+    entry_id, duplicate = pipeline.register_email(email_content)
+    if duplicate is not None:
+        print(f"🔁 Near-duplicate of an order already processed ({duplicate.similarity:.0%} similar, "
+              f"{duplicate.order_ref.get('pdf_path') or 'output pending'}). Skipping this order.")
         return
 
-    print("2. Validating order against inventory...")
-    validated_order = process_and_validate_order(extracted_data, inventory_df)
+    try:
+        print("1. Extracting order details with LLM...")
+        extracted_data = extract_order_details_from_email(email_content, inventory_df=inventory_df)
+
+        if not extracted_data:
+            print("❌ LLM extraction failed. Skipping this order.")
+            pipeline.forget_email(entry_id)
+            return
 
-    print("3. Generating JSON output file...")
-    json_filepath = create_sales_order_json(validated_order, output_folder=OUTPUT_FOLDER)
+        print("2-4. Validating order, generating PDF (JSON is written in the background)...")
+        result = pipeline.process_extracted(extracted_data)
+    except BaseException:
+        pipeline.forget_email(entry_id) # So a resend of the order is processed instead of skipped
+        raise
+    pipeline.link_result(entry_id, result)
 
-    if not json_filepath:
-        print("❌ Failed to create JSON file. Skipping PDF generation.")
+    if not result.pdf_path:
+        print("❌ Failed to create the PDF sales order form.")
         return
-        
-    print("4. Generating PDF sales order form...")
-    fill_sales_order_pdf(json_filepath, PDF_TEMPLATE_PATH, output_folder=OUTPUT_FOLDER)
     print("✅ Order processing complete.")
     print("----------------------------------------------------\n")
 
 
+def run_daemon(catalog_index, mailbox_factory=None, stop_event=None, alias_store=None, duplicate_detector=None,
+               catalog_service=None):
+    """
+    Persistent mode: keeps the catalog, index and PDF renderer warm and processes
+    new IMAP messages as they arrive instead of once per cron run. With the
+    CatalogService, stored orders are re-validated as the catalog changes.
+    """
+    from core.imap_ingest import ImapIngestor
+
+    ingestor = ImapIngestor(
+        settings.IMAP_SERVER, settings.EMAIL_ACCOUNT, settings.EMAIL_PASSWORD,
+        folder=settings.IMAP_FOLDER,
+        state_path=settings.IMAP_STATE_PATH,
+        batch_size=settings.IMAP_BATCH_SIZE,
+        poll_interval=settings.IMAP_POLL_INTERVAL,
+        use_idle=settings.IMAP_USE_IDLE,
+        mailbox_factory=mailbox_factory,
+        max_attempts=settings.IMAP_MAX_ATTEMPTS
+    )
+    order_store = open_order_store()
+    stock_ledger = open_stock_ledger(catalog_service)
+    revalidate = open_order_revalidator(catalog_service, order_store, alias_store, stock_ledger)
+    with OrderPipeline(catalog_index, template_path=PDF_TEMPLATE_PATH, output_folder=OUTPUT_FOLDER,
+                       order_store=order_store, alias_store=alias_store, stock_ledger=stock_ledger,
+                       duplicate_detector=duplicate_detector) as pipeline:
+        try:
+            ingestor.run_forever(lambda body, message: process_single_order(body, catalog_index, pipeline), stop_event=stop_event)
+        finally:
+            ingestor.close()
+    if revalidate is not None:
+        catalog_service.remove_listener(revalidate)
+    if stock_ledger is not None and catalog_service is not None:
+        catalog_service.remove_listener(stock_ledger.on_catalog_change)
+    for store in (order_store, stock_ledger):
+        if store is not None:
+            store.close()
+
+
+def run_pool(email_paths: list, catalog_index, workers: int):
+    """Pool mode: processes the given email files across `workers` processes sharing one catalog."""
+    from core.worker_pool import run_worker_pool
+
+    email_bodies = []
+    for path in email_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            email_bodies.append(f.read())
+
+    print(f"Pool mode: processing {len(email_bodies)} orders with {workers} workers...")
+    results, stats = run_worker_pool(email_bodies, catalog_index, workers=workers,
+                                     template_path=PDF_TEMPLATE_PATH, output_folder=OUTPUT_FOLDER,
+                                     stock_ledger_path=settings.STOCK_LEDGER_PATH or None,
+                                     order_store_path=settings.ORDER_STORE_PATH or None,
+                                     alias_store_path=settings.ALIAS_STORE_PATH or None,
+                                     duplicate_index_path=settings.DUPLICATE_INDEX_PATH or None,
+                                     duplicate_options={"threshold": settings.DUPLICATE_THRESHOLD,
+                                                        "window_seconds": settings.DUPLICATE_WINDOW_SECONDS,
+                                                        "max_entries": settings.DUPLICATE_MAX_ENTRIES})
+    for path, outcome in zip(email_paths, results):
+        if not outcome["ok"]:
+            print(f"❌ {path}: {outcome['error']}")
+    for pid, worker_stats in stats["workers"].items():
+        print(f"  worker {pid}: {worker_stats['orders']} orders, {worker_stats['errors']} errors, "
+              f"{worker_stats['orders_per_second']:.1f} orders/s")
+    total = stats["total"]
+    print(f"✅ {total['orders'] - total['errors']}/{total['orders']} orders in {total['elapsed_seconds']:.2f}s "
+          f"({total['orders_per_second']:.1f} orders/s)")
+
+
+def run_queue(email_paths: list, catalog_index, alias_store=None, duplicate_detector=None, catalog_service=None):
+    """
+    Queue mode: enqueues the given email files, then works the durable job queue
+    until it is empty. Jobs interrupted by an earlier crash resume from their last
+    completed stage instead of starting over. With the CatalogService, stored
+    orders are re-validated as the catalog changes.
+    """
+    queue = JobQueue(settings.JOB_QUEUE_PATH, lease_seconds=settings.JOB_LEASE_SECONDS,
+                     max_attempts=settings.JOB_MAX_ATTEMPTS)
+    email_bodies = []
+    for path in email_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            email_bodies.append(f.read())
+    if email_bodies:
+        job_ids = queue.enqueue_many(email_bodies)
+        print(f"Queued {len(job_ids)} jobs (IDs {job_ids[0]}-{job_ids[-1]}).")
+
+    order_store = open_order_store()
+    stock_ledger = open_stock_ledger(catalog_service)
+    revalidate = open_order_revalidator(catalog_service, order_store, alias_store, stock_ledger)
+    with OrderPipeline(catalog_index, template_path=PDF_TEMPLATE_PATH, output_folder=OUTPUT_FOLDER,
+                       order_store=order_store, alias_store=alias_store, stock_ledger=stock_ledger,
+                       duplicate_detector=duplicate_detector) as pipeline:
+        try:
+            while True:
+                jobs = queue.claim(limit=10)
+                if not jobs:
+                    break
+                # One batched LLM request for the claimed jobs, instead of one per email
+                extract_jobs(queue, jobs, pipeline)
+                for job in jobs:
+                    resumed = f" (resuming after '{job.stage}')" if job.stage else ""
+                    ok = process_job(queue, job, pipeline)
+                    duplicate = " (near-duplicate of an earlier order)" if job.is_done("duplicate") else ""
+                    print(f"{'✅' if ok else '❌'} Job {job.id}{resumed}{duplicate}")
+        finally:
+            print(f"Queue: {queue.counts()}")
+            queue.close()
+    if revalidate is not None:
+        catalog_service.remove_listener(revalidate)
+    if stock_ledger is not None and catalog_service is not None:
+        catalog_service.remove_listener(stock_ledger.on_catalog_change)
+    for store in (order_store, stock_ledger):
+        if store is not None:
+            store.close()
+
+
 if __name__ == "__main__":
-    # Load the inventory ONCE when the worker starts
-    inventory_df = load_inventory_data(PRODUCT_CATALOG_PATH)
+    parser = argparse.ArgumentParser(description="Order intake worker.")
+    parser.add_argument("--daemon", action="store_true", help="Run persistently, processing new IMAP mail as it arrives.")
+    parser.add_argument("--workers", type=int, default=1, help="Process the given email files across N processes.")
+    parser.add_argument("--queue", action="store_true", help="Queue the given email files and work the durable job queue.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print import and initialization time per module when the worker exits.")
+    parser.add_argument("emails", nargs="*", help="Email files to process in --workers or --queue mode.")
+    args = parser.parse_args()
+
+    # Load the inventory and its search index ONCE when the worker starts. Long-running
+    # modes also watch the catalog file, so stock and price changes apply within seconds.
+    long_running = args.daemon or args.queue
+    catalog_service = load_catalog_service(PRODUCT_CATALOG_PATH,
+                                           watch_interval=settings.CATALOG_WATCH_INTERVAL if long_running else None)
 
-    if inventory_df is None:
+    if catalog_service is None:
         # If the catalog fails to load, stop the worker.
         exit(1)
 
+    catalog_index = catalog_service.index
+    alias_store = open_alias_store(catalog_service)
+
+    if args.daemon:
+        if not (settings.IMAP_SERVER and settings.EMAIL_ACCOUNT and settings.EMAIL_PASSWORD):
+            print("❌ IMAP_SERVER, EMAIL_ACCOUNT and EMAIL_PASSWORD must be set for --daemon mode.")
+            exit(1)
+        run_daemon(catalog_index, alias_store=alias_store, duplicate_detector=open_duplicate_detector(),
+                   catalog_service=catalog_service)
+        exit(0)
+
+    if args.queue:
+        run_queue(args.emails, catalog_index, alias_store=alias_store, duplicate_detector=open_duplicate_detector(),
+                  catalog_service=catalog_service)
+        exit(0)
+
+    if args.workers > 1:
+        run_pool(args.emails or ["test_data/sample_email_2.txt"], catalog_index, args.workers)
+        exit(0)
+
     # In a real system, this loop would connect to an email inbox (IMAP).
     # For now, we simulate processing a new order from a file every 30 seconds.
     # We will use an email from your test_data as an example.
@@ -80,7 +313,7 @@ if __name__ == "__main__":
     # We remove the loop. The script now runs once and exits.
     if test_email_content:
         print("Cron job running: processing one order...")
-        process_single_order(test_email_content, inventory_df)
+        process_single_order(test_email_content, catalog_index, alias_store=alias_store)
     
     print("Cron job finished.")
     # --- END OF CHANGE ---
\ No newline at end of file